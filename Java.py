@@ -1,7 +1,7 @@
 import os
 import argparse
+import asyncio
 import json
-from openai import AzureOpenAI
 
 import logging
 from typing import List, Dict
@@ -12,28 +12,87 @@ import time
 from datetime import datetime
 import subprocess
 
+from llm_engine import LLMEngine, TruncatedResponse, MalformedResponse
+from fix_cache import FixCache
+import git_diff
+import java_chunker
+import sonar
+import discovery
+import batching
+import patching
+import batch_jobs
+import dedup
+import validation
+import archives
+from journal import Journal, journal_path
+from batch_jobs import BatchPending
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Fixes for a file the triage pass found clean
+CLEAN = {"vulnerabilities_found": [], "explanations": []}
+
+
+def with_triage_findings(vulnerability_prompt, issues):
+    """The vulnerability focus plus the issues the triage pass flagged, so the fix request starts from them"""
+    if not issues:
+        return vulnerability_prompt
+    return vulnerability_prompt + "\n\nA first review pass flagged:\n" + "\n".join(f"- {issue}" for issue in issues)
+
 class JavaCodeFixer:
     def __init__(self):
         # Initialize Azure OpenAI client
         # self.git = GitOperations()
         self.branch_name = f"security-fixes-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-        self.client = AzureOpenAI(
-            api_key=os.getenv("AZURE_OPENAI_KEY", "c093c3a427f04210967aed6d3f7e5ba3"),
-            api_version="2023-12-01-preview",
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT", "https://bh-in-openai-glitchslayers.openai.azure.com/")
-        )
+        self.engine = LLMEngine(self.create_async_client)
+        self.cache = FixCache()
+        self.cache.telemetry = self.engine.telemetry
         self.repo_path = os.getenv("REPO_PATH", "C:\\Users\\VMamdyal\\Downloads\\Employee-Payroll-Management-System-master\\Employee-Payroll-Management-System-master")
         # self.repo_path = os.getenv("REPO_PATH", "/c/Users/VMamdyal/Downloads/Employee-Payroll-Management-System-master")  # Default to current directory
         
         self.config = {
             "deployment_name": os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-35-turbo"),
             "temperature": 0.2,
-            "max_tokens": 4000
+            "max_tokens": 4000,
+            # Budget for the single retry after a response is cut off at max_tokens
+            "retry_max_tokens": int(os.getenv("JAVA_RETRY_MAX_TOKENS", "8000")),
+            # "full" regenerates whole files, "patch" asks only for edits and applies them locally
+            "output_mode": os.getenv("JAVA_OUTPUT_MODE", "full"),
+            # Files estimated above this many tokens are fixed chunk by chunk
+            "chunk_tokens": int(os.getenv("JAVA_CHUNK_TOKENS", "1800")),
+            # Files up to small_file_tokens are packed together into one request of up to batch_tokens
+            "small_file_tokens": int(os.getenv("JAVA_SMALL_FILE_TOKENS", "400")),
+            "batch_tokens": int(os.getenv("JAVA_BATCH_TOKENS", "1600")),
+            # Prompt once per group of duplicate files and carry the fix over to the rest
+            "dedup": os.getenv("DEDUP_ENABLED", "1") != "0",
+            # Check each fixed file before it is written and re-request invalid ones once with the diagnostics
+            "validate": os.getenv("VALIDATION_ENABLED", "1") != "0",
+            # Detect-only first pass with a small output budget; only flagged files get the full fix request
+            "triage": os.getenv("TRIAGE_ENABLED", "1") != "0",
+            "triage_deployment": os.getenv("AZURE_OPENAI_TRIAGE_DEPLOYMENT",
+                                           os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-35-turbo")),
+            "triage_max_tokens": int(os.getenv("JAVA_TRIAGE_MAX_TOKENS", "256")),
+            # Larger files skip triage and go straight to the (chunked) fix
+            "triage_max_input_tokens": int(os.getenv("JAVA_TRIAGE_MAX_INPUT_TOKENS", "12000"))
         }
-        self.results = []
+        self.triage_counts = {"clean": 0, "flagged": 0}
+        # Finished files' result entries, on disk; run() points this at a resumable journal
+        self.results = Journal()
+        # archives.ZipSource when fixing a zip archive in place of a directory
+        self.archive = None
+
+    def create_async_client(self, api_version="2023-12-01-preview"):
+        """Build the async Azure OpenAI client used by the execution engine"""
+        # Imported here so --help and non-model code paths don't pay for loading openai
+        from openai import AsyncAzureOpenAI
+        return AsyncAzureOpenAI(
+            api_key=os.getenv("AZURE_OPENAI_KEY", "c093c3a427f04210967aed6d3f7e5ba3"),
+            api_version=api_version,
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT", "https://bh-in-openai-glitchslayers.openai.azure.com/"),
+            # Retries and backoff are handled by the engine's rate controller
+            max_retries=0
+        )
 
     def run_git_command(self, command, cwd=None):
         """Helper function to run git commands in a specific directory"""
@@ -58,13 +117,22 @@ class JavaCodeFixer:
         self.run_git_command(f"git checkout -b {self.branch_name}")
 
     def git_commit_and_push(self):
-        """Commit changes and push to remote"""
-        print("\nCommitting changes...")
-        self.run_git_command("git add .")
-        commit_message = f"Security fixes applied by automated tool\n\nFixed {len([r for r in self.results if r['modified']])} vulnerabilities across {len(set(r['file'] for r in self.results if r['modified']))} files"
-        self.run_git_command(f'git commit -m "{commit_message}"')
+        """Commit the files this run rewrote and push to remote"""
+        # Stage only the rewritten files through the index in-process, instead of a
+        # `git add .` that rehashes the whole tree
+        from git import Repo
+        repo = Repo(self.repo_path, search_parent_directories=True)
+        changed = list(dict.fromkeys(r["file"] for r in self.results if r["modified"]))
+        if not changed:
+            print("\nNo files were changed, nothing to commit")
+            return False
+        print(f"\nCommitting {len(changed)} changed files...")
+        repo.index.add([os.path.relpath(os.path.abspath(path), repo.working_tree_dir) for path in changed])
+        commit_message = f"Security fixes applied by automated tool\n\nFixed {len([r for r in self.results if r['modified']])} vulnerabilities across {len(changed)} files"
+        repo.index.commit(commit_message)
         print("\nPushing changes to remote...")
         self.run_git_command(f"git push origin {self.branch_name}")
+        return True
 
     def create_pull_request(self):
         """Create a pull request using GitHub CLI"""
@@ -94,21 +162,116 @@ class JavaCodeFixer:
             return None
 
     def find_java_files(self, root_dir):
-        """Find all Java files in directory and subdirectories"""
-        java_files = []
-        for root, _, files in os.walk(root_dir):
-            for file in files:
-                if file.endswith(".java"):
-                    java_files.append(os.path.join(root, file))
-        return java_files
+        """Find all Java files in directory and subdirectories, or in the open archive"""
+        if self.archive is not None and root_dir == self.archive.path:
+            return self.archive.find_java_files()
+        return discovery.find_java_files(root_dir)
 
     def read_java_file(self, file_path):
-        """Read Java code directly from file"""
+        """Read Java code directly from file, or from the open archive"""
+        if self.archive is not None and self.archive.owns(file_path):
+            return self.archive.read(file_path)
         with open(file_path, "r") as file:
             return file.read()
 
     def generate_fixes(self, code_content, vulnerability_prompt):
         """Use Azure OpenAI to analyze and fix vulnerabilities"""
+        return self.engine.run_one(lambda: self.agenerate_fixes(code_content, vulnerability_prompt))
+
+    async def agenerate_fixes(self, code_content, vulnerability_prompt, label=None):
+        """Async variant of generate_fixes, run through the shared engine"""
+        if self.config["output_mode"] == "patch":
+            try:
+                return await self.apatch_fixes(code_content, vulnerability_prompt, label=label)
+            except (patching.PatchError, TruncatedResponse, MalformedResponse, json.JSONDecodeError) as e:
+                logger.warning(f"{label or 'request'}: patch mode failed ({e}); falling back to full-file mode")
+        if java_chunker.estimate_tokens(code_content) > self.config["chunk_tokens"]:
+            return await self.agenerate_chunked_fixes(code_content, vulnerability_prompt, label=label)
+        return await self.arequest_fixes(code_content, vulnerability_prompt, label=label)
+
+    async def arequest_fixes(self, code_content, vulnerability_prompt, context=None, label=None):
+        """Request fixes, retrying once early if the streamed response is truncated or malformed"""
+        try:
+            return await self.asend_fix_request(code_content, vulnerability_prompt, context, label=label)
+        except TruncatedResponse as e:
+            smaller = self.config["chunk_tokens"] // 2
+            if context is None and len(java_chunker.chunk_java(code_content, smaller)) > 1:
+                logger.warning(f"{label or 'request'}: {e}; retrying in chunks of {smaller} tokens")
+                return await self.agenerate_chunked_fixes(code_content, vulnerability_prompt, smaller, label=label)
+            logger.warning(f"{label or 'request'}: {e}; retrying with max_tokens={self.config['retry_max_tokens']}")
+            return await self.asend_fix_request(
+                code_content, vulnerability_prompt, context,
+                max_tokens=self.config["retry_max_tokens"], label=label
+            )
+        except (MalformedResponse, json.JSONDecodeError) as e:
+            logger.warning(f"{label or 'request'}: invalid JSON response ({e}); retrying once")
+            return await self.asend_fix_request(code_content, vulnerability_prompt, context, label=label)
+
+    async def atriage(self, files, vulnerability_prompt, label=None):
+        """Detect-only pass over files (path -> code); returns path -> (flagged, issues)"""
+        system_prompt = """You are a Java security reviewer. Decide for each of the provided Java files whether 
+        it has vulnerabilities or security issues. Do not fix or rewrite any code.
+        
+        Required output format (JSON), with one entry per input file keyed by its exact path:
+        {
+            "path/to/File.java": {
+                "vulnerable": true,
+                "issues": ["short description of each issue and the line it is on"]
+            }
+        }"""
+
+        sections = "\n\n".join(f"=== File: {path} ===\n{code}" for path, code in files.items())
+        user_prompt = f"""Vulnerability focus: {vulnerability_prompt}
+        
+        Java files to triage:
+        {sections}"""
+
+        max_tokens = self.config["triage_max_tokens"] * len(files)
+        cache_key = FixCache.make_key(
+            "java-triage", system_prompt, user_prompt,
+            self.config["triage_deployment"], self.config["temperature"], max_tokens
+        )
+        by_path = self.cache.get(cache_key)
+        if by_path is None:
+            try:
+                response = await self.engine.chat(
+                    label=f"{label or 'files'} (triage)",
+                    model=self.config["triage_deployment"],
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    temperature=self.config["temperature"],
+                    max_tokens=max_tokens,
+                    response_format={"type": "json_object"}
+                )
+                by_path = json.loads(response.choices[0].message.content)
+            except (TruncatedResponse, MalformedResponse, json.JSONDecodeError) as e:
+                # An unusable verdict must not hide a vulnerable file; send everything to the fix pass
+                logger.warning(f"{label or 'files'}: triage failed ({e}); fixing without it")
+                by_path = {}
+            else:
+                self.cache.put(cache_key, by_path)
+
+        verdicts = {}
+        for path in files:
+            verdict = by_path.get(path) if isinstance(by_path, dict) else None
+            if not isinstance(verdict, dict):
+                verdicts[path] = (True, [])
+                continue
+            issues = [str(issue) for issue in verdict.get("issues") or []]
+            verdicts[path] = (bool(verdict.get("vulnerable", True)), issues)
+        for flagged, _ in verdicts.values():
+            self.triage_counts["flagged" if flagged else "clean"] += 1
+        return verdicts
+
+    def triaged(self, code_content):
+        """True when a file goes through the triage pass before its fix request"""
+        return self.config["triage"] and java_chunker.estimate_tokens(code_content) <= self.config["triage_max_input_tokens"]
+
+    async def asend_fix_request(self, code_content, vulnerability_prompt, context=None, max_tokens=None, label=None):
+        """Send one fix request for a whole file, or for a fragment when context is given"""
+        max_tokens = max_tokens or self.config["max_tokens"]
         system_prompt = """You are a senior Java security engineer. Analyze the provided Java code for 
         vulnerabilities and security issues. Provide fixed code with explanations of changes made.
         
@@ -125,7 +288,151 @@ class JavaCodeFixer:
         Java code to analyze:
         {code_content}"""
 
-        response = self.client.chat.completions.create(
+        if context is not None:
+            system_prompt += """
+        
+        The code is one fragment of a larger Java file, cut at class or method boundaries.
+        Return in "fixed_code" only the fixed fragment, starting and ending at the same
+        declarations as the input. If a fix needs new imports, list the full import
+        statements in an extra "required_imports" array instead of adding them to the fragment."""
+            user_prompt = f"""Vulnerability focus: {vulnerability_prompt}
+        
+        File header for context (do not return it):
+        {context}
+        
+        Java fragment to analyze:
+        {code_content}"""
+
+        cache_key = FixCache.make_key(
+            "java", code_content, system_prompt, user_prompt,
+            self.config["deployment_name"], self.config["temperature"], max_tokens
+        )
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        response = await self.engine.chat(
+            label=label,
+            model=self.config["deployment_name"],
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=self.config["temperature"],
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"}
+        )
+
+        fixes = json.loads(response.choices[0].message.content)
+        self.cache.put(cache_key, fixes)
+        return fixes
+
+    async def apatch_fixes(self, code_content, vulnerability_prompt, label=None):
+        """Ask only for edits and apply them locally, so output size follows the size of the fix"""
+        system_prompt = """You are a senior Java security engineer. Analyze the provided Java code for 
+        vulnerabilities and security issues. Fix them with minimal edits and explain each change.
+        
+        Required output format (JSON):
+        {
+            "vulnerabilities_found": ["list", "of", "vulnerabilities"],
+            "edits": [{"original": "string", "replacement": "string"}],
+            "explanations": ["list", "of", "explanations"]
+        }""" + patching.PATCH_INSTRUCTIONS
+
+        user_prompt = f"""Vulnerability focus: {vulnerability_prompt}
+        
+        Java code to analyze:
+        {code_content}"""
+
+        cache_key = FixCache.make_key(
+            "java-patch", code_content, system_prompt, user_prompt,
+            self.config["deployment_name"], self.config["temperature"], self.config["max_tokens"]
+        )
+        patch = self.cache.get(cache_key)
+        if patch is None:
+            response = await self.engine.chat(
+                label=label,
+                model=self.config["deployment_name"],
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=self.config["temperature"],
+                max_tokens=self.config["max_tokens"],
+                response_format={"type": "json_object"}
+            )
+            patch = json.loads(response.choices[0].message.content)
+            self.cache.put(cache_key, patch)
+
+        vulnerabilities = patch.get("vulnerabilities_found", [])
+        fixed_code = patching.apply_patch_response(code_content, patch) if vulnerabilities else code_content
+        return {
+            "original_code": code_content,
+            "vulnerabilities_found": vulnerabilities,
+            "fixed_code": fixed_code,
+            "explanations": patch.get("explanations", [])
+        }
+
+    async def agenerate_chunked_fixes(self, code_content, vulnerability_prompt, chunk_tokens=None, label=None):
+        """Fix a large file chunk by chunk in parallel and reassemble the result"""
+        chunks = java_chunker.chunk_java(code_content, chunk_tokens or self.config["chunk_tokens"])
+        if len(chunks) == 1:
+            return await self.arequest_fixes(code_content, vulnerability_prompt, label=label)
+
+        context = java_chunker.file_context(code_content)
+        logger.info(f"Splitting {java_chunker.estimate_tokens(code_content)}-token file into {len(chunks)} chunks")
+        chunk_fixes = await asyncio.gather(*(
+            self.arequest_fixes(chunk, vulnerability_prompt, context=context, label=f"{label or 'file'} chunk {i}")
+            for i, chunk in enumerate(chunks, 1)
+        ))
+
+        fixed_parts = []
+        vulnerabilities = []
+        explanations = []
+        imports = []
+        for chunk, fixes in zip(chunks, chunk_fixes):
+            fixed_parts.append(self.fixed_fragment(chunk, fixes))
+            vulnerabilities.extend(fixes.get("vulnerabilities_found", []))
+            explanations.extend(fixes.get("explanations", []))
+            imports.extend(fixes.get("required_imports", []))
+
+        return {
+            "original_code": code_content,
+            "vulnerabilities_found": vulnerabilities,
+            "fixed_code": java_chunker.merge_imports("".join(fixed_parts), imports),
+            "explanations": explanations
+        }
+
+    async def arequest_batch_fixes(self, files, vulnerability_prompt):
+        """Fix several small files in one request; files maps path to code, returns path to fixes"""
+        system_prompt = """You are a senior Java security engineer. Analyze each of the provided Java files for 
+        vulnerabilities and security issues. Provide fixed code with explanations of changes made.
+        
+        Required output format (JSON), with one entry per input file keyed by its exact path:
+        {
+            "path/to/File.java": {
+                "vulnerabilities_found": ["list", "of", "vulnerabilities"],
+                "fixed_code": "string (complete fixed file, empty if nothing changed)",
+                "explanations": ["list", "of", "explanations"]
+            }
+        }"""
+
+        sections = "\n\n".join(f"=== File: {path} ===\n{code}" for path, code in files.items())
+        user_prompt = f"""Vulnerability focus: {vulnerability_prompt}
+        
+        Java files to analyze:
+        {sections}"""
+
+        cache_key = FixCache.make_key(
+            "java-batch", system_prompt, user_prompt,
+            self.config["deployment_name"], self.config["temperature"], self.config["max_tokens"]
+        )
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        response = await self.engine.chat(
+            label=f"batch of {len(files)} files",
             model=self.config["deployment_name"],
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -136,47 +443,330 @@ class JavaCodeFixer:
             response_format={"type": "json_object"}
         )
 
-        return json.loads(response.choices[0].message.content)
+        by_path = json.loads(response.choices[0].message.content)
+        self.cache.put(cache_key, by_path)
+        return by_path
+
+    def fixed_fragment(self, fragment, fixes):
+        """Fixed text for a fragment, keeping its surrounding whitespace so pieces join cleanly"""
+        if not (fixes.get("vulnerabilities_found") and fixes.get("fixed_code")):
+            return fragment
+        leading = fragment[:len(fragment) - len(fragment.lstrip())]
+        trailing = fragment[len(fragment.rstrip()):]
+        return leading + fixes["fixed_code"].strip() + trailing
+
+    async def aprocess_sonar_file(self, file_path, issues):
+        """Fix only the regions of a file flagged by SonarQube and splice them back"""
+        original_code = self.read_java_file(file_path)
+        regions = sonar.issue_regions(original_code, issues, max_tokens=self.config["chunk_tokens"])
+        context = java_chunker.file_context(original_code)
+
+        async def fix_region(start, end, region_issues, problems=None):
+            first_line = original_code.count("\n", 0, start) + 1
+            prompt = sonar.issue_prompt(region_issues, first_line)
+            return await self.arequest_fixes(
+                original_code[start:end],
+                validation.retry_prompt(prompt, problems, "only the fixed fragment") if problems else prompt,
+                context=context,
+                label=f"{file_path}:{first_line}" + (" (retry)" if problems else "")
+            )
+
+        problems = None
+        for attempt in (1, 2):
+            region_fixes = await asyncio.gather(*(fix_region(*region, problems) for region in regions))
+
+            replacements = []
+            vulnerabilities = []
+            explanations = []
+            imports = []
+            for (start, end, _), fixes in zip(regions, region_fixes):
+                replacements.append((start, end, self.fixed_fragment(original_code[start:end], fixes)))
+                vulnerabilities.extend(fixes.get("vulnerabilities_found", []))
+                explanations.extend(fixes.get("explanations", []))
+                imports.extend(fixes.get("required_imports", []))
+            if not vulnerabilities:
+                break
+            fixed_code = java_chunker.merge_imports(sonar.splice(original_code, replacements), imports)
+            if not self.config["validate"]:
+                break
+            problems = await validation.arun(validation.check_java, fixed_code, original_code)
+            if not problems:
+                break
+            if attempt == 2:
+                raise validation.ValidationError(problems)
+            logger.warning(f"{file_path}: fix rejected by validation ({'; '.join(problems)}); retrying with diagnostics")
+
+        modified = False
+        if vulnerabilities:
+            modified = self.update_file(file_path, fixed_code)
+
+        return {
+            "file": file_path,
+            "vulnerabilities_found": vulnerabilities,
+            "explanations": explanations,
+            "modified": modified
+        }
+
+    def process_sonar_report(self, root_dir, report_path):
+        """Fix the files and line ranges listed in a SonarQube report"""
+        issues = sonar.load_issues(report_path)
+        by_file = sonar.group_by_file(issues, root_dir, self.find_java_files(root_dir))
+        print(f"Found {len(issues)} open Sonar issues in {len(by_file)} files")
+
+        files = [path for path in by_file if not (self.results.resumed and self.results.finished(path))]
+        if len(files) < len(by_file):
+            print(f"Resuming: skipping {len(by_file) - len(files)} files finished by an earlier run")
+
+        async def fix(path):
+            # Journaled as soon as the file is written, so an interrupted run resumes after it
+            self.results.append(await self.aprocess_sonar_file(path, by_file[path]))
+
+        jobs = [(lambda path=path: fix(path)) for path in files]
+        for file_path, result in zip(files, self.engine.run(jobs)):
+            if isinstance(result, Exception):
+                print(f"Error processing {file_path}: {str(result)}")
+
+        return self.results
 
     def update_file(self, file_path, fixed_code):
-        """Update the original file with fixes"""
+        """Update the original file with fixes; returns False when that would not change it"""
+        # Line endings and trailing whitespace are not a fix; skipping them keeps the file out of the commit
+        def lines(code):
+            return [line.rstrip() for line in code.strip("\r\n").splitlines()]
+
+        if lines(fixed_code) == lines(self.read_java_file(file_path)):
+            return False
+        if self.archive is not None and self.archive.owns(file_path):
+            self.archive.write(file_path, fixed_code)
+            return True
         with open(file_path, "w") as file:
             file.write(fixed_code)
+        return True
+
+    def apply_fixes(self, file_path, fixes):
+        """Write fixes to file_path when vulnerabilities were found and build its result entry"""
+        # Only update if vulnerabilities were found
+        modified = False
+        if fixes["vulnerabilities_found"]:
+            modified = self.update_file(file_path, fixes["fixed_code"])
+
+        return {
+            "file": file_path,
+            "vulnerabilities_found": fixes["vulnerabilities_found"],
+            "explanations": fixes["explanations"],
+            "modified": modified
+        }
+
+    async def avalidate_fixes(self, file_path, original_code, fixes, vulnerability_prompt):
+        """Check fixed_code in the validation pool; re-request an invalid fix once with the diagnostics.
+
+        Raises validation.ValidationError when the retried fix is still invalid.
+        """
+        if not (self.config["validate"] and fixes.get("vulnerabilities_found") and fixes.get("fixed_code")):
+            return fixes
+        problems = await validation.arun(validation.check_java, fixes["fixed_code"], original_code)
+        if not problems:
+            return fixes
+        logger.warning(f"{file_path}: fix rejected by validation ({'; '.join(problems)}); retrying with diagnostics")
+        # Say what the retried request returns: edits, fragments of a chunked file or the whole file
+        if self.config["output_mode"] == "patch":
+            expected = "only the edits"
+        elif java_chunker.estimate_tokens(original_code) > self.config["chunk_tokens"]:
+            expected = "only the fixed fragment"
+        else:
+            expected = "the complete fixed file"
+        prompt = validation.retry_prompt(vulnerability_prompt, problems, expected)
+        fixes = await self.agenerate_fixes(original_code, prompt, label=f"{file_path} (retry)")
+        if fixes.get("vulnerabilities_found") and fixes.get("fixed_code"):
+            problems = await validation.arun(validation.check_java, fixes["fixed_code"], original_code)
+            if problems:
+                raise validation.ValidationError(problems)
+        return fixes
+
+    async def aprocess_file(self, file_path, vulnerability_prompt):
+        """Read, fix and update a single Java file; returns its result entry"""
+        # Read original code
+        original_code = self.read_java_file(file_path)
+
+        # Only files the cheap first pass flags get the full fix request
+        if self.triaged(original_code):
+            flagged, issues = (await self.atriage({file_path: original_code}, vulnerability_prompt, label=file_path))[file_path]
+            if not flagged:
+                return self.apply_fixes(file_path, CLEAN)
+            vulnerability_prompt = with_triage_findings(vulnerability_prompt, issues)
+
+        # Generate fixes
+        fixes = await self.agenerate_fixes(original_code, vulnerability_prompt, label=file_path)
+        fixes = await self.avalidate_fixes(file_path, original_code, fixes, vulnerability_prompt)
+
+        return self.apply_fixes(file_path, fixes)
+
+    async def aprocess_batch(self, file_paths, vulnerability_prompt):
+        """Fix a batch of small files with one request; returns their result entries in order"""
+        files = {path: self.read_java_file(path) for path in file_paths}
+        clean = set()
+        if self.config["triage"]:
+            verdicts = await self.atriage(files, vulnerability_prompt, label=f"batch of {len(files)} files")
+            clean = {path for path, (flagged, _) in verdicts.items() if not flagged}
+            files = {path: code for path, code in files.items() if path not in clean}
+            vulnerability_prompt = with_triage_findings(
+                vulnerability_prompt, [f"{path}: {issue}" for path in files for issue in verdicts[path][1]]
+            )
+        by_path = {}
+        if files:
+            try:
+                by_path = await self.arequest_batch_fixes(files, vulnerability_prompt)
+            except BatchPending:
+                raise
+            except Exception as e:
+                logger.warning(f"Batch of {len(files)} files failed ({e}), retrying files individually")
+
+        async def fix_one(path):
+            if path in clean:
+                return self.apply_fixes(path, CLEAN)
+            fixes = by_path.get(path)
+            valid = isinstance(fixes, dict) and "vulnerabilities_found" in fixes
+            if valid and fixes["vulnerabilities_found"] and not fixes.get("fixed_code"):
+                valid = False
+            if not valid:
+                # Missing or malformed entry: fall back to a dedicated request
+                fixes = await self.arequest_fixes(files[path], vulnerability_prompt, label=path)
+            fixes.setdefault("explanations", [])
+            try:
+                fixes = await self.avalidate_fixes(path, files[path], fixes, vulnerability_prompt)
+            except validation.ValidationError as e:
+                # Leave the file out of the batch's results, like a failed request
+                print(f"Error processing {path}: fix rejected by validation: {e}")
+                return None
+            return self.apply_fixes(path, fixes)
+
+        results = await asyncio.gather(*(fix_one(path) for path in file_paths))
+        return [result for result in results if result is not None]
 
     def process_file(self, file_path, vulnerability_prompt):
         """Complete processing pipeline for a Java file"""
         try:
-            # Read original code
-            original_code = self.read_java_file(file_path)
-            
-            # Generate fixes
-            fixes = self.generate_fixes(original_code, vulnerability_prompt)
-            
-            # Only update if vulnerabilities were found
-            if fixes["vulnerabilities_found"]:
-                self.update_file(file_path, fixes["fixed_code"])
-            
-            result = {
-                "file": file_path,
-                "vulnerabilities_found": fixes["vulnerabilities_found"],
-                "explanations": fixes["explanations"],
-                "modified": bool(fixes["vulnerabilities_found"])
-            }
+            result = self.engine.run_one(lambda: self.aprocess_file(file_path, vulnerability_prompt))
             self.results.append(result)
             return result
         except Exception as e:
             print(f"Error processing {file_path}: {str(e)}")
             return None
 
-    def process_directory(self, root_dir, vulnerability_prompt):
-        """Process all Java files in a directory"""
-        java_files = self.find_java_files(root_dir)
+    def process_directory(self, root_dir, vulnerability_prompt, java_files=None):
+        """Process all Java files in a directory, or only the given subset"""
+        if java_files is None:
+            java_files = self.find_java_files(root_dir)
         print(f"Found {len(java_files)} Java files to analyze")
-        
-        for i, java_file in enumerate(java_files, 1):
-            print(f"\nProcessing file {i}/{len(java_files)}: {java_file}")
-            self.process_file(java_file, vulnerability_prompt)
-        
+        if self.results.resumed:
+            finished = {path for path in java_files if self.results.finished(path)}
+            if finished:
+                print(f"Resuming: skipping {len(finished)} files finished by an earlier run")
+                java_files = [path for path in java_files if path not in finished]
+
+        groups = {}
+        originals = {}
+        if self.config["dedup"] and len(java_files) > 1:
+            originals = {path: self.read_java_file(path) for path in java_files}
+            groups = dedup.group_duplicates(originals)
+        duplicates = {member for members in groups.values() for member, _ in members}
+        if duplicates:
+            print(f"Found {len(duplicates)} duplicate files in {len(groups)} groups; prompting once per group")
+
+        finished, pending = self.fix_files([path for path in java_files if path not in duplicates],
+                                           vulnerability_prompt)
+        retry = []
+        for leader, members in groups.items():
+            if leader in pending:
+                continue
+            leader_result = self.results.get(leader) if leader in finished else None
+            for member, exact in members:
+                result = self.apply_duplicate_fix(leader_result, originals, member, exact)
+                if result is None:
+                    retry.append(member)
+                else:
+                    self.results.append(result)
+        if retry:
+            print(f"Prompting {len(retry)} duplicate files individually (clean leader or fix did not carry over)")
+            self.fix_files(retry, vulnerability_prompt)
+        return self.results
+
+    def apply_duplicate_fix(self, leader_result, originals, member, exact):
+        """Result entry for a duplicate file from its group leader's, or None if it needs its own request"""
+        if leader_result is None or not leader_result["modified"]:
+            # A clean leader says nothing about the member, which may call other APIs; let triage decide
+            return None
+        leader = leader_result["file"]
+        try:
+            fixed_code = dedup.transfer_fix(originals[leader], self.read_java_file(leader), originals[member],
+                                            "java", exact)
+        except patching.PatchError as e:
+            logger.info(f"{member}: fix from {leader} does not apply ({e})")
+            return None
+        problems = validation.check_java(fixed_code, originals[member]) if self.config["validate"] else []
+        if problems:
+            logger.info(f"{member}: fix from {leader} is not valid here ({'; '.join(problems)})")
+            return None
+        modified = self.update_file(member, fixed_code)
+        return dict(leader_result, file=member, duplicate_of=leader, modified=modified)
+
+    def fix_files(self, java_files, vulnerability_prompt):
+        """Send java_files to the model, journaling each file's result as soon as its unit is done.
+
+        Returns (paths finished, paths queued for a batch job).
+        """
+        # Patch responses are already small, so batching only applies to full-file mode
+        small_file_tokens = self.config["small_file_tokens"] if self.config["output_mode"] == "full" else 0
+        size_of = self.archive.size if self.archive is not None else os.path.getsize
+        singles, batches = batching.pack_small_files(java_files, small_file_tokens, self.config["batch_tokens"],
+                                                     size_of=size_of)
+        units = [[path] for path in singles] + batches
+        if batches:
+            print(f"Packed {sum(len(b) for b in batches)} small files into {len(batches)} batched requests")
+
+        finished = set()
+        pending = set()
+
+        def on_done(index, completed, total, result):
+            unit = units[index]
+            status = "queued" if isinstance(result, BatchPending) else "failed" if isinstance(result, Exception) else "done"
+            label = unit[0] if len(unit) == 1 else f"batch of {len(unit)} files"
+            print(f"[{completed}/{total}] {status}: {label}")
+            if isinstance(result, BatchPending):
+                pending.update(unit)
+            elif isinstance(result, Exception):
+                for java_file in unit:
+                    print(f"Error processing {java_file}: {str(result)}")
+            else:
+                finished.update(result)
+
+        async def run_unit(unit):
+            if len(unit) == 1:
+                results = [await self.aprocess_file(unit[0], vulnerability_prompt)]
+            else:
+                results = await self.aprocess_batch(unit, vulnerability_prompt)
+            # Journal the files this unit rewrote right away, so an interrupted run never fixes them twice
+            self.results.extend(results)
+            return [result["file"] for result in results]
+
+        self.engine.run([(lambda unit=unit: run_unit(unit)) for unit in units], on_done=on_done)
+        return finished, pending
+
+    def process_directory_in_batches(self, root_dir, vulnerability_prompt, batch_dir, java_files=None, local=False):
+        """Like process_directory, but send the requests as Azure OpenAI batch jobs"""
+        if java_files is None:
+            java_files = self.find_java_files(root_dir)
+        session = batch_jobs.BatchSession(
+            batch_dir, lambda: self.create_async_client(batch_jobs.BATCH_API_VERSION), local=local
+        )
+
+        def process(files):
+            self.process_directory(root_dir, vulnerability_prompt, files)
+            return {path for path in files if self.results.finished(path)}
+
+        remaining = batch_jobs.run_batched(self.engine, session, process, java_files)
+        for java_file in remaining:
+            print(f"Error processing {java_file}: no batch result")
         return self.results
 
     # def _apply_fixes(self):
@@ -197,18 +787,50 @@ class JavaCodeFixer:
     #                         body="This pull request fixes vulnerabilities identified by SonarQube."
     #                     )
 
-def main():
-    parser = argparse.ArgumentParser(description="Java Source Code Vulnerability Fixer using Azure OpenAI")
-    parser.add_argument("root_dir", help="Root directory containing Java files (e.g., src/main/java)", 
+def build_parser(parser=None):
+    """Add the Java fixer options to parser (a new one by default)"""
+    parser = parser or argparse.ArgumentParser(description="Java Source Code Vulnerability Fixer using Azure OpenAI")
+    parser.add_argument("root_dir", help="Root directory containing Java files (e.g., src/main/java), or a .zip archive", 
                        default="src/main/java", nargs="?")
     parser.add_argument("--prompt", help="Specific vulnerability prompt", default="")
     parser.add_argument("--dry-run", help="Analyze only without modifying files", 
                        action="store_true")
-    
-    args = parser.parse_args()
-    
-    # Default vulnerability prompt if none provided
-    default_prompt = """Check for common Java vulnerabilities including:
+    parser.add_argument("--no-cache", help="Ignore the on-disk fix cache and always call the model",
+                       action="store_true")
+    parser.add_argument("--sonar-report", metavar="PATH", default=None,
+                       help="Fix only the issues listed in a SonarQube JSON report (e.g. sonar_scan_report.json)")
+    parser.add_argument("--since", metavar="REF", default=None,
+                       help="Only scan .java files added or modified since REF; 'auto' uses the last scanned commit")
+    parser.add_argument("--no-batching", help="Send every file in its own request instead of packing small files",
+                       action="store_true")
+    parser.add_argument("--patch-mode", help="Ask the model for edits instead of whole files and apply them locally",
+                       action="store_true")
+    parser.add_argument("--no-dedup", help="Prompt for every duplicate file instead of once per group",
+                       action="store_true")
+    parser.add_argument("--no-validate", help="Write fixes without checking that the fixed files still parse",
+                       action="store_true")
+    parser.add_argument("--no-triage", help="Send every file to the full fix request instead of only those "
+                       "a detect-only first pass flags", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=None,
+                       help="Maximum number of in-flight Azure OpenAI requests (default: $LLM_CONCURRENCY or 8)")
+    parser.add_argument("--metrics-dir", metavar="DIR", default=None,
+                       help="Write a per-call JSONL trace and a Prometheus textfile here (default: $LLM_METRICS_DIR)")
+    parser.add_argument("--batch-dir", metavar="DIR", default=None,
+                       help="Send requests as Azure OpenAI batch jobs, keeping the JSONL input/output files in DIR")
+    parser.add_argument("--batch-local", action="store_true",
+                       help="With --batch-dir, answer batch files locally with canned fixes instead of submitting them")
+    parser.add_argument("--resume", action="store_true",
+                       help="Continue an interrupted run, skipping files its journal records as finished and unchanged")
+    parser.add_argument("--journal", metavar="PATH", default=None,
+                       help="Journal of finished files (default: one per root directory under ~/.cache/glitchslayers)")
+    parser.add_argument("--archive-out", metavar="PATH", default=None,
+                       help="When root_dir is a .zip, write the fixed archive here, or only the fixed files "
+                            "when PATH is a directory (default: <archive>-fixed.zip)")
+    return parser
+
+
+# Default vulnerability prompt if none provided
+DEFAULT_PROMPT = """Check for common Java vulnerabilities including:
     1. SQL injection risks
     2. XSS vulnerabilities
     3. Insecure deserialization
@@ -219,12 +841,74 @@ def main():
     8. Insecure file handling
     9. XXE vulnerabilities
     10. Security misconfigurations"""
-    
+
+
+def run(args):
+    """Fix the Java files selected by args and print the summary report; returns the per-file results"""
     fixer = JavaCodeFixer()
-    results = fixer.process_directory(args.root_dir, args.prompt or default_prompt)
+    if args.concurrency:
+        fixer.engine.concurrency = args.concurrency
+    if args.no_cache:
+        fixer.cache.enabled = False
+    if args.metrics_dir:
+        fixer.engine.telemetry.metrics_dir = args.metrics_dir
+    if args.patch_mode:
+        fixer.config["output_mode"] = "patch"
+    if args.no_batching:
+        fixer.config["small_file_tokens"] = 0
+    if args.no_dedup:
+        fixer.config["dedup"] = False
+    if args.no_validate:
+        fixer.config["validate"] = False
+    if args.no_triage:
+        fixer.config["triage"] = False
+    root, hasher = args.root_dir, None
+    if archives.is_archive(args.root_dir):
+        # Members are read from the archive and the fixes written to a new one at the end
+        fixer.archive = archives.ZipSource(args.root_dir)
+        root, hasher = fixer.archive.root, fixer.archive.hash
+        if args.since:
+            print("--since needs a git checkout; scanning the whole archive")
+            args.since = None
+    # Each finished file is journaled as it completes, so an interrupted run can be resumed
+    fixer.results = Journal(args.journal or journal_path(os.path.abspath(args.root_dir), "java"),
+                            root=root, resume=args.resume, hasher=hasher)
+    if fixer.results.resumed:
+        print(f"Resuming from {fixer.results.path} ({fixer.results.resumed} files already recorded)")
+    with validation.session():
+        if args.sonar_report:
+            results = fixer.process_sonar_report(args.root_dir, args.sonar_report)
+        else:
+            java_files = None
+            if args.since:
+                java_files = git_diff.changed_files(args.root_dir, args.since, git_diff.JAVA_EXTENSIONS, "java")
+                if java_files is None:
+                    print("No previous scan recorded, falling back to a full scan")
+                else:
+                    java_files = discovery.filter_changed(java_files, args.root_dir)
+            if args.batch_dir:
+                results = fixer.process_directory_in_batches(args.root_dir, args.prompt or DEFAULT_PROMPT, args.batch_dir,
+                                                             java_files, local=args.batch_local)
+            else:
+                results = fixer.process_directory(args.root_dir, args.prompt or DEFAULT_PROMPT, java_files)
+            if args.since == "auto":
+                # Files that failed or are still queued are not journaled; keep them in the next scan
+                selected = java_files if java_files is not None else fixer.find_java_files(args.root_dir)
+                unfinished = [path for path in selected if not fixer.results.finished(path)]
+                if unfinished:
+                    print(f"{len(unfinished)} files did not finish; not recording the scanned commit")
+                else:
+                    git_diff.record_scanned_commit(args.root_dir, "java")
     
     print("\n\n=== Summary Report ===")
     print(f"Processed {len(results)} files")
+    print(f"Cache hits: {fixer.cache.hits}, misses: {fixer.cache.misses}")
+    triaged = sum(fixer.triage_counts.values())
+    if triaged:
+        print(f"Triage: {fixer.triage_counts['flagged']} of {triaged} files flagged for a full fix")
+    for line in fixer.engine.telemetry.summary_lines():
+        print(line)
+    fixer.engine.telemetry.close()
     
     modified_files = sum(1 for r in results if r["modified"])
     total_vulnerabilities = sum(len(r["vulnerabilities_found"]) for r in results if r["modified"])
@@ -234,6 +918,10 @@ def main():
     
     if args.dry_run:
         print("\nDRY RUN: No files were actually modified")
+    elif fixer.archive is not None and fixer.archive.fixed:
+        output = args.archive_out or archives.default_output(args.root_dir)
+        written = fixer.archive.save(output)
+        print(f"Wrote {written} fixed files to {output}")
     
     print("\nModified Files Details:")
     for result in results:
@@ -243,11 +931,26 @@ def main():
             for i, (vuln, explanation) in enumerate(zip(result["vulnerabilities_found"], result["explanations"]), 1):
                 print(f" {i}. {vuln}")
                 print(f" Explanation: {explanation}")
+    return results
 
 
-if __name__ == "__main__":
-    main()
+def publish_changes(results):
+    """Commit the files changed in results on a new branch, push it and open a pull request"""
     ob = JavaCodeFixer()
+    ob.results = results
     ob.setup_git_branch()
-    ob.git_commit_and_push()
-    ob.create_pull_request()
\ No newline at end of file
+    if ob.git_commit_and_push():
+        ob.create_pull_request()
+
+
+def main():
+    args = build_parser().parse_args()
+    results = run(args)
+    # Fixes to an archive go to the output archive rather than to a branch
+    return None if archives.is_archive(args.root_dir) else results
+
+
+if __name__ == "__main__":
+    results = main()
+    if results is not None:
+        publish_changes(results)
\ No newline at end of file
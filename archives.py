@@ -0,0 +1,140 @@
+import os
+import copy
+import shutil
+import hashlib
+import zipfile
+
+import discovery
+
+# Source layer for codebases delivered as zip archives. Members are listed and read straight
+# from the archive and fixed members are kept in memory, then written to a new archive or an
+# overlay directory; nothing is extracted. Members are addressed as "<archive>!/<member>".
+
+SEPARATOR = "!/"
+
+
+def is_archive(path):
+    """True when path is a zip archive the fixers can read in place"""
+    return bool(path) and path.lower().endswith(".zip") and os.path.isfile(path) and zipfile.is_zipfile(path)
+
+
+def default_output(archive_path):
+    base, ext = os.path.splitext(archive_path)
+    return f"{base}-fixed{ext}"
+
+
+class ZipSource:
+    def __init__(self, path):
+        """Open the zip archive at path for reading; fixes are collected until save()"""
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+        self.members = {info.filename: info for info in self.zip.infolist() if not info.is_dir()}
+        # member name -> fixed text, with "\n" line endings
+        self.fixed = {}
+
+    @property
+    def root(self):
+        """Root for journal keys, so members are keyed by their name inside the archive"""
+        return self.path + "!"
+
+    def path_for(self, member):
+        return f"{self.path}{SEPARATOR}{member}"
+
+    def owns(self, path):
+        return path.startswith(self.path + SEPARATOR)
+
+    def member(self, path):
+        return path[len(self.path) + len(SEPARATOR):]
+
+    def _text(self, member):
+        return self.zip.read(member).decode("utf-8", errors="ignore")
+
+    def find_java_files(self, excludes=None):
+        names = discovery.walk_members(self.members, discovery.JAVA_EXTENSIONS,
+                                       excludes or discovery.excludes_from_env(), read=self._text)
+        return [self.path_for(name) for name in names]
+
+    def find_cft_files(self, excludes=None):
+        """Template members, sniffed from the first bytes of each candidate like discovery.is_cft_template"""
+        templates = []
+        for name in discovery.walk_members(self.members, discovery.CFT_EXTENSIONS,
+                                           excludes or discovery.excludes_from_env(), read=self._text):
+            with self.zip.open(name) as f:
+                header = f.read(discovery.SNIFF_BYTES)
+            if discovery.CFT_MARKER_RE.search(header):
+                templates.append(self.path_for(name))
+        return templates
+
+    def read(self, path):
+        """Text of a member (its fixed text once written), with universal newlines like open()"""
+        member = self.member(path)
+        if member in self.fixed:
+            return self.fixed[member]
+        return self.zip.read(member).decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+    def write(self, path, text):
+        self.fixed[self.member(path)] = text.replace("\r\n", "\n")
+
+    def _bytes(self, member):
+        """Bytes of a member as they will be saved: fixed text keeps the member's line endings"""
+        if member not in self.fixed:
+            return self.zip.read(member)
+        text = self.fixed[member]
+        if b"\r\n" in self.zip.read(member):
+            text = text.replace("\n", "\r\n")
+        return text.encode("utf-8")
+
+    def size(self, path):
+        member = self.member(path)
+        if member in self.fixed:
+            return len(self.fixed[member].encode("utf-8"))
+        return self.members[member].file_size
+
+    def hash(self, path):
+        """Content hash of a member for the journal, or None when the archive has no such member"""
+        member = self.member(path)
+        if member not in self.members:
+            return None
+        return hashlib.sha1(self._bytes(member)).hexdigest()
+
+    def save(self, output):
+        """Write the fixes: a new archive when output ends in .zip, else an overlay directory
+        holding only the fixed members. Returns the number of fixed members written."""
+        if os.path.abspath(output) == os.path.abspath(self.path):
+            raise ValueError("refusing to overwrite the input archive")
+        if output.lower().endswith(".zip"):
+            self._save_archive(output)
+        else:
+            self._save_overlay(output)
+        return len(self.fixed)
+
+    def _save_archive(self, output):
+        # Written next to the target and renamed, so a failed run leaves no half-written archive
+        partial = output + ".partial"
+        with zipfile.ZipFile(partial, "w") as out:
+            out.comment = self.zip.comment
+            for info in self.zip.infolist():
+                # Copy, since writing updates the offsets and sizes on the ZipInfo
+                info = copy.copy(info)
+                if info.filename in self.fixed:
+                    out.writestr(info, self._bytes(info.filename))
+                elif info.is_dir():
+                    out.writestr(info, b"")
+                else:
+                    with self.zip.open(info.filename) as src, out.open(info, "w") as dst:
+                        shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(partial, output)
+
+    def _save_overlay(self, output):
+        root = os.path.abspath(output)
+        for member in self.fixed:
+            target = os.path.abspath(os.path.join(root, *member.split("/")))
+            # Member names come from the archive; never write outside the overlay
+            if os.path.commonpath([root, target]) != root:
+                raise ValueError(f"member {member!r} escapes the overlay directory")
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                f.write(self._bytes(member))
+
+    def close(self):
+        self.zip.close()
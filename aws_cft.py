@@ -1,213 +1,598 @@
 import os
 import json
-import yaml
+import asyncio
+import copy
+import functools
 import subprocess
 import tempfile
 import shutil
 import stat
 import re 
-from git import Repo
-from openai import AzureOpenAI
+import argparse
 from datetime import datetime
+from llm_engine import LLMEngine, TruncatedResponse
+from fix_cache import FixCache
+import git_diff
+import cft_rules
+import clone_cache
+import discovery
+import patching
+import cft_fanout
+import batch_jobs
+import cfn_yaml
+import dedup
+import validation
+import archives
+from journal import Journal, journal_path
 
 # Azure OpenAI Setup
-endpoint = "https://bh-in-openai-glitchslayers.openai.azure.com/"
+endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "https://bh-in-openai-glitchslayers.openai.azure.com/")
 model_name = "gpt-35-turbo"
 deployment = "gpt-35-turbo"
-subscription_key = "c093c3a427f04210967aed6d3f7e5ba3"
+subscription_key = os.getenv("AZURE_OPENAI_KEY", "c093c3a427f04210967aed6d3f7e5ba3")
 api_version = "2024-12-01-preview"
+MAX_TOKENS = 4096
+# Budget for the single retry after a response is cut off at MAX_TOKENS
+RETRY_MAX_TOKENS = int(os.getenv("CFT_RETRY_MAX_TOKENS", "8192"))
+# Templates estimated above this many tokens are fixed one resource at a time
+FANOUT_TOKENS = int(os.getenv("CFT_FANOUT_TOKENS", "2500"))
 BRANCH_NAME = f"cft-security-fixes-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
 
-client = AzureOpenAI(
-    api_version=api_version,
-    azure_endpoint=endpoint,
-    api_key=subscription_key,
-)
+def create_async_client():
+    from openai import AsyncAzureOpenAI
+    return AsyncAzureOpenAI(
+        api_version=api_version,
+        azure_endpoint=endpoint,
+        api_key=subscription_key,
+        max_retries=0,
+    )
+
+engine = LLMEngine(create_async_client)
+cache = FixCache()
+cache.telemetry = engine.telemetry
+# archives.ZipSource when fixing the templates inside a zip archive instead of a checkout
+archive = None
 
 # GitHub Configuration
 GITHUB_REPO_URL = "https://github.com/vishakhamamdyal/glitchSlayers.git"
 # BRANCH_NAME = "cft-vulnerabilities-2"
 
-# Register CloudFormation custom tags
-
-def register_cfn_tags():
-    def tag_scalar(tag):
-        return lambda loader, node: {tag: loader.construct_scalar(node)}
-
-    def tag_sequence(tag):
-        return lambda loader, node: {tag: loader.construct_sequence(node)}
-
-    def tag_mapping(tag):
-        return lambda loader, node: {tag: loader.construct_mapping(node)}
-
-    tags = {
-        '!Ref': 'Ref',
-        '!Condition': 'Condition',
-        '!GetAtt': 'Fn::GetAtt',
-        '!Sub': 'Fn::Sub',
-        '!Join': 'Fn::Join',
-        '!Select': 'Fn::Select',
-        '!Split': 'Fn::Split',
-        '!Equals': 'Fn::Equals',
-        '!If': 'Fn::If',
-        '!Not': 'Fn::Not',
-        '!And': 'Fn::And',
-        '!Or': 'Fn::Or',
-        '!FindInMap': 'Fn::FindInMap',
-        '!ImportValue': 'Fn::ImportValue',
-        '!Base64': 'Fn::Base64',
-        '!Cidr': 'Fn::Cidr',
-        '!Transform': 'Fn::Transform'
-    }
-
-    for tag, mapped in tags.items():
-        if tag in ['!Join', '!Split', '!Select', '!Equals', '!If', '!Not', '!And', '!Or', '!FindInMap', '!Cidr']:
-            yaml.add_constructor(tag, tag_sequence(mapped), Loader=yaml.SafeLoader)
-        elif tag in ['!Transform']:
-            yaml.add_constructor(tag, tag_mapping(mapped), Loader=yaml.SafeLoader)
-        else:
-            yaml.add_constructor(tag, tag_scalar(mapped), Loader=yaml.SafeLoader)
-
-register_cfn_tags()
+BEST_PRACTICES = (
+    "- Do not use wildcard permissions (avoid Action: '*', Resource: '*')\n"
+    "- Do not hardcode secrets or passwords\n"
+    "- Do not allow wide open ingress in Security Groups (avoid 0.0.0.0/0)\n"
+    "- Disable AssignPublicIp unless absolutely necessary\n"
+    "- Avoid hardcoding subnet and VPC IDs\n"
+    "- Use IAM Instance Profiles to grant least-privilege access\n"
+    "- Enable encryption for volumes and sensitive data\n"
+    "- Enable logging and monitoring (e.g., CloudWatch Agent)\n"
+    "- Use access control tags and define resource-level policies\n"
+)
 
 # Utility to scan template and return fixed version
-def scan_with_azure_openai(template_dict, file_format):
+def scan_with_azure_openai(template_dict, file_format, findings=None):
+    return engine.run_one(lambda: ascan_with_azure_openai(template_dict, file_format, findings))
+
+def clean_model_output(text):
+    return re.sub(r"^```(?:yaml|yml|json)?\s*|```$", "", text.strip(), flags=re.MULTILINE)
+
+def parse_template_text(text, file_format):
+    return json.loads(text) if file_format == "json" else cfn_yaml.load(text)
+
+# Streamed request that fails fast on truncated or unparsable output and retries once
+async def request_fixed_template(request, file_format, label=None):
+    max_tokens = MAX_TOKENS
+    for attempt in (1, 2):
+        try:
+            response = await engine.chat(label=label, max_tokens=max_tokens, **request)
+        except TruncatedResponse as e:
+            if attempt == 2:
+                raise
+            print(f"⚠️ {label or 'template'}: {e}; retrying with max_tokens={RETRY_MAX_TOKENS}")
+            max_tokens = RETRY_MAX_TOKENS
+            continue
+        fixed = clean_model_output(response.choices[0].message.content)
+        try:
+            parse_template_text(fixed, file_format)
+            return fixed
+        except Exception as e:
+            if attempt == 2:
+                raise ValueError(f"model returned invalid {file_format.upper()}: {e}")
+            print(f"⚠️ {label or 'template'}: invalid {file_format.upper()} returned ({e}); retrying")
+
+async def ascan_with_azure_openai(template_dict, file_format, findings=None, label=None, problems=None):
     # prompt = f"Detect vulnerabilities in this CloudFormation template and return a secure version:\n\n{json.dumps(template_dict)}"
-    best_practices = (
-        "- Do not use wildcard permissions (avoid Action: '*', Resource: '*')\n"
-        "- Do not hardcode secrets or passwords\n"
-        "- Do not allow wide open ingress in Security Groups (avoid 0.0.0.0/0)\n"
-        "- Disable AssignPublicIp unless absolutely necessary\n"
-        "- Avoid hardcoding subnet and VPC IDs\n"
-        "- Use IAM Instance Profiles to grant least-privilege access\n"
-        "- Enable encryption for volumes and sensitive data\n"
-        "- Enable logging and monitoring (e.g., CloudWatch Agent)\n"
-        "- Use access control tags and define resource-level policies\n"
-    )
+    best_practices = BEST_PRACTICES
+    if findings:
+        # Only ask about what the local rule engine actually found
+        best_practices = cft_rules.format_findings(findings)
+    if problems:
+        # Targeted retry of a fix that failed validation
+        best_practices = validation.retry_prompt(best_practices, problems, "the complete fixed template")
     prompt = (
         f"You are a CloudFormation vulnerability fixer. you have to fix the template using the standard best practices"
         "Below are some key practices to follow:\n"
         f"{best_practices}\n"
         f"Given the following CloudFormation template, return only the fixed template in valid {file_format.upper()} format. "
         "Do not include explanations, comments, or any other text — just return the corrected template.\n\n"
-        f"{json.dumps(template_dict) if file_format == 'json' else yaml.safe_dump(template_dict)}"
+        f"{json.dumps(template_dict) if file_format == 'json' else cfn_yaml.dump(template_dict)}"
     )
-    response = client.chat.completions.create(
+    cache_key = FixCache.make_key("cft", prompt, deployment, 0.3, MAX_TOKENS)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+    request = dict(
         messages=[
             {"role": "system", "content": "You are a CloudFormation vulnerability detector and fixer."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=4096,
         temperature=0.3,
         top_p=1.0,
         model=deployment
     )
+    response_new = await request_fixed_template(request, file_format, label)
     print("..... file.....")
-    tempres=response.choices[0].message.content
-    response_new = re.sub(r"^```yaml\s*|```$", "", tempres.strip(), flags=re.MULTILINE)
     print(response_new)
+    cache.put(cache_key, response_new)
     return response_new
 
+# Large templates: fix each (flagged) resource in parallel with the context it references.
+# A retry after validation passes the problems and the rejected fix (previous); when every
+# problem is about a resource, only those resources are fixed again.
+async def afix_template(file_path, template, file_format, findings=None, problems=None, previous=None):
+    resources = template.get("Resources") if isinstance(template, dict) else None
+    if not isinstance(resources, dict) or len(resources) < 2 or cft_fanout.estimate_tokens(template) <= FANOUT_TOKENS:
+        return await ascan_with_azure_openai(template, file_format, findings, label=file_path, problems=problems)
+
+    if findings:
+        targets = {}
+        for finding in findings:
+            if finding["resource"] in resources:
+                targets.setdefault(finding["resource"], []).append(finding)
+            else:
+                # Parameter findings go to every resource that references the parameter
+                for logical_id, resource in resources.items():
+                    if finding["resource"] in cft_fanout.collect_refs(resource)["refs"]:
+                        targets.setdefault(logical_id, []).append(finding)
+    else:
+        targets = {logical_id: None for logical_id in resources}
+    base = template
+    retry = validation.failed_resources(problems) if problems and previous is not None else None
+    if retry and retry <= set(resources):
+        # Keep the fixes of the resources that passed and redo only the ones that failed
+        targets = {logical_id: targets.get(logical_id) for logical_id in resources if logical_id in retry}
+        base = parse_template_text(previous, file_format)
+    print(f"🔀 {file_path}: fixing {len(targets)} of {len(resources)} resources in parallel")
+
+    async def fix_resource(logical_id):
+        sub = cft_fanout.resource_context(template, logical_id)
+        label = f"{file_path}#{logical_id}"
+        scoped = None
+        if problems:
+            # Problems about other parts of the template go to every resource's retry
+            scoped = validation.resource_problems(problems, logical_id) or problems
+            label += " (retry)"
+        fixed = await ascan_with_azure_openai(sub, file_format, targets[logical_id], label=label, problems=scoped)
+        return parse_template_text(fixed, file_format)
+
+    ids = list(targets)
+    fixed_subs = await asyncio.gather(*(fix_resource(logical_id) for logical_id in ids), return_exceptions=True)
+    for fixed_sub in fixed_subs:
+        if isinstance(fixed_sub, batch_jobs.BatchPending):
+            raise fixed_sub
+
+    original = copy.deepcopy(template)
+    merged = copy.deepcopy(base)
+    touched_by = {}
+    for logical_id, fixed_sub in zip(ids, fixed_subs):
+        if isinstance(fixed_sub, Exception) or not isinstance(fixed_sub, dict):
+            print(f"⚠️ {file_path}#{logical_id}: keeping original resource ({fixed_sub})")
+            continue
+        for name in cft_fanout.merge_fixed(merged, logical_id, fixed_sub):
+            touched_by[name] = logical_id
+
+    # Revert resources whose fix introduced a dangling reference
+    before = set(cft_fanout.check_integrity(original))
+    for resource_id, message in cft_fanout.check_integrity(merged):
+        if (resource_id, message) in before or resource_id not in touched_by:
+            continue
+        print(f"⚠️ {file_path}#{resource_id}: {message}; reverting this resource")
+        if resource_id in original["Resources"]:
+            merged["Resources"][resource_id] = original["Resources"][resource_id]
+        else:
+            merged["Resources"].pop(resource_id, None)
+
+    return json.dumps(merged, indent=2) if file_format == "json" else cfn_yaml.dump(merged)
+
+# Patch mode: ask only for edits to the original file text and apply them locally
+async def ascan_patch_template(file_path, template_dict, file_format, findings=None, problems=None, previous=None):
+    original = read_text(file_path)
+    practices = cft_rules.format_findings(findings) if findings else BEST_PRACTICES
+    if problems:
+        practices = validation.retry_prompt(practices, problems, "only the edits")
+    prompt = (
+        "You are a CloudFormation vulnerability fixer. Fix the template below using these practices:\n"
+        f"{practices}\n"
+        "Respond with a JSON object of the form {\"edits\": [...]}."
+        f"{patching.PATCH_INSTRUCTIONS}\n\n"
+        f"{original}"
+    )
+    cache_key = FixCache.make_key("cft-patch", prompt, deployment, 0.3, MAX_TOKENS)
+    try:
+        patch = cache.get(cache_key)
+        if patch is None:
+            response = await engine.chat(
+                label=file_path,
+                messages=[
+                    {"role": "system", "content": "You are a CloudFormation vulnerability detector and fixer."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=MAX_TOKENS,
+                temperature=0.3,
+                top_p=1.0,
+                model=deployment,
+                response_format={"type": "json_object"}
+            )
+            patch = json.loads(response.choices[0].message.content)
+            cache.put(cache_key, patch)
+        fixed = patching.apply_patch_response(original, patch)
+        parse_template_text(fixed, file_format)
+        return fixed
+    except batch_jobs.BatchPending:
+        raise
+    except Exception as e:
+        print(f"⚠️ {file_path}: patch mode failed ({e}); falling back to full template")
+        return await ascan_with_azure_openai(template_dict, file_format, findings, label=file_path, problems=problems)
+
+# Check a generated fix in the validation pool and re-request an invalid one once with the diagnostics
+async def avalidated_fix(scan, file_path, template, file_format, findings=None):
+    fixed = await scan(file_path, template, file_format, findings)
+    original = read_text(file_path)
+    problems = await validation.arun(validation.check_template, fixed, file_format, original)
+    if not problems:
+        return fixed
+    print(f"⚠️ {file_path}: fix rejected by validation ({'; '.join(problems)}); retrying with diagnostics")
+    # Same path as the first attempt, so large templates are retried per resource
+    fixed = await scan(file_path, template, file_format, findings, problems=problems, previous=fixed)
+    problems = await validation.arun(validation.check_template, fixed, file_format, original)
+    if problems:
+        raise validation.ValidationError(problems)
+    return fixed
+
 # Recursively find all CFT files
 def find_cft_files(repo_dir):
-    cft_files = []
-    for root, _, files in os.walk(repo_dir):
-        for file in files:
-            if file.endswith((".yaml", ".yml", ".json")):
-                cft_files.append(os.path.join(root, file))
-    return cft_files
+    # Skips ignored/vendor directories and files that are not CloudFormation templates
+    if archive is not None and repo_dir == archive.path:
+        return archive.find_cft_files()
+    return discovery.find_cft_files(repo_dir)
+
+# Template text from disk, or from the archive being fixed
+def read_text(file_path):
+    if archive is not None and archive.owns(file_path):
+        return archive.read(file_path)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def write_text(file_path, text):
+    if archive is not None and archive.owns(file_path):
+        archive.write(file_path, text)
+        return
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(text)
 
 # Read and parse the CFT template
 def load_cft_file(file_path):
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            if file_path.endswith(".json"):
-                return json.load(f)
-            else:
-                return yaml.load(f, Loader=yaml.SafeLoader)
+        return parse_template_text(read_text(file_path), "json" if file_path.endswith(".json") else "yaml")
     except Exception as e:
         print(f"❌ Failed to read {file_path}: {e}")
         return None
 
-# Write updated CFT back to file
+# Write updated CFT back to file; returns True if written, False if the template did not change, None on failure
 def save_fixed_template(file_path, fixed_content):
+    file_format = "json" if file_path.endswith(".json") else "yaml"
     try:
-        if file_path.endswith(".json"):
-            parsed = json.loads(fixed_content)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(parsed, f, indent=2)
+        original = read_text(file_path)
+        parsed = parse_template_text(fixed_content, file_format)
+        # A fix that only reformats the template is not written, so the file stays out of the commit
+        if parsed == parse_template_text(original, file_format):
+            print(f"ℹ️ No changes to write: {file_path}")
+            return False
+        if file_format == "json":
+            write_text(file_path, json.dumps(parsed, indent=2))
         else:
-            parsed = yaml.safe_load(fixed_content)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                yaml.safe_dump(parsed, f, sort_keys=False)
+            # Keep the file's short-form tags, sequence indentation and comments so the diff stays small
+            write_text(file_path, cfn_yaml.dump_like(parsed, original))
         return True
     except Exception as e:
         print(f"❌ Failed to write fixed template to {file_path}: {e}")
-        return False
+        return None
 
 # Git: Clone and create branch
 def setup_repo():
-    tmp_dir = tempfile.mkdtemp()
-    repo = Repo.clone_from(GITHUB_REPO_URL, tmp_dir)
-    repo.git.checkout('tesCFT')
-    repo.git.checkout('-b', BRANCH_NAME)
-    return repo, tmp_dir
+    # Reuses a persistent bare mirror; each run only fetches and adds a worktree
+    return clone_cache.checkout_worktree(GITHUB_REPO_URL, 'tesCFT', BRANCH_NAME)
 
 # Git: Commit and push changes
-def commit_and_push(repo):
-    repo.git.add(all=True)
+def commit_and_push(repo, changed):
+    # Stage only the rewritten templates through the index instead of rehashing the whole worktree
+    repo.index.add([os.path.relpath(os.path.abspath(path), repo.working_tree_dir) for path in dict.fromkeys(changed)])
     repo.index.commit("Fix CloudFormation vulnerabilities using Azure OpenAI")
     origin = repo.remotes.origin
     origin.push(refspec=f"{BRANCH_NAME}:{BRANCH_NAME}")
     print(f"✅ Changes pushed to branch {BRANCH_NAME}")
 
 # GitHub CLI to raise PR (needs `gh` installed and authenticated)
-def raise_pr(repo_path):
+def raise_pr(repo_path, journal=None):
+    body = "This PR contains fixes to detected vulnerabilities in CloudFormation templates."
+    if journal is not None:
+        # Streamed from the journal, so it also lists templates fixed before a resumed run
+        body += "\n" + "".join(
+            f"\n- {entry['path']}" + (f": {', '.join(entry['findings'])}" if entry.get("findings") else "")
+            for entry in journal if entry["modified"]
+        )
     subprocess.run([
         "gh", "pr", "create",
         "--title", "Fix CloudFormation Vulnerabilities",
-        "--body", "This PR contains fixes to detected vulnerabilities in CloudFormation templates.",
+        "--body", body,
         "--base", "tesCFT",
         "--head", BRANCH_NAME
     ], cwd=repo_path)
 
-def main():
-    repo, repo_path = setup_repo()
-    print(f"✅ Repo cloned to {repo_path}")
+# Templates to scan: changed ones with --since, otherwise everything under repo_path
+def select_templates(args, repo_path):
+    cft_files = None
+    if args.since:
+        cft_files = git_diff.changed_files(repo_path, args.since, git_diff.CFT_EXTENSIONS, "cft")
+        if cft_files is None:
+            print("ℹ️ No previous scan recorded, falling back to a full scan.")
+        else:
+            cft_files = discovery.filter_changed(cft_files, repo_path, cft=True)
+    if cft_files is None:
+        cft_files = find_cft_files(repo_path)
+    return cft_files
 
-    cft_files = find_cft_files(repo_path)
+# Carry a group leader's fix over to a duplicate template; False if it needs its own request
+def apply_duplicate_fix(args, leader, file_path, file_format, originals, exact, changed, failed):
+    if leader in failed:
+        return False
+    leader_fixed = originals[leader]
+    if leader in changed:
+        leader_fixed = read_text(leader)
+    if leader_fixed == originals[leader]:
+        # A leader that needed no fix says nothing about the duplicate; it gets its own request
+        return False
+    try:
+        fixed = dedup.transfer_fix(originals[leader], leader_fixed, originals[file_path], file_format, exact)
+        template = parse_template_text(fixed, file_format)
+        # A near duplicate may differ where it matters; it must not keep findings the fixed leader no longer has
+        if not exact and not args.no_rules:
+            remaining = {f["rule"] for f in cft_rules.evaluate(template)}
+            if remaining - {f["rule"] for f in cft_rules.evaluate(parse_template_text(leader_fixed, file_format))}:
+                raise patching.PatchError(f"findings remain: {', '.join(sorted(remaining))}")
+        problems = validation.check_template(fixed, file_format, originals[file_path]) if not args.no_validate else []
+        if problems:
+            raise patching.PatchError("; ".join(problems))
+    except Exception as e:
+        print(f"⚠️ {file_path}: fix from {leader} does not apply ({e})")
+        return False
+    write_text(file_path, fixed)
+    print(f"🧬 Applied the fix from {leader}: {file_path}")
+    changed.append(file_path)
+    return True
+
+# Fix the selected templates in place; returns the files that were rewritten.
+# Templates whose requests were queued for a batch job are added to queued.
+# With a journal, every finished template is recorded as soon as it is done.
+def fix_templates(args, repo_path, cft_files=None, queued=None, journal=None):
+    if cft_files is None:
+        cft_files = select_templates(args, repo_path)
     print(f"🔍 Found {len(cft_files)} CFT files.")
 
     changed = []
+    rules = {}
+    def finish(file_path, modified):
+        if journal is not None:
+            journal.append({"file": file_path, "modified": modified, "findings": rules.pop(file_path, [])})
 
+    templates = []
     for file_path in cft_files:
+        if journal is not None and journal.resumed and journal.finished(file_path):
+            print(f"⏭️  Finished by an earlier run, skipping: {file_path}")
+            continue
         print(f"🛠️  Processing: {file_path}")
         template = load_cft_file(file_path)
         if template is None:
             continue
         file_format = "json" if file_path.endswith(".json") else "yaml"
-        fixed = scan_with_azure_openai(template,file_format)
+        findings = None
+        if not args.no_rules:
+            findings = cft_rules.evaluate(template)
+            if not findings:
+                print(f"✅ No rule findings, skipping model: {file_path}")
+                finish(file_path, False)
+                continue
+            rules[file_path] = sorted({finding["rule"] for finding in findings})
+        templates.append((file_path, template, file_format, findings))
 
-        if save_fixed_template(file_path, fixed):
+    # Prompt once per group of duplicate templates (e.g. one stack copied per environment)
+    groups = {}
+    originals = {}
+    if not args.no_dedup and len(templates) > 1:
+        for file_path, _, _, _ in templates:
+            originals[file_path] = read_text(file_path)
+        groups = dedup.group_duplicates(originals)
+    duplicates = {member: (leader, exact) for leader, members in groups.items() for member, exact in members}
+    if duplicates:
+        print(f"🧬 {len(duplicates)} duplicate templates in {len(groups)} groups; prompting once per group")
+
+    scan = ascan_patch_template if args.patch_mode else afix_template
+    if not args.no_validate:
+        scan = functools.partial(avalidated_fix, scan)
+    failed = set()
+    # Each template is saved and journaled inside its own job, so an interrupted run keeps what finished
+    async def fix_one(file_path, template, file_format, findings):
+        try:
+            fixed = await scan(file_path, template, file_format, findings)
+        except batch_jobs.BatchPending:
+            print(f"📦 Queued for batch job: {file_path}")
+            if queued is not None:
+                queued.append(file_path)
+            return
+        except validation.ValidationError as e:
+            print(f"❌ Fix rejected by validation for {file_path}: {e}")
+            failed.add(file_path)
+            return
+        except Exception as e:
+            print(f"❌ Azure OpenAI request failed for {file_path}: {e}")
+            failed.add(file_path)
+            return
+        saved = save_fixed_template(file_path, fixed)
+        if saved:
             changed.append(file_path)
+        if saved is not None:
+            finish(file_path, saved)
+
+    def send(batch):
+        engine.run([(lambda entry=entry: fix_one(*entry)) for entry in batch])
+
+    send([entry for entry in templates if entry[0] not in duplicates])
+    retry = []
+    for entry in templates:
+        if entry[0] not in duplicates:
+            continue
+        leader, exact = duplicates[entry[0]]
+        if queued is not None and leader in queued:
+            queued.append(entry[0])
+        elif apply_duplicate_fix(args, leader, entry[0], entry[2], originals, exact, changed, failed):
+            finish(entry[0], entry[0] in changed)
+        else:
+            retry.append(entry)
+    if retry:
+        print(f"🔁 Prompting {len(retry)} duplicate templates individually (clean leader or fix did not carry over)")
+        send(retry)
+    return changed
 
+# Fix every selected template, through batch jobs with --batch-dir; returns the files that were rewritten
+def fix_all(args, repo_path, journal):
+    if journal.resumed:
+        print(f"⏯️  Resuming from {journal.path} ({journal.resumed} templates already recorded)")
+    cft_files = select_templates(args, repo_path)
+    if not args.batch_dir:
+        changed = fix_templates(args, repo_path, cft_files, journal=journal)
+    else:
+        session = batch_jobs.BatchSession(args.batch_dir, create_async_client, local=args.batch_local)
+        changed = []
+        def process(files):
+            queued = []
+            changed.extend(fix_templates(args, repo_path, files, queued, journal))
+            return set(files) - set(queued)
+        batch_jobs.run_batched(engine, session, process, cft_files)
+    if args.since == "auto":
+        # Failed, queued or unreadable templates are not journaled; keep them in the next --since auto scan
+        unfinished = [file_path for file_path in cft_files if not journal.finished(file_path)]
+        if unfinished:
+            print(f"⚠️ {len(unfinished)} templates did not finish; not recording the scanned commit.")
+        else:
+            git_diff.record_scanned_commit(repo_path, "cft")
+    return changed
 
+def process_repo(args, repo, repo_path):
+    # Keyed by the repository URL, since every run checks out a fresh worktree
+    journal = Journal(args.journal or journal_path(GITHUB_REPO_URL, "cft"), root=repo_path, resume=args.resume)
+    changed = fix_all(args, repo_path, journal)
     if changed:
         print(f"✅ Fixed {len(changed)} files. Committing changes...")
-        commit_and_push(repo)
-        raise_pr(repo_path)
+        commit_and_push(repo, changed)
+        raise_pr(repo_path, journal)
     else:
         print("ℹ️ No valid files processed or changed.")
 
-    # def handle_remove_readonly(func, path, exc_info):
-    #     print(f"❌ Could not delete: {path}, retrying with chmod...")
-    #     try:
-    #         os.chmod(path, stat.S_IWRITE)
-    #         func(path)
-    #     except Exception as e:
-    #         print(f"⚠️ Final delete failed for: {path}, reason: {e}")
+# Fix the templates inside a zip archive and write them to a new archive (or overlay directory)
+def process_archive(args):
+    global archive
+    archive = archives.ZipSource(args.archive)
+    try:
+        if args.since:
+            print("ℹ️ --since needs a git checkout; scanning the whole archive.")
+            args.since = None
+        journal = Journal(args.journal or journal_path(os.path.abspath(args.archive), "cft"),
+                          root=archive.root, resume=args.resume, hasher=archive.hash)
+        changed = fix_all(args, args.archive, journal)
+        if changed:
+            output = args.archive_out or archives.default_output(args.archive)
+            archive.save(output)
+            print(f"✅ Fixed {len(changed)} files. Written to {output}")
+        else:
+            print("ℹ️ No valid files processed or changed.")
+    finally:
+        archive.close()
+        archive = None
+
+def build_parser(parser=None):
+    """Add the CloudFormation fixer options to parser (a new one by default)"""
+    parser = parser or argparse.ArgumentParser(description="CloudFormation vulnerability fixer using Azure OpenAI")
+    parser.add_argument("--no-rules", action="store_true",
+                        help="Send every template to the model instead of only those with rule findings")
+    parser.add_argument("--since", metavar="REF", default=None,
+                        help="Only scan templates added or modified since REF; 'auto' uses the last scanned commit")
+    parser.add_argument("--patch-mode", action="store_true",
+                        help="Ask the model for edits to the original file instead of a regenerated template")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Prompt for every duplicate template instead of once per group")
+    parser.add_argument("--no-validate", action="store_true",
+                        help="Write fixes without checking their schema and intrinsic references first")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignore the on-disk fix cache and always call the model")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Maximum number of in-flight Azure OpenAI requests (default: $LLM_CONCURRENCY or 8)")
+    parser.add_argument("--keep-worktree", action="store_true",
+                        help="Leave the checked-out worktree on disk after the run")
+    parser.add_argument("--metrics-dir", metavar="DIR", default=None,
+                        help="Write a per-call JSONL trace and a Prometheus textfile here (default: $LLM_METRICS_DIR)")
+    parser.add_argument("--batch-dir", metavar="DIR", default=None,
+                        help="Send requests as Azure OpenAI batch jobs, keeping the JSONL input/output files in DIR")
+    parser.add_argument("--batch-local", action="store_true",
+                        help="With --batch-dir, answer batch files locally with canned fixes instead of submitting them")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run, skipping templates its journal records as finished and unchanged")
+    parser.add_argument("--journal", metavar="PATH", default=None,
+                        help="Journal of finished templates (default: one per repository under ~/.cache/glitchslayers)")
+    parser.add_argument("--archive", metavar="ZIP", default=None,
+                        help="Fix the templates inside this zip archive instead of checking out the repository")
+    parser.add_argument("--archive-out", metavar="PATH", default=None,
+                        help="With --archive, write the fixed archive here, or only the fixed files when PATH "
+                             "is a directory (default: <archive>-fixed.zip)")
+    return parser
 
-    # shutil.rmtree(repo_path, onerror=handle_remove_readonly)
+def run(args):
+    """Check out the CFT repo, fix its templates and raise a PR; or fix the templates in --archive"""
+    if args.concurrency:
+        engine.concurrency = args.concurrency
+    if args.no_cache:
+        cache.enabled = False
+    if args.metrics_dir:
+        engine.telemetry.metrics_dir = args.metrics_dir
+
+    repo = repo_path = None
+    try:
+        with validation.session():
+            if args.archive:
+                process_archive(args)
+            else:
+                repo, repo_path = setup_repo()
+                print(f"✅ Repo checked out to {repo_path}")
+                process_repo(args, repo, repo_path)
+    finally:
+        if repo_path and not args.keep_worktree:
+            clone_cache.remove_worktree(repo_path)
+        print("📊 LLM usage:")
+        for line in engine.telemetry.summary_lines():
+            print(f"   {line}")
+        engine.telemetry.close()
+
+def main():
+    run(build_parser().parse_args())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import asyncio
+from types import SimpleNamespace
+
+from fix_cache import FixCache
+
+# Azure OpenAI batch jobs need a Global-Batch deployment and a recent API version
+BATCH_DEPLOYMENT = os.getenv("AZURE_OPENAI_BATCH_DEPLOYMENT")
+BATCH_API_VERSION = os.getenv("AZURE_OPENAI_BATCH_API_VERSION", "2024-10-21")
+POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "60"))
+DONE_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchPending(Exception):
+    """The request was queued for the next batch job instead of being sent"""
+
+
+def request_id(kwargs):
+    """Stable custom_id for a chat request, so results can be matched on the next pass"""
+    return FixCache.make_key("batch", kwargs)
+
+
+def request_line(custom_id, kwargs):
+    """One line of an Azure OpenAI batch input file"""
+    body = dict(kwargs)
+    if BATCH_DEPLOYMENT:
+        body["model"] = BATCH_DEPLOYMENT
+    return json.dumps({"custom_id": custom_id, "method": "POST", "url": "/chat/completions", "body": body})
+
+
+def completion_from_body(body):
+    """Shape a chat.completion JSON body like the SDK response objects the fixers read"""
+    choice = body["choices"][0]
+    message = SimpleNamespace(content=choice["message"].get("content") or "", role="assistant")
+    usage = body.get("usage")
+    usage = SimpleNamespace(**usage) if usage else None
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=choice.get("finish_reason"))],
+                           usage=usage)
+
+
+def run_local(input_path, output_path):
+    """Local stand-in for the batch service: answers every request line with mock_openai's canned fix"""
+    import mock_openai
+    with open(input_path, "r", encoding="utf-8") as src, open(output_path, "w", encoding="utf-8") as out:
+        for line in src:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            body = request["body"]
+            content = mock_openai.canned_response(body)
+            prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+            completion = {
+                "id": f"chatcmpl-{request['custom_id'][:12]}", "object": "chat.completion",
+                "created": int(time.time()), "model": body.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                          "total_tokens": prompt_tokens + len(content) // 4},
+            }
+            out.write(json.dumps({"custom_id": request["custom_id"],
+                                  "response": {"status_code": 200, "body": completion}, "error": None}) + "\n")
+    return output_path
+
+
+# Collects chat requests into JSONL batch files and serves their results back to the engine
+class BatchSession:
+    def __init__(self, work_dir, client_factory, local=False, poll_interval=None):
+        self.work_dir = work_dir
+        self.client_factory = client_factory
+        self.local = local
+        self.poll_interval = poll_interval or POLL_INTERVAL
+        self.pending = {}
+        self.results = {}
+        self.errors = {}
+        self.submitted = 0
+
+    def lookup(self, kwargs):
+        """Return the batch result for this request, or queue it and raise BatchPending"""
+        custom_id = request_id(kwargs)
+        if custom_id in self.results:
+            return completion_from_body(self.results[custom_id])
+        if custom_id in self.errors:
+            raise RuntimeError(f"batch request failed: {self.errors[custom_id]}")
+        self.pending.setdefault(custom_id, kwargs)
+        raise BatchPending(f"queued for batch job ({len(self.pending)} requests pending)")
+
+    def write_input(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for custom_id, kwargs in self.pending.items():
+                f.write(request_line(custom_id, kwargs) + "\n")
+        return path
+
+    def load_output(self, path):
+        """Read a batch output (or error) file into results and errors"""
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if response.get("status_code") == 200 and not entry.get("error"):
+                    self.results[entry["custom_id"]] = response["body"]
+                else:
+                    self.errors[entry["custom_id"]] = entry.get("error") or response.get("body")
+
+    def run_round(self, round_number):
+        """Write the pending requests, run them as one batch job and load the results"""
+        os.makedirs(self.work_dir, exist_ok=True)
+        input_path = self.write_input(os.path.join(self.work_dir, f"batch_input_{round_number}.jsonl"))
+        output_path = os.path.join(self.work_dir, f"batch_output_{round_number}.jsonl")
+        print(f"📦 Batch round {round_number}: {len(self.pending)} requests written to {input_path}")
+        if self.local:
+            run_local(input_path, output_path)
+        else:
+            asyncio.run(self._submit(input_path, output_path))
+        self.submitted += len(self.pending)
+        self.pending = {}
+        self.load_output(output_path)
+
+    async def _submit(self, input_path, output_path):
+        async with self.client_factory() as client:
+            with open(input_path, "rb") as f:
+                uploaded = await client.files.create(file=f, purpose="batch")
+            # Azure validates the upload before a batch can reference it
+            while getattr(uploaded, "status", "processed") not in ("processed", "error"):
+                await asyncio.sleep(5)
+                uploaded = await client.files.retrieve(uploaded.id)
+            if uploaded.status == "error":
+                raise RuntimeError(f"batch input {uploaded.id} was rejected: {uploaded.status_details}")
+            batch = await client.batches.create(input_file_id=uploaded.id, endpoint="/chat/completions",
+                                                completion_window="24h")
+            print(f"📨 Submitted batch {batch.id}")
+            while batch.status not in DONE_STATUSES:
+                await asyncio.sleep(self.poll_interval)
+                batch = await client.batches.retrieve(batch.id)
+                counts = batch.request_counts
+                progress = f" ({counts.completed}/{counts.total} done, {counts.failed} failed)" if counts else ""
+                print(f"⏳ Batch {batch.id}: {batch.status}{progress}")
+            if not batch.output_file_id and not batch.error_file_id:
+                raise RuntimeError(f"batch {batch.id} ended as {batch.status}: {batch.errors}")
+            with open(output_path, "w", encoding="utf-8") as out:
+                # Error lines have the same shape, with a non-200 status_code
+                for file_id in (batch.output_file_id, batch.error_file_id):
+                    if file_id:
+                        content = await client.files.content(file_id)
+                        out.write(content.text.rstrip("\n") + "\n")
+
+
+def run_batched(engine, session, process, items, max_rounds=None):
+    """Run process(items) in batch mode until every request has been answered.
+
+    process must return the items it finished; the others are retried in
+    the next round, once the batch job with their requests has completed.
+    A file can need several rounds (e.g. a chunked retry after truncation).
+    """
+    max_rounds = max_rounds or int(os.getenv("BATCH_MAX_ROUNDS", "4"))
+    engine.batch = session
+    try:
+        finished = process(items)
+        items = [item for item in items if item not in finished]
+        for round_number in range(1, max_rounds + 1):
+            if not session.pending or not items:
+                break
+            session.run_round(round_number)
+            finished = process(items)
+            items = [item for item in items if item not in finished]
+        if session.pending:
+            print(f"⚠️ {len(session.pending)} requests still pending after {max_rounds} batch rounds")
+    finally:
+        engine.batch = None
+    return items
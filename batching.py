@@ -0,0 +1,47 @@
+import os
+
+import java_chunker
+
+
+def estimate_file_tokens(path, size_of=os.path.getsize):
+    """Token estimate from the file size, without reading the file"""
+    try:
+        return (size_of(path) + java_chunker.CHARS_PER_TOKEN - 1) // java_chunker.CHARS_PER_TOKEN
+    except OSError:
+        return 0
+
+
+def pack_small_files(paths, small_tokens, batch_tokens, max_files=None, size_of=os.path.getsize):
+    """Split paths into files sent on their own and batches of small files.
+
+    Files at or below small_tokens are packed next-fit, in order, into
+    batches whose combined estimate stays within batch_tokens: a file that
+    does not fit closes the current batch, so neighbouring files (usually
+    from the same directory) stay together. Returns
+    (singles, batches); a batch that ends up with one file is returned as
+    a single instead. size_of gives a file's size in bytes (e.g. of an
+    archive member).
+    """
+    singles = []
+    batches = []
+    current = []
+    current_tokens = 0
+    for path in paths:
+        tokens = estimate_file_tokens(path, size_of)
+        if tokens > small_tokens:
+            singles.append(path)
+            continue
+        full = max_files is not None and len(current) >= max_files
+        if current and (current_tokens + tokens > batch_tokens or full):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(path)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+
+    for batch in [b for b in batches if len(b) == 1]:
+        batches.remove(batch)
+        singles.append(batch[0])
+    return singles, batches
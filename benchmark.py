@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import logging
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+
+import synth_repo
+
+# Offline benchmark: generates a synthetic repository, points both fixers at a local
+# mock of Azure OpenAI (mock_openai.py) and measures throughput, latency and memory.
+
+JAVA_PROMPT = "Check for hardcoded credentials and SQL injection"
+
+
+def start_mock(args):
+    """Run mock_openai.py in its own process so it does not share our GIL or heap"""
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_openai.py"),
+        "--port", "0", "--latency", str(args.latency), "--jitter", str(args.jitter),
+        "--tokens-per-sec", str(args.tokens_per_sec), "--error-rate", str(args.error_rate),
+        "--tpm-limit", str(args.tpm_limit), "--retry-after-ms", str(args.retry_after_ms),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if "listening on" not in line:
+        process.kill()
+        raise RuntimeError(f"mock server did not start: {line!r}")
+    return process, line.rsplit(" ", 1)[-1].strip()
+
+
+def measure(stage, files, run, telemetry, verbose=False):
+    """Run one stage and collect files/sec, latency percentiles and peak traced memory"""
+    # The client library is loaded lazily; load it now so import time is not measured
+    import openai  # noqa: F401
+    tracemalloc.start()
+    started = time.perf_counter()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    if not verbose:
+        logging.disable(logging.INFO)
+    with output:
+        run()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    totals = telemetry.totals()
+    return {
+        "stage": stage,
+        "files": files,
+        "seconds": round(elapsed, 3),
+        "files_per_sec": round(files / elapsed, 3) if elapsed else 0.0,
+        "requests": totals["requests"],
+        "throttled": totals["throttled"],
+        "latency_p50": round(totals["latency_p50"], 3),
+        "latency_p95": round(totals["latency_p95"], 3),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+def bench_java(args, root):
+    import Java
+    import discovery
+    fixer = Java.JavaCodeFixer()
+    fixer.cache.enabled = False
+    if args.concurrency:
+        fixer.engine.concurrency = args.concurrency
+    if args.patch_mode:
+        fixer.config["output_mode"] = "patch"
+    files = len(discovery.find_java_files(root))
+    return measure("java", files, lambda: fixer.process_directory(root, JAVA_PROMPT),
+                   fixer.engine.telemetry, args.verbose)
+
+
+def bench_cft(args, root):
+    import aws_cft
+    aws_cft.cache.enabled = False
+    if args.concurrency:
+        aws_cft.engine.concurrency = args.concurrency
+    options = argparse.Namespace(no_rules=args.no_rules, since=None, patch_mode=args.patch_mode,
+                                 no_dedup=False, no_validate=False)
+    files = len(aws_cft.find_cft_files(root))
+    return measure("cft", files, lambda: aws_cft.fix_templates(options, root), aws_cft.engine.telemetry,
+                   args.verbose)
+
+
+def regressions(results, baseline, tolerance):
+    """Compare against a previous --output file; returns human-readable regressions"""
+    previous = {r["stage"]: r for r in baseline.get("results", [])}
+    problems = []
+    for result in results:
+        before = previous.get(result["stage"])
+        if not before:
+            continue
+        if result["files_per_sec"] < before["files_per_sec"] * (1 - tolerance):
+            problems.append(f"{result['stage']}: files/sec {before['files_per_sec']} -> {result['files_per_sec']}")
+        if result["latency_p95"] > before["latency_p95"] * (1 + tolerance):
+            problems.append(f"{result['stage']}: p95 latency {before['latency_p95']}s -> {result['latency_p95']}s")
+        if result["peak_mb"] > before["peak_mb"] * (1 + tolerance):
+            problems.append(f"{result['stage']}: peak memory {before['peak_mb']} MB -> {result['peak_mb']} MB")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Java and CloudFormation fixers against a mock Azure OpenAI")
+    parser.add_argument("--stage", choices=("java", "cft", "all"), default="all")
+    parser.add_argument("--java-files", type=int, default=200)
+    parser.add_argument("--templates", type=int, default=50)
+    parser.add_argument("--resources", type=int, default=6, help="Maximum resources per template")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.3, help="Mock time to first token in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--tokens-per-sec", type=float, default=500.0, help="Mock completion token rate")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 429")
+    parser.add_argument("--tpm-limit", type=int, default=0, help="Simulated TPM quota enforced by the mock")
+    parser.add_argument("--retry-after-ms", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--patch-mode", action="store_true")
+    parser.add_argument("--no-rules", action="store_true")
+    parser.add_argument("--output", metavar="PATH", help="Write the results as JSON (usable as a --baseline)")
+    parser.add_argument("--baseline", metavar="PATH", help="Fail if results regress against this earlier --output")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression ratio against the baseline")
+    parser.add_argument("--verbose", action="store_true", help="Show the fixers' own output")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="glitchslayers-bench-")
+    mock, url = start_mock(args)
+    # Configure the fixers before they are imported; nothing touches the real cache or quota
+    os.environ.update({"AZURE_OPENAI_ENDPOINT": url, "AZURE_OPENAI_KEY": "mock", "FIX_CACHE_DISABLED": "1"})
+    os.environ.pop("LLM_METRICS_DIR", None)
+    results = []
+    try:
+        import validation
+        # One validation pool for both stages, shut down when they are done
+        with validation.session():
+            if args.stage in ("java", "all"):
+                root = os.path.join(workdir, "java")
+                synth_repo.generate_java_repo(root, args.java_files, seed=args.seed)
+                results.append(bench_java(args, root))
+            if args.stage in ("cft", "all"):
+                root = os.path.join(workdir, "cft")
+                synth_repo.generate_cft_repo(root, args.templates, args.resources, seed=args.seed)
+                results.append(bench_cft(args, root))
+    finally:
+        mock.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'stage':<6} {'files':>6} {'seconds':>8} {'files/s':>8} {'requests':>8} {'429s':>5} "
+          f"{'p50 s':>6} {'p95 s':>6} {'peak MB':>8}")
+    for r in results:
+        print(f"{r['stage']:<6} {r['files']:>6} {r['seconds']:>8.2f} {r['files_per_sec']:>8.2f} {r['requests']:>8} "
+              f"{r['throttled']:>5} {r['latency_p50']:>6.2f} {r['latency_p95']:>6.2f} {r['peak_mb']:>8.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            problems = regressions(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import re
+
+import yaml
+
+# libyaml-backed loader/dumper when PyYAML was built with it; the pure-Python ones otherwise
+try:
+    from yaml import CSafeLoader as BaseLoader, CSafeDumper as BaseDumper
+    LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader as BaseLoader, SafeDumper as BaseDumper
+    LIBYAML = False
+
+# Short-form intrinsic tags and the long-form keys they stand for
+SHORT_FORM_TAGS = {
+    "!Ref": "Ref", "!Condition": "Condition", "!GetAtt": "Fn::GetAtt", "!Sub": "Fn::Sub",
+    "!Join": "Fn::Join", "!Select": "Fn::Select", "!Split": "Fn::Split", "!Equals": "Fn::Equals",
+    "!If": "Fn::If", "!Not": "Fn::Not", "!And": "Fn::And", "!Or": "Fn::Or",
+    "!FindInMap": "Fn::FindInMap", "!ImportValue": "Fn::ImportValue", "!Base64": "Fn::Base64",
+    "!Cidr": "Fn::Cidr", "!Transform": "Fn::Transform", "!GetAZs": "Fn::GetAZs",
+    "!Length": "Fn::Length", "!ToJsonString": "Fn::ToJsonString",
+}
+COMMENT_RE = re.compile(r"\s+#.*$")
+# "Key:" at the start of a block line, plain or quoted
+KEY_RE = re.compile(r"""^("[^"]*"|'[^']*'|-?[^\s"'#-](?:[^:#]|:(?=\S))*?)\s*:(?:\s|$)""")
+# PyYAML always quotes tagged scalars; unquote the ones that are safe as plain scalars (!Ref Name)
+QUOTED_TAG_RE = re.compile(r"(![A-Za-z]+) '([A-Za-z_][\w.:/-]*)'(?=[,\]\s]|$)")
+
+
+class TaggedDict(dict):
+    """{"Fn::X": value} that was written as !X in the source and is dumped the same way"""
+    def __init__(self, tag, key, value, flow=False):
+        super().__init__({key: value})
+        self.tag = tag
+        self.flow = flow
+
+
+class FlowList(list):
+    """A list written in flow style ([a, b]) in the source"""
+
+
+class CfnLoader(BaseLoader):
+    pass
+
+
+class CfnDumper(BaseDumper):
+    pass
+
+
+class IndentedCfnDumper(yaml.SafeDumper):
+    """Pure-Python dumper that indents sequences under their parent key ("  - item")"""
+    def increase_indent(self, flow=False, indentless=False):
+        return super().increase_indent(flow, False)
+
+
+def _construct_tag(loader, tag_suffix, node):
+    tag = "!" + tag_suffix
+    key = SHORT_FORM_TAGS.get(tag, "Fn::" + tag_suffix)
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+    return TaggedDict(tag, key, value, flow=bool(getattr(node, "flow_style", False)))
+
+
+def _construct_seq(loader, node):
+    data = FlowList() if node.flow_style else []
+    yield data
+    data.extend(loader.construct_sequence(node))
+
+
+def _represent_tagged(dumper, data):
+    value = next(iter(data.values()))
+    if isinstance(value, list):
+        return dumper.represent_sequence(data.tag, value, flow_style=data.flow)
+    if isinstance(value, dict):
+        return dumper.represent_mapping(data.tag, value, flow_style=data.flow)
+    return dumper.represent_scalar(data.tag, str(value))
+
+
+def _represent_flow_list(dumper, data):
+    return dumper.represent_sequence("tag:yaml.org,2002:seq", data, flow_style=True)
+
+
+CfnLoader.add_multi_constructor("!", _construct_tag)
+CfnLoader.add_constructor("tag:yaml.org,2002:seq", _construct_seq)
+for _dumper in (CfnDumper, IndentedCfnDumper):
+    _dumper.add_representer(TaggedDict, _represent_tagged)
+    _dumper.add_representer(FlowList, _represent_flow_list)
+
+
+def load(stream):
+    """Parse a CloudFormation YAML template, keeping short-form tags as TaggedDicts"""
+    return yaml.load(stream, Loader=CfnLoader)
+
+
+def dump(data, stream=None, indent_sequences=False):
+    """Emit a template in block style with key order and short-form tags preserved"""
+    dumper = IndentedCfnDumper if indent_sequences else CfnDumper
+    text = yaml.dump(data, Dumper=dumper, sort_keys=False, default_flow_style=False,
+                     allow_unicode=True, width=4096)
+    text = QUOTED_TAG_RE.sub(r"\1 \2", text)
+    if stream is None:
+        return text
+    stream.write(text)
+
+
+def uses_indented_sequences(text):
+    """True when the source indents "- item" deeper than the key that owns the list"""
+    previous = None
+    for line in text.splitlines():
+        stripped = line.lstrip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        indent = len(line) - len(stripped)
+        if stripped.startswith("- ") and previous is not None and previous[1].endswith(":"):
+            return indent > previous[0]
+        previous = (indent, stripped)
+    return False
+
+
+def _strip_comment(line):
+    """Line without a trailing comment; leaves '#' inside quoted strings alone"""
+    match = COMMENT_RE.search(line)
+    if not match:
+        return line, ""
+    before = line[:match.start()]
+    if before.count("'") % 2 or before.count('"') % 2:
+        return line, ""
+    return before, line[match.start():]
+
+
+class _PathTracker:
+    """Structural path of each block-style line: the keys and sequence indices that lead to it.
+
+    Lines are identified by where they sit in the document ("Resources", "Bucket",
+    "Properties", "Tags", "[1]", "Key") rather than by their text alone, so a line
+    that repeats across resources or list items is told apart.
+    """
+    def __init__(self):
+        # (indent, component, is sequence item)
+        self.stack = []
+
+    def path(self, line):
+        indent = len(line) - len(line.lstrip())
+        rest = line.strip()
+        while True:
+            item = rest == "-" or rest.startswith("- ")
+            index = 0
+            while self.stack:
+                top_indent, component, top_item = self.stack[-1]
+                # Sequence items may sit at the same indent as the key that owns them
+                if top_indent < indent or (top_indent == indent and item and not top_item):
+                    break
+                self.stack.pop()
+                if top_indent == indent and item and top_item:
+                    index = int(component[1:-1]) + 1
+            if not item:
+                break
+            self.stack.append((indent, f"[{index}]", True))
+            stripped = rest[1:].lstrip()
+            indent += len(rest) - len(stripped)
+            rest = stripped
+            if not rest:
+                return tuple(component for _, component, _ in self.stack)
+        match = KEY_RE.match(rest)
+        if match:
+            self.stack.append((indent, match.group(1).strip("'\""), False))
+        return tuple(component for _, component, _ in self.stack)
+
+
+def _content_lines(text):
+    """(structural path, line) for every content line of text, comments stripped"""
+    tracker = _PathTracker()
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        content, _ = _strip_comment(line)
+        yield tracker.path(content), content.rstrip()
+
+
+def collect_comments(text):
+    """Split the comments of a file into its header, per-line comments and a footer.
+
+    Per-line comments map (structural path, commented line without its comment)
+    to the comment block above the line and the comment at its end.
+    """
+    header = []
+    comments = {}
+    block = []
+    seen_content = False
+    tracker = _PathTracker()
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not seen_content and (not stripped or stripped.startswith("#")):
+            header.append(line)
+            continue
+        if stripped.startswith("#"):
+            block.append(line)
+            continue
+        if not stripped:
+            continue
+        seen_content = True
+        content, trailing = _strip_comment(line)
+        path = tracker.path(content)
+        if block or trailing:
+            comments[(path, content.rstrip())] = (block, trailing)
+        block = []
+    if not any(line.strip() for line in header):
+        header = []
+    return header, comments, block
+
+
+def restore_comments(text, original):
+    """Best effort: put the original file's comments back onto the lines of text they were on.
+
+    A comment goes back on the line at the same structural path with the same
+    text; when that path moved (e.g. a list item was inserted above it), on the
+    line with the same text if that text is unique in both files.
+    """
+    header, comments, footer = collect_comments(original)
+    if not (header or comments or footer):
+        return text
+    lines = list(_content_lines(text))
+    placed = {}
+    for position, key in enumerate(lines):
+        entry = comments.pop(key, None)
+        if entry:
+            placed[position] = entry
+    if comments:
+        new_counts = {}
+        for _, line in lines:
+            new_counts[line] = new_counts.get(line, 0) + 1
+        old_counts = {}
+        for _, line in _content_lines(original):
+            old_counts[line] = old_counts.get(line, 0) + 1
+        by_text = {line: entry for (_, line), entry in comments.items()
+                   if old_counts.get(line) == 1 and new_counts.get(line) == 1}
+        for position, (_, line) in enumerate(lines):
+            if position not in placed and line in by_text:
+                placed[position] = by_text[line]
+    out = list(header)
+    position = 0
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped and not stripped.startswith("#"):
+            entry = placed.get(position)
+            position += 1
+            if entry:
+                block, trailing = entry
+                out.extend(block)
+                line = line.rstrip() + trailing
+        out.append(line)
+    out.extend(footer)
+    return "\n".join(out) + "\n"
+
+
+def dump_like(data, original):
+    """Dump data in the layout of the original file text, keeping its comments where lines still match"""
+    return restore_comments(dump(data, indent_sequences=uses_indented_sequences(original)), original)
@@ -8,8 +8,12 @@ import stat
 import re
 import argparse
 from datetime import datetime
-from openai import AzureOpenAI
-from git import Repo
+from llm_engine import LLMEngine, TruncatedResponse
+from fix_cache import FixCache
+import git_diff
+import cft_rules
+import clone_cache
+import discovery
 
 # Azure OpenAI Setup
 endpoint = "https://bh-in-openai-glitchslayers.openai.azure.com/"
@@ -17,17 +21,24 @@ subscription_key = "c093c3a427f04210967aed6d3f7e5ba3"
 api_version = "2024-12-01-preview"
 deployment = "gpt-35-turbo"
 
-client = AzureOpenAI(
-    api_version=api_version,
-    azure_endpoint=endpoint,
-    api_key=subscription_key,
-)
+def create_async_client():
+    from openai import AsyncAzureOpenAI
+    return AsyncAzureOpenAI(
+        api_version=api_version,
+        azure_endpoint=endpoint,
+        api_key=subscription_key,
+        max_retries=0,
+    )
+
+engine = LLMEngine(create_async_client)
+cache = FixCache()
+cache.telemetry = engine.telemetry
 
 # --- Java Vulnerability Fixer ---
 class JavaCodeFixer:
     def __init__(self):
         self.branch_name = f"java-security-fixes-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-        self.client = client
+        self.engine = engine
         self.repo_path = os.getenv("JAVA_REPO_PATH", ".")
         self.config = {
             "deployment_name": deployment,
@@ -35,6 +46,7 @@ class JavaCodeFixer:
             "max_tokens": 4000
         }
         self.results = []
+        self.failed = []
 
     def run_git_command(self, command, cwd=None):
         return subprocess.run(
@@ -46,10 +58,16 @@ class JavaCodeFixer:
         self.run_git_command(f"git checkout -b {self.branch_name}")
 
     def git_commit_and_push(self):
-        self.run_git_command("git add .")
-        commit_message = f"Java Security Fixes via Azure OpenAI"
-        self.run_git_command(f'git commit -m "{commit_message}"')
+        # Stage only the rewritten files instead of everything else lying around the tree
+        from git import Repo
+        repo = Repo(self.repo_path, search_parent_directories=True)
+        changed = list(dict.fromkeys(r["file"] for r in self.results if r["modified"]))
+        if not changed:
+            return False
+        repo.index.add([os.path.relpath(os.path.abspath(path), repo.working_tree_dir) for path in changed])
+        repo.index.commit("Java Security Fixes via Azure OpenAI")
         self.run_git_command(f"git push origin {self.branch_name}")
+        return True
 
     def create_pull_request(self):
         subprocess.run([
@@ -61,17 +79,25 @@ class JavaCodeFixer:
         ], cwd=self.repo_path)
 
     def find_java_files(self, root_dir):
-        return [os.path.join(root, file)
-                for root, _, files in os.walk(root_dir)
-                for file in files if file.endswith(".java")]
+        return discovery.find_java_files(root_dir)
 
     def generate_fixes(self, code_content, vulnerability_prompt):
+        return self.engine.run_one(lambda: self.agenerate_fixes(code_content, vulnerability_prompt))
+
+    async def agenerate_fixes(self, code_content, vulnerability_prompt):
         prompt = (
             "You are a senior Java security engineer. Return JSON in the following format:\n"
             "{'original_code': '', 'vulnerabilities_found': [], 'fixed_code': '', 'explanations': []}"
         )
         user_prompt = f"Focus: {vulnerability_prompt}\nCode:\n{code_content}"
-        response = self.client.chat.completions.create(
+        cache_key = FixCache.make_key(
+            "java", code_content, prompt, user_prompt,
+            self.config["deployment_name"], self.config["temperature"], self.config["max_tokens"]
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+        response = await self.engine.chat(
             model=self.config["deployment_name"],
             messages=[
                 {"role": "system", "content": prompt},
@@ -81,20 +107,38 @@ class JavaCodeFixer:
             max_tokens=self.config["max_tokens"],
             response_format={"type": "json_object"}
         )
-        return json.loads(response.choices[0].message.content)
+        fixes = json.loads(response.choices[0].message.content)
+        cache.put(cache_key, fixes)
+        return fixes
 
     def update_file(self, path, fixed_code):
+        """Write fixed_code to path; returns False when it would not change the file"""
+        # Line endings and trailing whitespace are not a fix; skipping them keeps the file out of the commit
+        def lines(code):
+            return [line.rstrip() for line in code.strip("\r\n").splitlines()]
+
+        with open(path, "r") as f:
+            if lines(f.read()) == lines(fixed_code):
+                return False
         with open(path, "w") as f:
             f.write(fixed_code)
+        return True
+
+    async def aprocess_file(self, file_path, vulnerability_prompt):
+        with open(file_path, "r") as f:
+            code = f.read()
+        return await self.agenerate_fixes(code, vulnerability_prompt)
 
-    def process_directory(self, root_dir, vulnerability_prompt):
-        java_files = self.find_java_files(root_dir)
-        for file_path in java_files:
-            with open(file_path, "r") as f:
-                code = f.read()
-            fixes = self.generate_fixes(code, vulnerability_prompt)
-            if fixes["vulnerabilities_found"]:
-                self.update_file(file_path, fixes["fixed_code"])
+    def process_directory(self, root_dir, vulnerability_prompt, java_files=None):
+        if java_files is None:
+            java_files = self.find_java_files(root_dir)
+        jobs = [(lambda path=path: self.aprocess_file(path, vulnerability_prompt)) for path in java_files]
+        for file_path, fixes in zip(java_files, self.engine.run(jobs)):
+            if isinstance(fixes, Exception):
+                print(f"❌ Failed to fix {file_path}: {fixes}")
+                self.failed.append(file_path)
+                continue
+            if fixes["vulnerabilities_found"] and self.update_file(file_path, fixes["fixed_code"]):
                 self.results.append({
                     "file": file_path,
                     "vulnerabilities_found": fixes["vulnerabilities_found"],
@@ -128,7 +172,30 @@ def register_cfn_tags():
 
 register_cfn_tags()
 
-def scan_with_openai(template_dict, file_format):
+def scan_with_openai(template_dict, file_format, findings=None):
+    return engine.run_one(lambda: ascan_with_openai(template_dict, file_format, findings))
+
+async def request_fixed_template(request, file_format, label=None):
+    max_tokens = 4096
+    for attempt in (1, 2):
+        try:
+            response = await engine.chat(label=label, max_tokens=max_tokens, **request)
+        except TruncatedResponse as e:
+            if attempt == 2:
+                raise
+            print(f"⚠️ {label or 'template'}: {e}; retrying with a larger budget")
+            max_tokens = 8192
+            continue
+        fixed = re.sub(r"^```(?:yaml|yml|json)?\s*|```$", "", response.choices[0].message.content.strip(), flags=re.MULTILINE)
+        try:
+            json.loads(fixed) if file_format == "json" else yaml.safe_load(fixed)
+            return fixed
+        except Exception as e:
+            if attempt == 2:
+                raise ValueError(f"model returned invalid {file_format.upper()}: {e}")
+            print(f"⚠️ {label or 'template'}: invalid {file_format.upper()} returned; retrying")
+
+async def ascan_with_openai(template_dict, file_format, findings=None, label=None):
     best_practices = (
         "- Avoid wildcards in IAM\n"
         "- Don’t expose 0.0.0.0/0\n"
@@ -136,27 +203,31 @@ def scan_with_openai(template_dict, file_format):
         "- Avoid hardcoded values\n"
         "- Enable logging"
     )
+    if findings:
+        best_practices = cft_rules.format_findings(findings)
     prompt = (
         f"Fix this CloudFormation template based on best practices:\n{best_practices}\n"
         f"Return valid {file_format.upper()} only:\n\n"
         f"{json.dumps(template_dict) if file_format == 'json' else yaml.safe_dump(template_dict)}"
     )
-    response = client.chat.completions.create(
+    cache_key = FixCache.make_key("cft", prompt, deployment, 0.3, 4096)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+    request = dict(
         messages=[
             {"role": "system", "content": "You are a CloudFormation fixer."},
             {"role": "user", "content": prompt}
         ],
         model=deployment,
-        max_tokens=4096,
         temperature=0.3
     )
-    fixed = response.choices[0].message.content
-    return re.sub(r"^```yaml\s*|```$", "", fixed.strip(), flags=re.MULTILINE)
+    fixed = await request_fixed_template(request, file_format, label)
+    cache.put(cache_key, fixed)
+    return fixed
 
 def find_cft_files(repo_dir):
-    return [os.path.join(root, file)
-            for root, _, files in os.walk(repo_dir)
-            for file in files if file.endswith((".yaml", ".yml", ".json"))]
+    return discovery.find_cft_files(repo_dir)
 
 def load_cft_file(path):
     try:
@@ -166,35 +237,74 @@ def load_cft_file(path):
         print(f"❌ Failed to read {path}: {e}")
         return None
 
-def save_fixed_template(path, content):
+def save_fixed_template(path, content, original):
+    """Write a fixed template; True when written, False when it only reformats the original, None on error"""
     try:
+        parsed = json.loads(content) if path.endswith(".json") else yaml.safe_load(content)
+        # A fix that only reformats the template is not written, so the file stays out of the commit
+        if parsed == original:
+            print(f"ℹ️ No changes to write: {path}")
+            return False
         with open(path, "w", encoding="utf-8") as f:
             if path.endswith(".json"):
-                json.dump(json.loads(content), f, indent=2)
+                json.dump(parsed, f, indent=2)
             else:
-                yaml.safe_dump(yaml.safe_load(content), f)
+                yaml.safe_dump(parsed, f)
+        return True
     except Exception as e:
         print(f"❌ Failed to save fixed template: {e}")
+        return None
 
-def process_cft_repo():
+def process_cft_repo(since=None):
     repo_url = "https://github.com/vishakhamamdyal/glitchSlayers.git"
     branch = f"cft-vulnerabilities-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    repo_dir = tempfile.mkdtemp()
-    repo = Repo.clone_from(repo_url, repo_dir)
-    repo.git.checkout("tesCFT")
-    repo.git.checkout("-b", branch)
+    repo, repo_dir = clone_cache.checkout_worktree(repo_url, "tesCFT", branch)
+    try:
+        fix_cft_worktree(repo, repo_dir, branch, since)
+    finally:
+        clone_cache.remove_worktree(repo_dir)
 
-    changed_files = []
-    for path in find_cft_files(repo_dir):
+def fix_cft_worktree(repo, repo_dir, branch, since=None):
+    cft_files = git_diff.changed_files(repo_dir, since, git_diff.CFT_EXTENSIONS, "cft") if since else None
+    if cft_files is None:
+        cft_files = find_cft_files(repo_dir)
+    else:
+        cft_files = discovery.filter_changed(cft_files, repo_dir, cft=True)
+
+    templates = []
+    failed = []
+    for path in cft_files:
         template = load_cft_file(path)
-        if not template: continue
+        if not template:
+            failed.append(path)
+            continue
         file_format = "json" if path.endswith(".json") else "yaml"
-        fixed = scan_with_openai(template, file_format)
-        save_fixed_template(path, fixed)
-        changed_files.append(path)
+        findings = cft_rules.evaluate(template)
+        if not findings:
+            print(f"✅ No rule findings, skipping model: {path}")
+            continue
+        templates.append((path, template, file_format, findings))
+
+    changed_files = []
+    jobs = [(lambda p=path, t=template, f=file_format, r=findings: ascan_with_openai(t, f, r, label=p))
+            for path, template, file_format, findings in templates]
+    for (path, template, _, _), fixed in zip(templates, engine.run(jobs)):
+        if isinstance(fixed, Exception):
+            print(f"❌ Failed to fix {path}: {fixed}")
+            failed.append(path)
+            continue
+        saved = save_fixed_template(path, fixed, template)
+        if saved is None:
+            failed.append(path)
+        elif saved:
+            changed_files.append(path)
+
+    # Templates that did not finish must stay in the next --since auto scan
+    if since == "auto" and not failed:
+        git_diff.record_scanned_commit(repo_dir, "cft")
 
     if changed_files:
-        repo.git.add(all=True)
+        repo.index.add([os.path.relpath(os.path.abspath(path), repo.working_tree_dir) for path in changed_files])
         repo.index.commit("Fix CFT vulnerabilities using Azure OpenAI")
         repo.remotes.origin.push(refspec=f"{branch}:{branch}")
         subprocess.run([
@@ -207,20 +317,25 @@ def process_cft_repo():
 
 # --- Master Main Function ---
 def main():
-
-    # Run CFT Fixing
-    print("\n🔍 Fixing CloudFormation templates...")
-    process_cft_repo()
-    
     parser = argparse.ArgumentParser()
     parser.add_argument("--java", help="Java code path", default=".")
     parser.add_argument("--prompt", help="Java vulnerability prompt", default="Check common Java issues")
+    parser.add_argument("--since", help="Only scan files changed since this git ref ('auto' = last scanned commit)", default=None)
     args = parser.parse_args()
 
+    # Run CFT Fixing
+    print("\n🔍 Fixing CloudFormation templates...")
+    process_cft_repo(args.since)
+
     # Run Java Fixing
     print("🔍 Fixing Java vulnerabilities...")
     java_fixer = JavaCodeFixer()
-    java_fixer.process_directory(args.java, args.prompt)
+    java_files = git_diff.changed_files(args.java, args.since, git_diff.JAVA_EXTENSIONS, "java") if args.since else None
+    if java_files is not None:
+        java_files = discovery.filter_changed(java_files, args.java)
+    java_fixer.process_directory(args.java, args.prompt, java_files)
+    if args.since == "auto" and not java_fixer.failed:
+        git_diff.record_scanned_commit(args.java, "java")
     if any(r["modified"] for r in java_fixer.results):
         java_fixer.setup_git_branch()
         java_fixer.git_commit_and_push()
@@ -228,5 +343,10 @@ def main():
     else:
         print("✅ No Java vulnerabilities found.")
 
+    print("\n📊 LLM usage:")
+    for line in engine.telemetry.summary_lines():
+        print(f"   {line}")
+    engine.telemetry.close()
+
 if __name__ == "__main__":
     main()
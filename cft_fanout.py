@@ -0,0 +1,128 @@
+import re
+import json
+
+SUB_VAR_RE = re.compile(r"\$\{([^}!][^}]*)\}")
+SECTIONS = ("Parameters", "Conditions", "Mappings")
+
+
+def estimate_tokens(template):
+    return len(json.dumps(template, default=str)) // 4
+
+
+def _sub_names(value):
+    """Names referenced by ${Name} or ${Name.Attr} inside a Fn::Sub string"""
+    return [match.split(".")[0] for match in SUB_VAR_RE.findall(value)]
+
+
+def collect_refs(value):
+    """Return {"refs", "getatts", "conditions", "mappings"} name sets referenced inside value"""
+    found = {"refs": set(), "getatts": set(), "conditions": set(), "mappings": set()}
+
+    def visit(node):
+        if isinstance(node, dict):
+            for key, child in node.items():
+                if key == "Ref" and isinstance(child, str):
+                    found["refs"].add(child)
+                elif key == "Fn::GetAtt":
+                    target = child.split(".")[0] if isinstance(child, str) else (child[0] if child else None)
+                    if isinstance(target, str):
+                        found["getatts"].add(target)
+                elif key == "Fn::Sub":
+                    template = child[0] if isinstance(child, list) and child else child
+                    if isinstance(template, str):
+                        local = set(child[1]) if isinstance(child, list) and len(child) > 1 and isinstance(child[1], dict) else set()
+                        found["refs"].update(n for n in _sub_names(template) if n not in local)
+                elif key == "Fn::FindInMap" and isinstance(child, list) and child and isinstance(child[0], str):
+                    found["mappings"].add(child[0])
+                elif key == "Fn::If" and isinstance(child, list) and child and isinstance(child[0], str):
+                    found["conditions"].add(child[0])
+                elif key == "Condition" and isinstance(child, str):
+                    found["conditions"].add(child)
+                visit(child)
+        elif isinstance(node, list):
+            for child in node:
+                visit(child)
+
+    visit(value)
+    return found
+
+
+def resource_context(template, logical_id):
+    """Sub-template with one resource plus the Parameters, Conditions and Mappings it needs"""
+    resource = template["Resources"][logical_id]
+    refs = collect_refs(resource)
+    conditions = {name for name in refs["conditions"] if name in template.get("Conditions", {})}
+    # Conditions can depend on parameters and on other conditions
+    pending = list(conditions)
+    while pending:
+        inner = collect_refs(template["Conditions"][pending.pop()])
+        for name in inner["conditions"]:
+            if name in template.get("Conditions", {}) and name not in conditions:
+                conditions.add(name)
+                pending.append(name)
+        refs["refs"] |= inner["refs"]
+        refs["mappings"] |= inner["mappings"]
+
+    sub = {}
+    params = {n: template["Parameters"][n] for n in sorted(refs["refs"]) if n in template.get("Parameters", {})}
+    mappings = {n: template["Mappings"][n] for n in sorted(refs["mappings"]) if n in template.get("Mappings", {})}
+    if params:
+        sub["Parameters"] = params
+    if conditions:
+        sub["Conditions"] = {n: template["Conditions"][n] for n in sorted(conditions)}
+    if mappings:
+        sub["Mappings"] = mappings
+    sub["Resources"] = {logical_id: resource}
+    return sub
+
+
+def merge_fixed(template, logical_id, fixed_sub):
+    """Merge a fixed sub-template back; returns the logical ids it added or replaced"""
+    touched = []
+    resources = fixed_sub.get("Resources") or {}
+    if logical_id in resources:
+        template["Resources"][logical_id] = resources[logical_id]
+        touched.append(logical_id)
+    for name, resource in resources.items():
+        # New supporting resources (e.g. a log bucket) are added unless they collide
+        if name != logical_id and name not in template["Resources"]:
+            template["Resources"][name] = resource
+            touched.append(name)
+    for section in SECTIONS:
+        for name, value in (fixed_sub.get(section) or {}).items():
+            template.setdefault(section, {})[name] = value
+    return touched
+
+
+PSEUDO_PARAMETERS = {
+    "AWS::AccountId", "AWS::NotificationARNs", "AWS::NoValue", "AWS::Partition",
+    "AWS::Region", "AWS::StackId", "AWS::StackName", "AWS::URLSuffix",
+}
+
+
+def check_integrity(template):
+    """Find dangling Ref/GetAtt/DependsOn/Condition references; returns [(resource, message)]"""
+    problems = []
+    resources = template.get("Resources") or {}
+    params = template.get("Parameters") or {}
+    conditions = template.get("Conditions") or {}
+    mappings = template.get("Mappings") or {}
+    for logical_id, resource in resources.items():
+        refs = collect_refs(resource)
+        for name in refs["refs"]:
+            if name not in resources and name not in params and name not in PSEUDO_PARAMETERS:
+                problems.append((logical_id, f"Ref to undefined '{name}'"))
+        for name in refs["getatts"]:
+            if name not in resources:
+                problems.append((logical_id, f"Fn::GetAtt on undefined resource '{name}'"))
+        for name in refs["conditions"]:
+            if name not in conditions:
+                problems.append((logical_id, f"undefined condition '{name}'"))
+        for name in refs["mappings"]:
+            if name not in mappings:
+                problems.append((logical_id, f"undefined mapping '{name}'"))
+        depends = resource.get("DependsOn") if isinstance(resource, dict) else None
+        for name in ([depends] if isinstance(depends, str) else depends or []):
+            if name not in resources:
+                problems.append((logical_id, f"DependsOn undefined resource '{name}'"))
+    return problems
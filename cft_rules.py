@@ -0,0 +1,198 @@
+import re
+
+# Deterministic CloudFormation checks for the best practices the LLM prompt lists.
+# Each rule takes (logical_id, resource) and yields finding dicts.
+
+SECRET_KEY_RE = re.compile(r"(password|passwd|secret|token|api_?key|access_?key|private_?key|credential)", re.IGNORECASE)
+# Keys that mention secrets but hold references or settings, not secret material
+NON_SECRET_KEY_RE = re.compile(r"(Arn|Id|Ids|Name|Template|Length|Type|Characters)$")
+OPEN_CIDRS = ("0.0.0.0/0", "::/0")
+LOGGABLE_TYPES = {
+    "AWS::S3::Bucket": "LoggingConfiguration",
+    "AWS::CloudFront::Distribution": "DistributionConfig.Logging",
+    "AWS::ElasticLoadBalancingV2::LoadBalancer": "LoadBalancerAttributes",
+    "AWS::ApiGateway::Stage": "AccessLogSetting",
+}
+
+
+def _finding(rule, logical_id, path, message):
+    return {"rule": rule, "resource": logical_id, "path": path, "message": message}
+
+
+def _is_literal(value):
+    """Intrinsic functions and dynamic references are not hardcoded values"""
+    if isinstance(value, str):
+        return not value.startswith("{{resolve:")
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _get(mapping, dotted):
+    for key in dotted.split("."):
+        if not isinstance(mapping, dict) or key not in mapping:
+            return None
+        mapping = mapping[key]
+    return mapping
+
+
+def _properties(resource):
+    """A resource's Properties; an empty "Properties:" in YAML loads as None"""
+    props = resource.get("Properties")
+    return props if isinstance(props, dict) else {}
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _walk(value, path=""):
+    """Yield (path, key, value) for every mapping entry below value"""
+    if isinstance(value, dict):
+        for key, child in value.items():
+            child_path = f"{path}.{key}" if path else str(key)
+            yield child_path, key, child
+            yield from _walk(child, child_path)
+    elif isinstance(value, list):
+        for i, child in enumerate(value):
+            yield from _walk(child, f"{path}[{i}]")
+
+
+def check_iam_wildcards(logical_id, resource):
+    for path, key, value in _walk(_properties(resource), "Properties"):
+        if key != "Statement":
+            continue
+        if "AssumeRolePolicyDocument" in path:
+            continue
+        for i, statement in enumerate(_as_list(value)):
+            if not isinstance(statement, dict) or statement.get("Effect") != "Allow":
+                continue
+            actions = _as_list(statement.get("Action"))
+            if any(a == "*" or (isinstance(a, str) and a.endswith(":*")) for a in actions):
+                yield _finding("iam-wildcard-action", logical_id, f"{path}[{i}].Action",
+                               f"Statement allows wildcard actions {actions}")
+            if "*" in _as_list(statement.get("Resource")):
+                yield _finding("iam-wildcard-resource", logical_id, f"{path}[{i}].Resource",
+                               "Statement applies to Resource '*'")
+
+
+def check_open_ingress(logical_id, resource):
+    rtype = resource.get("Type")
+    props = _properties(resource)
+    if rtype == "AWS::EC2::SecurityGroup":
+        rules = [(f"Properties.SecurityGroupIngress[{i}]", r) for i, r in enumerate(_as_list(props.get("SecurityGroupIngress")))]
+    elif rtype == "AWS::EC2::SecurityGroupIngress":
+        rules = [("Properties", props)]
+    else:
+        return
+    for path, rule in rules:
+        if not isinstance(rule, dict):
+            continue
+        cidr = rule.get("CidrIp") or rule.get("CidrIpv6")
+        if cidr in OPEN_CIDRS:
+            ports = f"{rule.get('FromPort', '*')}-{rule.get('ToPort', '*')}"
+            yield _finding("open-ingress", logical_id, path, f"Ingress on ports {ports} is open to {cidr}")
+
+
+def check_hardcoded_secrets(logical_id, resource):
+    for path, key, value in _walk(_properties(resource), "Properties"):
+        if not isinstance(key, str) or not SECRET_KEY_RE.search(key) or NON_SECRET_KEY_RE.search(key):
+            continue
+        if _is_literal(value) and value != "":
+            yield _finding("hardcoded-secret", logical_id, path, f"'{key}' is set to a literal value")
+
+
+def check_public_ip(logical_id, resource):
+    rtype = resource.get("Type")
+    props = _properties(resource)
+    if rtype == "AWS::ECS::Service":
+        if _get(props, "NetworkConfiguration.AwsvpcConfiguration.AssignPublicIp") == "ENABLED":
+            yield _finding("assign-public-ip", logical_id, "Properties.NetworkConfiguration.AwsvpcConfiguration.AssignPublicIp",
+                           "ECS service assigns public IPs to tasks")
+    elif rtype == "AWS::EC2::Instance":
+        for i, nic in enumerate(_as_list(props.get("NetworkInterfaces"))):
+            if isinstance(nic, dict) and nic.get("AssociatePublicIpAddress") in (True, "true"):
+                yield _finding("assign-public-ip", logical_id, f"Properties.NetworkInterfaces[{i}].AssociatePublicIpAddress",
+                               "Instance associates a public IP address")
+    elif rtype == "AWS::EC2::Subnet":
+        if props.get("MapPublicIpOnLaunch") in (True, "true"):
+            yield _finding("assign-public-ip", logical_id, "Properties.MapPublicIpOnLaunch",
+                           "Subnet maps public IPs on launch")
+
+
+def check_encryption(logical_id, resource):
+    rtype = resource.get("Type")
+    props = _properties(resource)
+    if rtype in ("AWS::EC2::Volume", "AWS::EFS::FileSystem") and props.get("Encrypted") not in (True, "true"):
+        yield _finding("unencrypted-volume", logical_id, "Properties.Encrypted", "Volume is not encrypted")
+    elif rtype == "AWS::RDS::DBInstance" and props.get("StorageEncrypted") not in (True, "true"):
+        yield _finding("unencrypted-volume", logical_id, "Properties.StorageEncrypted", "Database storage is not encrypted")
+    elif rtype == "AWS::S3::Bucket" and "BucketEncryption" not in props:
+        yield _finding("unencrypted-volume", logical_id, "Properties.BucketEncryption", "Bucket has no default encryption")
+    elif rtype in ("AWS::EC2::Instance", "AWS::EC2::LaunchTemplate", "AWS::AutoScaling::LaunchConfiguration"):
+        data = props.get("LaunchTemplateData", props)
+        if not isinstance(data, dict):
+            return
+        for i, mapping in enumerate(_as_list(data.get("BlockDeviceMappings"))):
+            ebs = mapping.get("Ebs") if isinstance(mapping, dict) else None
+            if isinstance(ebs, dict) and ebs.get("Encrypted") not in (True, "true"):
+                yield _finding("unencrypted-volume", logical_id, f"Properties.BlockDeviceMappings[{i}].Ebs.Encrypted",
+                               "EBS block device is not encrypted")
+
+
+def check_logging(logical_id, resource):
+    rtype = resource.get("Type")
+    props = _properties(resource)
+    if rtype in LOGGABLE_TYPES and _get(props, LOGGABLE_TYPES[rtype]) is None:
+        yield _finding("missing-logging", logical_id, f"Properties.{LOGGABLE_TYPES[rtype]}", f"{rtype} has no access logging configured")
+    elif rtype == "AWS::ECS::TaskDefinition":
+        for i, container in enumerate(_as_list(props.get("ContainerDefinitions"))):
+            if isinstance(container, dict) and "LogConfiguration" not in container:
+                yield _finding("missing-logging", logical_id, f"Properties.ContainerDefinitions[{i}].LogConfiguration",
+                               f"Container {container.get('Name', i)} has no log configuration")
+
+
+def check_parameters(template):
+    """Secret-looking parameters should use NoEcho and must not carry a default"""
+    params = template.get("Parameters")
+    if not isinstance(params, dict):
+        return
+    for name, param in params.items():
+        if not isinstance(param, dict) or not SECRET_KEY_RE.search(name):
+            continue
+        if param.get("Default") not in (None, ""):
+            yield _finding("hardcoded-secret", name, f"Parameters.{name}.Default", "Secret parameter has a default value")
+        if param.get("NoEcho") not in (True, "true"):
+            yield _finding("hardcoded-secret", name, f"Parameters.{name}.NoEcho", "Secret parameter is not NoEcho")
+
+
+RESOURCE_RULES = [
+    check_iam_wildcards,
+    check_open_ingress,
+    check_hardcoded_secrets,
+    check_public_ip,
+    check_encryption,
+    check_logging,
+]
+
+
+def is_cloudformation(template):
+    return isinstance(template, dict) and isinstance(template.get("Resources"), dict)
+
+
+def evaluate(template):
+    """Run every rule over a parsed template and return the list of findings"""
+    if not is_cloudformation(template):
+        return []
+    findings = list(check_parameters(template))
+    for logical_id, resource in template["Resources"].items():
+        if not isinstance(resource, dict):
+            continue
+        for rule in RESOURCE_RULES:
+            findings.extend(rule(logical_id, resource))
+    return findings
+
+
+def format_findings(findings):
+    """Render findings as a bullet list for the fix prompt"""
+    return "".join(f"- [{f['rule']}] {f['resource']} at {f['path']}: {f['message']}\n" for f in findings)
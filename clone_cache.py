@@ -0,0 +1,92 @@
+import os
+import re
+import time
+import shutil
+import hashlib
+
+CACHE_ROOT = os.getenv("CLONE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "glitchslayers"))
+MIRROR_ROOT = os.path.join(CACHE_ROOT, "mirrors")
+WORKTREE_ROOT = os.path.join(CACHE_ROOT, "worktrees")
+
+
+def _clone_options():
+    """Shallow/partial clone settings from the environment"""
+    depth = int(os.getenv("CLONE_DEPTH", "0")) or None
+    blob_filter = os.getenv("CLONE_FILTER") or None  # e.g. "blob:none"
+    return depth, blob_filter
+
+
+def _mirror_name(url):
+    base = re.sub(r"[^A-Za-z0-9_.-]", "_", url.rstrip("/").split("/")[-1])
+    return f"{base}-{hashlib.sha1(url.encode('utf-8')).hexdigest()[:10]}"
+
+
+def update_mirror(url, depth=None, blob_filter=None):
+    """Create or refresh the persistent bare mirror for url and return it"""
+    # GitPython is imported on demand so loading this module stays cheap
+    from git import Repo
+    path = os.path.join(MIRROR_ROOT, _mirror_name(url))
+    if not os.path.isdir(path):
+        os.makedirs(MIRROR_ROOT, exist_ok=True)
+        options = {"bare": True}
+        if depth:
+            options["depth"] = depth
+            options["no_single_branch"] = True
+        if blob_filter:
+            options["filter"] = blob_filter
+        print(f"📦 Creating mirror of {url} in {path}")
+        repo = Repo.clone_from(url, path, **options)
+    else:
+        repo = Repo(path)
+    # Fetch into remote-tracking refs so branches checked out in worktrees are never clobbered
+    fetch_args = ["origin", "+refs/heads/*:refs/remotes/origin/*", "--prune"]
+    if depth:
+        fetch_args.append(f"--depth={depth}")
+    repo.git.fetch(*fetch_args)
+    return repo
+
+
+def checkout_worktree(url, base_branch, new_branch, depth=None, blob_filter=None):
+    """Check out new_branch (created from origin/base_branch) into a fresh worktree"""
+    from git import Repo
+    if depth is None and blob_filter is None:
+        depth, blob_filter = _clone_options()
+    mirror = update_mirror(url, depth, blob_filter)
+    cleanup_worktrees(mirror)
+    os.makedirs(WORKTREE_ROOT, exist_ok=True)
+    path = os.path.join(WORKTREE_ROOT, f"{_mirror_name(url)}-{new_branch}-{os.getpid()}")
+    mirror.git.worktree("add", "-b", new_branch, path, f"origin/{base_branch}")
+    return Repo(path), path
+
+
+def remove_worktree(repo_path):
+    """Remove a worktree created by checkout_worktree and drop its registration"""
+    from git import Repo
+    repo = Repo(repo_path)
+    mirror = Repo(os.path.abspath(os.path.join(repo_path, repo.git.rev_parse("--git-common-dir"))))
+    branch = None if repo.head.is_detached else repo.active_branch.name
+    try:
+        mirror.git.worktree("remove", "--force", repo_path)
+    except Exception as e:
+        print(f"⚠️ Could not remove worktree {repo_path}: {e}")
+        shutil.rmtree(repo_path, ignore_errors=True)
+        mirror.git.worktree("prune")
+    if branch:
+        # The fix branch has been pushed (or abandoned); the mirror does not need it
+        mirror.git.branch("-D", branch)
+
+
+def cleanup_worktrees(mirror, max_age_hours=None):
+    """Remove worktrees left behind by earlier runs that are older than max_age_hours"""
+    if max_age_hours is None:
+        max_age_hours = float(os.getenv("WORKTREE_MAX_AGE_HOURS", "24"))
+    mirror.git.worktree("prune")
+    cutoff = time.time() - max_age_hours * 3600
+    for entry in mirror.git.worktree("list", "--porcelain").split("\n\n"):
+        fields = dict(line.split(" ", 1) for line in entry.splitlines() if " " in line)
+        path = fields.get("worktree")
+        if not path or "bare" in entry.splitlines():
+            continue
+        if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+            print(f"🧹 Removing stale worktree {path}")
+            remove_worktree(path)
@@ -0,0 +1,351 @@
+import os
+import re
+import json
+import random
+import difflib
+import hashlib
+
+import patching
+
+# Groups copy-pasted files (per-environment stacks, generated DTOs) so only one file per
+# group is sent to the model and its fix is carried over to the others.
+
+NEAR_THRESHOLD = float(os.getenv("DEDUP_NEAR_THRESHOLD", "0.9"))
+SHINGLE_SIZE = 5
+NUM_PERM = 32
+BANDS = 8
+MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1)
+PERMUTATIONS = [(_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+JAVA_TOKEN_RE = re.compile(r'''
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>"""(?:.|\n)*?"""|"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<name>[A-Za-z_$][\w$]*)
+  | (?P<number>\d[\w.]*)
+  | (?P<space>\s+)
+  | (?P<other>.)''', re.S | re.X)
+YAML_TOKEN_RE = re.compile(r'''
+    (?P<comment>(?:^|(?<=[ \t]))\#[^\n]*)
+  | (?P<indent>\n[ \t]*)
+  | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:''|[^'\n])*')
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<number>\d[\d.]*)
+  | (?P<space>[^\S\n]+)
+  | (?P<other>.)''', re.M | re.X)
+JSON_TOKEN_RE = re.compile(r'''
+    (?P<string>"(?:\\.|[^"\\\n])*")
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<number>-?\d[\d.eE+-]*)
+  | (?P<space>\s+)
+  | (?P<other>.)''', re.X)
+# Mapping keys: logical ids, parameter and property names
+YAML_KEY_RE = re.compile(r'''^[ \t-]*(?:"([^"\n]+)"|'([^'\n]+)'|([A-Za-z_]\w*))[ \t]*:(?=\s|$)''', re.M)
+
+JAVA_KEYWORDS = frozenset("""
+    abstract assert boolean break byte case catch char class const continue default do double else enum
+    extends final finally float for goto if implements import instanceof int interface long native new
+    package private protected public return short static strictfp super switch synchronized this throw
+    throws transient try void volatile while var record yield sealed permits true false null
+""".split())
+# Keywords that can end the type in front of a declared name
+JAVA_TYPE_KEYWORDS = frozenset("boolean byte char short int long float double void var".split())
+JAVA_DECLARING_KEYWORDS = frozenset("class interface enum record".split())
+# Tokens that can follow a declared variable, parameter or method name
+JAVA_DECLARATOR_END = frozenset("= ; , ) : [ (".split())
+# Tokens allowed between the angle brackets of a type's arguments
+JAVA_TYPE_ARGUMENT_TOKENS = frozenset(", . ? & [ ] extends super".split())
+# Top-level template sections whose keys declare names (logical ids, parameters, conditions...)
+DECLARING_SECTIONS = frozenset("Parameters Mappings Conditions Resources Outputs".split())
+
+
+def kind_for_path(path):
+    """Tokenizer to use for a file: "java", "json" or "yaml" """
+    if path.endswith(".java"):
+        return "java"
+    return "json" if path.endswith(".json") else "yaml"
+
+
+def _ends_type(tokens, i):
+    """True when tokens[i] can be the last token of a type (String, int, List<String>, byte[])"""
+    group, value = tokens[i]
+    if group == "name":
+        return value not in JAVA_KEYWORDS or value in JAVA_TYPE_KEYWORDS
+    if value == "]":
+        return i > 0 and tokens[i - 1][1] == "["
+    if value != ">":
+        return False
+    depth = 0
+    for j in range(i, 0, -1):
+        group, value = tokens[j]
+        if value == ">":
+            depth += 1
+        elif value == "<":
+            depth -= 1
+            if depth == 0:
+                return tokens[j - 1][0] == "name" and tokens[j - 1][1] not in JAVA_KEYWORDS
+        elif not (group == "name" and value not in JAVA_KEYWORDS or value in JAVA_TYPE_ARGUMENT_TOKENS):
+            return False
+    return False
+
+
+def _java_declared(text):
+    """Names a Java file declares: its types, methods, fields, parameters and locals"""
+    tokens = [(m.lastgroup, m.group()) for m in JAVA_TOKEN_RE.finditer(text) if m.lastgroup not in ("comment", "space")]
+    declared = set()
+    for i in range(1, len(tokens)):
+        group, value = tokens[i]
+        if group != "name" or value in JAVA_KEYWORDS:
+            continue
+        if tokens[i - 1][1] in JAVA_DECLARING_KEYWORDS:
+            declared.add(value)
+        elif i + 1 < len(tokens) and tokens[i + 1][1] in JAVA_DECLARATOR_END and _ends_type(tokens, i - 1):
+            declared.add(value)
+    return declared
+
+
+def _template_declared(text, kind):
+    """Names a template declares: the keys directly under Parameters, Resources, Outputs and the like"""
+    if kind == "json":
+        try:
+            template = json.loads(text)
+        except ValueError:
+            return set()
+        if not isinstance(template, dict):
+            return set()
+        return {name for section in DECLARING_SECTIONS if isinstance(template.get(section), dict)
+                for name in template[section]}
+    declared = set()
+    section = None
+    child_indent = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        indent = len(line) - len(line.lstrip())
+        match = YAML_KEY_RE.match(line)
+        key = next((g for g in match.groups() if g), None) if match else None
+        if indent == 0:
+            section = key if key in DECLARING_SECTIONS else None
+            child_indent = None
+        elif section is not None:
+            child_indent = indent if child_indent is None else child_indent
+            if indent == child_indent and key is not None:
+                declared.add(key)
+    return declared
+
+
+def _after_dot(text, start):
+    """True when the token at start follows a "." (a member reference such as obj.name)"""
+    i = start - 1
+    while i >= 0 and text[i].isspace():
+        i -= 1
+    return i >= 0 and text[i] == "."
+
+
+def _renamable(match, kind, keys):
+    """The identifier in a token when it is renamed during normalization, else None.
+
+    Only names the file declares (keys) are renamed; member and type references
+    (Runtime.exec, BucketName) and values such as true/false or tcp/udp stay
+    significant. Templates also rename quoted references to their names.
+    """
+    group = match.lastgroup
+    value = match.group()
+    if kind == "java":
+        if group == "name" and value in keys and not _after_dot(match.string, match.start()):
+            return value
+        return None
+    if group == "name" and value in keys:
+        return value
+    if group == "string" and value[1:-1] in keys:
+        return value[1:-1]
+    return None
+
+
+def _scan(text, kind):
+    token_re = JAVA_TOKEN_RE if kind == "java" else JSON_TOKEN_RE if kind == "json" else YAML_TOKEN_RE
+    keys = _java_declared(text) if kind == "java" else _template_declared(text, kind)
+    return token_re, keys
+
+
+def normalize(text, kind):
+    """Tokens of text without comments or whitespace, declared names renamed in order of first use.
+
+    Returns (tokens, names): names holds the original identifier behind each
+    renamed token, or None, so two equal token lists can be aligned.
+    """
+    token_re, keys = _scan(text, kind)
+    canonical = {}
+    tokens = []
+    names = []
+    for match in token_re.finditer(text):
+        group = match.lastgroup
+        if group in ("comment", "space"):
+            continue
+        if group == "indent":
+            # YAML nesting is carried by indentation; blank lines and comment lines do not count
+            if text.startswith(("\r", "\n", "#"), match.end()) or match.end() == len(text):
+                continue
+            tokens.append(f"\n{len(match.group()) - 1}")
+            names.append(None)
+            continue
+        name = _renamable(match, kind, keys)
+        if name is None:
+            tokens.append(match.group())
+        else:
+            tokens.append(f"${canonical.setdefault(name, len(canonical))}")
+        names.append(name)
+    return tokens, names
+
+
+def rename(text, mapping, kind):
+    """Replace identifiers in text using mapping, leaving comments and literals alone"""
+    if not mapping:
+        return text
+    token_re, keys = _scan(text, kind)
+    keys = keys | set(mapping)
+
+    def replace(match):
+        name = _renamable(match, kind, keys)
+        if name is None or name not in mapping:
+            return match.group()
+        return match.group().replace(name, mapping[name])
+
+    return token_re.sub(replace, text)
+
+
+def exact_key(tokens, kind):
+    return hashlib.sha1((kind + "\x1f" + "\x1f".join(tokens)).encode("utf-8")).hexdigest()
+
+
+def minhash(tokens):
+    """MinHash signature over shingles of SHINGLE_SIZE normalized tokens"""
+    size = min(SHINGLE_SIZE, len(tokens)) or 1
+    hashes = {
+        int.from_bytes(hashlib.blake2b("\x1f".join(tokens[i:i + size]).encode("utf-8"), digest_size=8).digest(), "big")
+        for i in range(max(len(tokens) - size + 1, 1))
+    }
+    return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in PERMUTATIONS)
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two MinHash signatures"""
+    return sum(x == y for x, y in zip(first, second)) / len(first)
+
+
+def group_duplicates(texts, threshold=None):
+    """Group files that are exact or near duplicates of an earlier file.
+
+    texts maps path -> file text, in processing order. Returns
+    {leader: [(member, exact), ...]} for leaders that have duplicates; exact
+    members differ from their leader only in comments, whitespace and the
+    names they declare.
+    """
+    threshold = NEAR_THRESHOLD if threshold is None else threshold
+    rows = NUM_PERM // BANDS
+    exact_leaders = {}
+    buckets = {}
+    signatures = {}
+    groups = {}
+    for path, text in texts.items():
+        kind = kind_for_path(path)
+        tokens, _ = normalize(text, kind)
+        key = exact_key(tokens, kind)
+        if key in exact_leaders:
+            groups.setdefault(exact_leaders[key], []).append((path, True))
+            continue
+        if threshold >= 1:
+            exact_leaders[key] = path
+            continue
+        signature = minhash(tokens)
+        bands = [(kind, band, signature[band * rows:(band + 1) * rows]) for band in range(BANDS)]
+        candidates = dict.fromkeys(leader for band in bands for leader in buckets.get(band, ()))
+        best = max(candidates, key=lambda leader: similarity(signature, signatures[leader]), default=None)
+        if best is not None and similarity(signature, signatures[best]) >= threshold:
+            groups.setdefault(best, []).append((path, False))
+            continue
+        exact_leaders[key] = path
+        signatures[path] = signature
+        for band in bands:
+            buckets.setdefault(band, []).append(path)
+    return groups
+
+
+def _line_key(line, kind):
+    """A line's tokens without comments or whitespace, for matching lines across files"""
+    token_re = JAVA_TOKEN_RE if kind == "java" else JSON_TOKEN_RE if kind == "json" else YAML_TOKEN_RE
+    return " ".join(m.group() for m in token_re.finditer(line) if m.lastgroup not in ("comment", "space", "indent"))
+
+
+def _indent(line):
+    return line[:len(line) - len(line.lstrip())]
+
+
+def transfer_fix(leader_before, leader_after, member_before, kind, exact):
+    """Apply the change made to a leader file to one of its duplicates.
+
+    Lines are matched on their tokens, so comments and spacing may differ;
+    for exact duplicates identifiers are renamed to the member's first and
+    the result must normalize to the same tokens as the fixed leader. Raises
+    patching.PatchError when a changed line has no counterpart in the member
+    or the result fails that check.
+    """
+    mapping = {}
+    if exact:
+        leader_tokens, leader_names = normalize(leader_before, kind)
+        member_tokens, member_names = normalize(member_before, kind)
+        if leader_tokens != member_tokens:
+            raise patching.PatchError("files are no longer duplicates")
+        mapping = {a: b for a, b in zip(leader_names, member_names) if a is not None and a != b}
+    before = rename(leader_before, mapping, kind).split("\n")
+    after = rename(leader_after, mapping, kind).split("\n")
+    lines = member_before.split("\n")
+    eol = "\r" if "\r\n" in member_before else ""
+
+    # Align the lines that carry tokens; blank and comment-only lines are free to differ
+    before_keys = [(i, _line_key(line, kind)) for i, line in enumerate(before)]
+    before_keys = [(i, key) for i, key in before_keys if key]
+    member_keys = [(i, _line_key(line, kind)) for i, line in enumerate(lines)]
+    member_keys = [(i, key) for i, key in member_keys if key]
+    aligned = {}
+    matcher = difflib.SequenceMatcher(None, [k for _, k in before_keys], [k for _, k in member_keys], autojunk=False)
+    for a, b, size in matcher.get_matching_blocks():
+        for offset in range(size):
+            aligned[before_keys[a + offset][0]] = member_keys[b + offset][0]
+
+    changes = []
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, before, after, autojunk=False).get_opcodes():
+        if op == "equal":
+            continue
+        old = [i for i in range(i1, i2) if i in aligned or _line_key(before[i], kind)]
+        if any(i not in aligned for i in old):
+            raise patching.PatchError(f"line {old[0] + 1} of the fix has no counterpart in this duplicate")
+        if old:
+            start, end, reference = aligned[old[0]], aligned[old[-1]] + 1, old[0]
+        else:
+            # Pure insertion (or blank lines only): anchor on the closest aligned line above
+            anchor = max((i for i in aligned if i < i1), default=None)
+            if anchor is None and i1 > 0:
+                raise patching.PatchError(f"no anchor for the change at line {i1 + 1}")
+            start = end = aligned[anchor] + 1 if anchor is not None else 0
+            reference = anchor
+        old_indent = _indent(before[reference]) if reference is not None else ""
+        new_indent = _indent(lines[start]) if old and start < len(lines) else (
+            _indent(lines[start - 1]) if start else "")
+        new = []
+        for line in after[j1:j2]:
+            line = line.rstrip("\r")
+            if old_indent != new_indent and line.startswith(old_indent):
+                line = new_indent + line[len(old_indent):]
+            new.append(line + eol if line else line)
+        changes.append((start, end, new))
+
+    for start, end, new in sorted(changes, reverse=True):
+        lines[start:end] = new
+    fixed = "\n".join(lines)
+    if exact and normalize(fixed, kind)[0] != normalize(leader_after, kind)[0]:
+        raise patching.PatchError("fix does not carry over to this duplicate")
+    if fixed == member_before:
+        raise patching.PatchError("fix did not change the duplicate")
+    return fixed
@@ -0,0 +1,192 @@
+import os
+import re
+
+# Directories that never contain sources worth scanning
+DEFAULT_EXCLUDES = (
+    ".git", ".hg", ".svn", "target", "build", "out", "dist", "bin", ".gradle", ".mvn",
+    "node_modules", ".idea", ".vscode", "__pycache__", ".venv", "venv", ".tox",
+    ".terraform", "cdk.out", ".aws-sam", ".serverless",
+)
+JAVA_EXTENSIONS = (".java",)
+CFT_EXTENSIONS = (".yaml", ".yml", ".json")
+# Markers of a CloudFormation/SAM template; one of them is expected near the top of the file
+CFT_MARKER_RE = re.compile(rb'AWSTemplateFormatVersion|AWS::Serverless|^Resources\s*:|"Resources"\s*:', re.MULTILINE)
+SNIFF_BYTES = 8192
+
+
+def _glob_to_regex(pattern):
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(pattern[i]))
+                i += 1
+            else:
+                out.append("[" + pattern[i + 1:end].replace("!", "^", 1) + "]")
+                i = end + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+def parse_gitignore(path):
+    """Compile a .gitignore file into [(regex, negated, dir_only)] relative to its directory"""
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return compile_gitignore(f.read().splitlines())
+    except OSError:
+        return []
+
+
+def compile_gitignore(lines):
+    """Compile the lines of a .gitignore into [(regex, negated, dir_only)]"""
+    rules = []
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        # Only a leading or middle slash anchors the pattern; the trailing one just means "directory"
+        line = line.rstrip("/")
+        anchored = "/" in line
+        line = line.lstrip("/")
+        prefix = "" if anchored else "(?:.*/)?"
+        rules.append((re.compile(f"^{prefix}{_glob_to_regex(line)}$"), negated, dir_only))
+    return rules
+
+
+def _ignored(rel_path, is_dir, ignore_stack):
+    """Apply the rules of every enclosing .gitignore, deepest last so it wins"""
+    ignored = False
+    for base, rules in ignore_stack:
+        rel = rel_path[len(base) + 1:] if base else rel_path
+        for regex, negated, dir_only in rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel):
+                ignored = not negated
+    return ignored
+
+
+def walk(root_dir, extensions, excludes=DEFAULT_EXCLUDES, respect_gitignore=True):
+    """Yield files under root_dir with the given extensions using os.scandir.
+
+    Excluded directory names and .gitignore'd paths are pruned without
+    being descended into.
+    """
+    excludes = set(excludes)
+    root_dir = os.path.abspath(root_dir)
+    stack = [("", [])]
+    while stack:
+        rel_dir, ignore_stack = stack.pop()
+        abs_dir = os.path.join(root_dir, rel_dir) if rel_dir else root_dir
+        if respect_gitignore:
+            rules = parse_gitignore(os.path.join(abs_dir, ".gitignore"))
+            if rules:
+                ignore_stack = ignore_stack + [(rel_dir, rules)]
+        try:
+            entries = sorted(os.scandir(abs_dir), key=lambda e: e.name)
+        except OSError as e:
+            print(f"Skipping unreadable directory {abs_dir}: {e}")
+            continue
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name in excludes or _ignored(rel_path, True, ignore_stack):
+                    continue
+                subdirs.append((rel_path, ignore_stack))
+            elif entry.name.endswith(extensions) and entry.is_file():
+                if not _ignored(rel_path, False, ignore_stack):
+                    yield entry.path
+        # Reverse so directories are visited in sorted order
+        stack.extend(reversed(subdirs))
+
+
+def walk_members(names, extensions, excludes=DEFAULT_EXCLUDES, read=None):
+    """Like walk, over the member names of an archive ("dir/sub/File.java") instead of a directory.
+
+    read(name) returns the text of a .gitignore member; without it .gitignore
+    files are not applied.
+    """
+    excludes = set(excludes)
+    rules = {}
+    if read is not None:
+        for name in names:
+            if name.rpartition("/")[2] == ".gitignore":
+                compiled = compile_gitignore(read(name).splitlines())
+                if compiled:
+                    rules[name.rpartition("/")[0]] = compiled
+    for name in sorted(names):
+        if name.endswith("/") or not name.endswith(extensions):
+            continue
+        parts = name.split("/")
+        if any(part in excludes for part in parts[:-1]):
+            continue
+        # Check every enclosing directory, then the file, against the rules above it
+        ignore_stack = []
+        for depth in range(len(parts)):
+            base = "/".join(parts[:depth])
+            if base in rules:
+                ignore_stack = ignore_stack + [(base, rules[base])]
+            if _ignored("/".join(parts[:depth + 1]), depth < len(parts) - 1, ignore_stack):
+                break
+        else:
+            yield name
+
+
+def is_excluded(path, root_dir, excludes=DEFAULT_EXCLUDES):
+    """True when any directory between root_dir and path is in the exclude list"""
+    rel = os.path.relpath(os.path.abspath(path), os.path.abspath(root_dir))
+    return any(part in excludes for part in rel.split(os.sep)[:-1])
+
+
+def is_cft_template(path, sniff_bytes=SNIFF_BYTES):
+    """Cheaply decide whether a YAML/JSON file is a CloudFormation template from its header"""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(sniff_bytes)
+    except OSError:
+        return False
+    return CFT_MARKER_RE.search(header) is not None
+
+
+def excludes_from_env():
+    """Default excludes plus any comma-separated names in $SCAN_EXCLUDES"""
+    extra = [name.strip() for name in os.getenv("SCAN_EXCLUDES", "").split(",") if name.strip()]
+    return tuple(DEFAULT_EXCLUDES) + tuple(extra)
+
+
+def find_java_files(root_dir, excludes=None):
+    return list(walk(root_dir, JAVA_EXTENSIONS, excludes or excludes_from_env()))
+
+
+def find_cft_files(root_dir, excludes=None):
+    return [path for path in walk(root_dir, CFT_EXTENSIONS, excludes or excludes_from_env()) if is_cft_template(path)]
+
+
+def filter_changed(paths, root_dir, cft=False):
+    """Apply the same exclude list and template sniffing to an explicit file list (e.g. a git diff)"""
+    excludes = excludes_from_env()
+    return [
+        path for path in paths
+        if not is_excluded(path, root_dir, excludes) and (not cft or is_cft_template(path))
+    ]
@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "glitchslayers", "fixes.sqlite3")
+
+
+# Content-addressed on-disk cache for LLM fix results
+class FixCache:
+    def __init__(self, path=None, max_bytes=None, max_age_days=None, enabled=None):
+        self.path = path or os.getenv("FIX_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("FIX_CACHE_MAX_MB", "512")) * 1024 * 1024)
+        self.max_age_days = max_age_days if max_age_days is not None else float(os.getenv("FIX_CACHE_MAX_AGE_DAYS", "30"))
+        self.enabled = enabled if enabled is not None else os.getenv("FIX_CACHE_DISABLED", "") == ""
+        self.hits = 0
+        self.misses = 0
+        # Optional Telemetry that is told about every hit
+        self.telemetry = None
+        self._conn = None
+
+    @staticmethod
+    def make_key(*parts):
+        """Hash everything that influences the model output into a cache key"""
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fixes ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.commit()
+            self.evict()
+        return self._conn
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        if not self.enabled:
+            return None
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM fixes WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        conn.execute("UPDATE fixes SET accessed = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+        self.hits += 1
+        if self.telemetry is not None:
+            self.telemetry.record_cache_hit(key[:12])
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """Store a JSON-serialisable value under key"""
+        if not self.enabled:
+            return
+        conn = self._connect()
+        data = json.dumps(value)
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO fixes (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, data, len(data), now, now)
+        )
+        conn.commit()
+
+    def evict(self):
+        """Drop entries older than max_age_days, then least recently used ones above max_bytes"""
+        conn = self._conn
+        if conn is None:
+            return
+        if self.max_age_days > 0:
+            conn.execute("DELETE FROM fixes WHERE created < ?", (time.time() - self.max_age_days * 86400,))
+        if self.max_bytes > 0:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM fixes").fetchone()[0]
+            if total > self.max_bytes:
+                freed = 0
+                stale = []
+                for key, size in conn.execute("SELECT key, size FROM fixes ORDER BY accessed ASC"):
+                    if total - freed <= self.max_bytes:
+                        break
+                    stale.append((key,))
+                    freed += size
+                conn.executemany("DELETE FROM fixes WHERE key = ?", stale)
+        conn.commit()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import traceback
+import subprocess
+import contextlib
+from datetime import datetime
+from multiprocessing.managers import BaseManager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import rate_limit
+
+# Runs the Java and CloudFormation pipelines over many repositories listed in a manifest.
+# Each repository is handled by a worker process; workers share one TPM/RPM budget
+# (token buckets served by a manager process) and the on-disk fix cache.
+#
+# Manifest (JSON):
+#   {"defaults": {"base": "main", "stages": ["java", "cft"]},
+#    "repos": [{"name": "payroll", "url": "https://github.com/org/payroll.git", "target": "develop"},
+#              {"name": "infra", "path": "/srv/git/infra.git", "stages": ["cft"], "pr": false}]}
+
+STAGES = ("java", "cft")
+DEFAULTS = {"base": "main", "stages": list(STAGES), "java_root": ".", "pr": True}
+COMMIT_MESSAGE = "Fix security vulnerabilities found by glitchSlayers"
+
+
+class BudgetManager(BaseManager):
+    pass
+
+
+_buckets = {}
+
+
+def _bucket(name, per_minute):
+    """The shared bucket called name, created on first use (runs in the manager process)"""
+    return _buckets.setdefault(name, rate_limit.LockedTokenBucket(per_minute))
+
+
+BudgetManager.register("bucket", callable=_bucket)
+
+# Per-worker state set up by _init_worker
+_worker = {}
+
+
+def load_manifest(path):
+    """Repository entries from a manifest, with defaults, names and branches filled in"""
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {"repos": manifest}
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("repos", []), list) \
+            or not isinstance(manifest.get("defaults", {}), dict):
+        raise ValueError("manifest must be a list of repositories or {\"defaults\": {...}, \"repos\": [...]}")
+    defaults = dict(DEFAULTS, **manifest.get("defaults", {}))
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    entries = []
+    for raw in manifest.get("repos", []):
+        if not isinstance(raw, dict):
+            raise ValueError(f"manifest entry is not an object: {raw!r}")
+        entry = dict(defaults, **raw)
+        entry["source"] = entry.get("url") or entry.get("path")
+        if not isinstance(entry["source"], str) or not entry["source"]:
+            raise ValueError(f"manifest entry without url or path: {raw}")
+        entry.setdefault("name", os.path.basename(entry["source"].rstrip("/\\")).removesuffix(".git"))
+        entry.setdefault("branch", f"security-fixes-{stamp}")
+        entry.setdefault("target", entry["base"])
+        for key in ("name", "base", "branch", "target", "java_root"):
+            if not isinstance(entry[key], str) or not entry[key]:
+                raise ValueError(f"{entry['name']}: '{key}' must be a non-empty string")
+        if not isinstance(entry["stages"], list):
+            raise ValueError(f"{entry['name']}: 'stages' must be a list such as [\"java\", \"cft\"]")
+        unknown = set(entry["stages"]) - set(STAGES)
+        if unknown:
+            raise ValueError(f"{entry['name']}: unknown stages {sorted(unknown)}")
+        entries.append(entry)
+    names = [entry["name"] for entry in entries]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"repository names must be unique: {', '.join(duplicates)}")
+    return entries
+
+
+def _init_worker(address, authkey, tpm, rpm, concurrency):
+    """Connect this worker process to the shared rate budget"""
+    # Log records go to the per-repository log files (see run_repo), not the fleet's console
+    logging.basicConfig(level=logging.INFO, handlers=[logging.NullHandler()])
+    _worker["concurrency"] = concurrency
+    _worker["tokens"] = _worker["requests"] = None
+    if tpm or rpm:
+        manager = BudgetManager(address=address, authkey=authkey)
+        manager.connect()
+        _worker["tokens"] = manager.bucket("tokens", tpm) if tpm else None
+        _worker["requests"] = manager.bucket("requests", rpm) if rpm else None
+
+
+def _share_budget(engine, telemetry):
+    """Point an LLMEngine at the fleet-wide buckets and this repository's telemetry"""
+    engine.concurrency = _worker["concurrency"]
+    engine.controller = rate_limit.RateController(engine.concurrency, tpm=0, rpm=0)
+    engine.controller.tokens = _worker["tokens"]
+    engine.controller.requests = _worker["requests"]
+    engine.telemetry = telemetry
+
+
+def commit_changes(repo, changed, message=COMMIT_MESSAGE):
+    """Stage exactly the changed files through the index and commit them"""
+    repo.index.add([os.path.relpath(os.path.abspath(path), repo.working_tree_dir) for path in dict.fromkeys(changed)])
+    return repo.index.commit(message)
+
+
+def raise_pr(entry, repo_path, changed):
+    """Open a pull request from the entry's branch to its target; returns the PR URL"""
+    body = f"Automated security fixes for {len(changed)} files:\n\n" + "".join(
+        f"- {os.path.relpath(path, repo_path)}\n" for path in dict.fromkeys(changed))
+    result = subprocess.run(
+        ["gh", "pr", "create", "--title", "Security Vulnerability Fixes", "--body", body,
+         "--base", entry["target"], "--head", entry["branch"]],
+        cwd=repo_path, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"gh pr create failed: {result.stderr.strip()}")
+    return result.stdout.strip()
+
+
+def fix_repo(entry, repo_path, telemetry):
+    """Run the entry's stages on a checked-out repository; returns the changed files per stage"""
+    import validation
+    changed = {}
+    with validation.session():
+        if "java" in entry["stages"]:
+            import Java
+            fixer = Java.JavaCodeFixer()
+            fixer.repo_path = repo_path
+            fixer.cache.telemetry = telemetry
+            _share_budget(fixer.engine, telemetry)
+            results = fixer.process_directory(os.path.join(repo_path, entry["java_root"]),
+                                              entry.get("prompt") or Java.DEFAULT_PROMPT)
+            changed["java"] = [r["file"] for r in results if r["modified"]]
+        if "cft" in entry["stages"]:
+            import aws_cft
+            aws_cft.cache.telemetry = telemetry
+            _share_budget(aws_cft.engine, telemetry)
+            changed["cft"] = aws_cft.fix_templates(aws_cft.build_parser().parse_args([]), repo_path)
+    return changed
+
+
+def run_repo(entry, options):
+    """Check out, fix, commit and push one repository; never raises, returns its report entry"""
+    import clone_cache
+    from telemetry import Telemetry
+    started = time.monotonic()
+    report = {"name": entry["name"], "branch": entry["branch"], "status": "failed", "changed": 0}
+    metrics_dir = os.path.join(options["metrics_dir"], entry["name"]) if options["metrics_dir"] else None
+    telemetry = Telemetry(metrics_dir)
+    os.makedirs(options["log_dir"], exist_ok=True)
+    log_path = os.path.join(options["log_dir"], f"{entry['name']}.log")
+    report["log"] = log_path
+    with open(log_path, "w", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+        handler = logging.StreamHandler(log)
+        logging.getLogger().addHandler(handler)
+        repo_path = None
+        try:
+            repo, repo_path = clone_cache.checkout_worktree(entry["source"], entry["base"], entry["branch"])
+            print(f"✅ {entry['source']} checked out to {repo_path} on {entry['branch']}")
+            changed = fix_repo(entry, repo_path, telemetry)
+            files = [path for paths in changed.values() for path in paths]
+            report.update({stage: len(paths) for stage, paths in changed.items()}, changed=len(set(files)))
+            if not files:
+                report["status"] = "no changes"
+            elif options["dry_run"]:
+                report["status"] = "dry run"
+            else:
+                commit_changes(repo, files)
+                repo.remotes.origin.push(refspec=f"{entry['branch']}:{entry['branch']}")
+                print(f"✅ Pushed {len(set(files))} changed files to {entry['branch']}")
+                report["status"] = "pushed"
+                if entry["pr"] and not options["no_pr"]:
+                    report["pr"] = raise_pr(entry, repo_path, files)
+                    report["status"] = "pr"
+        except Exception as e:
+            traceback.print_exc(file=log)
+            # Full traceback is in the log; the report keeps the first line
+            message = str(e).strip().splitlines()
+            report["error"] = type(e).__name__ + (f": {message[0]}" if message else "")
+        finally:
+            if repo_path and not options["keep_worktrees"]:
+                try:
+                    clone_cache.remove_worktree(repo_path)
+                except Exception as e:
+                    print(f"⚠️ Could not remove worktree {repo_path}: {e}")
+            totals = telemetry.totals()
+            for line in telemetry.summary_lines():
+                print(line)
+            telemetry.close()
+            logging.getLogger().removeHandler(handler)
+    report.update(requests=totals["requests"], throttled=totals["throttled"], cost_usd=round(totals["cost_usd"], 4),
+                  seconds=round(time.monotonic() - started, 1))
+    return report
+
+
+def run_fleet(entries, options):
+    """Process entries in a pool of worker processes; returns the per-repo reports in manifest order"""
+    workers = max(1, min(options["workers"], len(entries)))
+    concurrency = max(1, options["concurrency"] // workers)
+    tpm = options["tpm"] or int(os.getenv("LLM_TPM_LIMIT", "0"))
+    rpm = options["rpm"] or int(os.getenv("LLM_RPM_LIMIT", "0"))
+    print(f"🚚 {len(entries)} repositories, {workers} workers, {concurrency} requests in flight per worker"
+          + (f", {tpm} TPM" if tpm else "") + (f", {rpm} RPM" if rpm else ""))
+
+    manager = None
+    address = authkey = None
+    if tpm or rpm:
+        authkey = os.urandom(32)
+        manager = BudgetManager(authkey=authkey)
+        manager.start()
+        address = manager.address
+    reports = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(address, authkey, tpm, rpm, concurrency)) as pool:
+            futures = {pool.submit(run_repo, entry, options): entry for entry in entries}
+            for completed, future in enumerate(as_completed(futures), 1):
+                entry = futures[future]
+                try:
+                    report = future.result()
+                except Exception as e:
+                    # The worker process itself died (e.g. killed for memory)
+                    report = {"name": entry["name"], "status": "failed", "changed": 0, "error": f"worker crashed: {e}"}
+                reports[entry["name"]] = report
+                icon = "❌" if report["status"] == "failed" else "✅"
+                detail = report.get("error") or (f"{report['changed']} files changed, {report.get('requests', 0)} "
+                                                 f"requests, {report.get('seconds', 0)}s")
+                print(f"[{completed}/{len(entries)}] {icon} {entry['name']}: {report['status']} ({detail})")
+    finally:
+        if manager is not None:
+            manager.shutdown()
+    return [reports[entry["name"]] for entry in entries]
+
+
+def build_parser(parser=None):
+    """Add the fleet options to parser (a new one by default)"""
+    parser = parser or argparse.ArgumentParser(description="Fix Java and CloudFormation vulnerabilities across many repositories")
+    parser.add_argument("manifest", help="JSON manifest listing the repositories (url or path, base, branch, target, stages)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Repositories processed in parallel")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("LLM_CONCURRENCY", "8")) * 2,
+                        help="Total in-flight Azure OpenAI requests, split across the workers")
+    parser.add_argument("--tpm", type=int, default=0, help="Fleet-wide tokens-per-minute budget (default: $LLM_TPM_LIMIT)")
+    parser.add_argument("--rpm", type=int, default=0, help="Fleet-wide requests-per-minute budget (default: $LLM_RPM_LIMIT)")
+    parser.add_argument("--log-dir", default="fleet-logs", help="Directory for one output log per repository")
+    parser.add_argument("--metrics-dir", metavar="DIR", default=None,
+                        help="Write each repository's LLM trace and Prometheus textfile to DIR/<name>")
+    parser.add_argument("--report", metavar="PATH", default=None, help="Write the per-repository results as JSON")
+    parser.add_argument("--dry-run", action="store_true", help="Fix files in the worktrees but do not commit or push")
+    parser.add_argument("--no-pr", action="store_true", help="Push the fix branches without opening pull requests")
+    parser.add_argument("--keep-worktrees", action="store_true", help="Leave the checked-out worktrees on disk")
+    return parser
+
+
+def run(args):
+    """Run the fleet described by args.manifest; returns 1 if any repository failed"""
+    entries = load_manifest(args.manifest)
+    options = {
+        "workers": args.workers, "concurrency": args.concurrency, "tpm": args.tpm, "rpm": args.rpm,
+        "log_dir": os.path.abspath(args.log_dir),
+        "metrics_dir": os.path.abspath(args.metrics_dir) if args.metrics_dir else None,
+        "dry_run": args.dry_run, "no_pr": args.no_pr, "keep_worktrees": args.keep_worktrees,
+    }
+    started = time.monotonic()
+    reports = run_fleet(entries, options)
+
+    failed = [r for r in reports if r["status"] == "failed"]
+    print("\n=== Fleet Summary ===")
+    print(f"{'repository':<30} {'status':<10} {'files':>6} {'requests':>8} {'cost $':>8} {'seconds':>8}")
+    for r in reports:
+        print(f"{r['name'][:30]:<30} {r['status']:<10} {r['changed']:>6} {r.get('requests', 0):>8} "
+              f"{r.get('cost_usd', 0):>8.3f} {r.get('seconds', 0):>8.1f}")
+    print(f"{len(reports) - len(failed)}/{len(reports)} repositories succeeded, "
+          f"{sum(r['changed'] for r in reports)} files changed in {time.monotonic() - started:.0f}s")
+    for r in failed:
+        print(f"❌ {r['name']}: {r.get('error')} (log: {r.get('log')})")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"repos": reports}, f, indent=2)
+    return 1 if failed else 0
+
+
+def main():
+    return run(build_parser().parse_args())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import os
+import json
+
+JAVA_EXTENSIONS = (".java",)
+CFT_EXTENSIONS = (".yaml", ".yml", ".json")
+STATE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "glitchslayers", "last_scan.json")
+
+
+def _repo_id(repo):
+    """Identify a repository by its origin URL so fresh clones share scan state"""
+    try:
+        return repo.remotes.origin.url
+    except (AttributeError, ValueError):
+        return os.path.abspath(repo.working_tree_dir)
+
+
+def _load_state():
+    try:
+        with open(os.getenv("LAST_SCAN_STATE", STATE_PATH), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def last_scanned_commit(repo_path, kind):
+    """Return the commit recorded by the previous successful scan, or None"""
+    from git import Repo
+    repo = Repo(repo_path, search_parent_directories=True)
+    return _load_state().get(f"{_repo_id(repo)}#{kind}")
+
+
+def record_scanned_commit(repo_path, kind):
+    """Remember HEAD as the last scanned commit for auto mode"""
+    from git import Repo
+    repo = Repo(repo_path, search_parent_directories=True)
+    state_path = os.getenv("LAST_SCAN_STATE", STATE_PATH)
+    state = _load_state()
+    state[f"{_repo_id(repo)}#{kind}"] = repo.head.commit.hexsha
+    os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+
+
+def changed_files(root_dir, since, extensions, kind):
+    """List added or modified files under root_dir since a git ref.
+
+    since may be a ref/commit or "auto", which uses the commit stored by the
+    last successful scan. Returns None when there is nothing to diff against
+    (first auto run), meaning the caller should fall back to a full scan.
+    """
+    # GitPython is only needed for incremental scans, so import it on demand
+    from git import Repo, BadName
+    repo = Repo(root_dir, search_parent_directories=True)
+    auto = since == "auto"
+    if auto:
+        since = last_scanned_commit(root_dir, kind)
+        if since is None:
+            return None
+    try:
+        base = repo.commit(since)
+        # A full SHA is not looked up until the commit is read, so touch it here
+        base.tree
+    except (BadName, ValueError):
+        if not auto:
+            raise
+        # Shallow clones may not contain the recorded commit
+        print(f"Last scanned commit {since} is not available locally, falling back to a full scan")
+        return None
+
+    root = os.path.abspath(root_dir)
+    files = []
+    for diff in base.diff(repo.head.commit):
+        if diff.change_type not in ("A", "M", "R", "C"):
+            continue
+        path = os.path.abspath(os.path.join(repo.working_tree_dir, diff.b_path))
+        if not path.endswith(extensions) or not os.path.isfile(path):
+            continue
+        if os.path.commonpath([root, path]) != root:
+            continue
+        files.append(path)
+    return sorted(files)
@@ -0,0 +1,131 @@
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# Stage modules (and through them openai, GitPython and PyYAML) are imported
+# only once a subcommand that needs them has been chosen, so --help is instant
+# and a Java-only run never touches the CloudFormation repository.
+
+
+def run_java(args):
+    import Java
+    import archives
+    results = Java.run(args)
+    # Fixes to an archive are written to the output archive, there is no branch to publish
+    if archives.is_archive(args.root_dir):
+        return
+    if not args.dry_run and not args.no_pr and any(r["modified"] for r in results):
+        Java.publish_changes(results)
+
+
+def run_cft(args):
+    import aws_cft
+    aws_cft.run(args)
+
+
+def run_fleet(args):
+    import fleet
+    return fleet.run(args)
+
+
+def run_all(args):
+    """Run the Java and CloudFormation stages side by side; each has its own engine and rate budget"""
+    import Java
+    import aws_cft
+    import archives
+    java_args = argparse.Namespace(**vars(args))
+    cft_args = argparse.Namespace(**vars(args))
+    if args.metrics_dir:
+        # Separate directories so the two stages don't overwrite each other's metrics
+        java_args.metrics_dir = os.path.join(args.metrics_dir, "java")
+        cft_args.metrics_dir = os.path.join(args.metrics_dir, "cft")
+    if args.journal:
+        # Likewise for an explicit journal path
+        base, ext = os.path.splitext(args.journal)
+        java_args.journal = f"{base}-java{ext}"
+        cft_args.journal = f"{base}-cft{ext}"
+    archive_out = args.archive_out or (args.archive and archives.default_output(args.archive))
+    if archive_out:
+        # And for the fixed archives, so the stages don't write over each other's output
+        base, ext = os.path.splitext(archive_out)
+        java_args.archive_out = f"{base}-java{ext}"
+        cft_args.archive_out = f"{base}-cft{ext}"
+    stages = [("java", run_java, java_args), ("cft", run_cft, cft_args)]
+
+    failed = []
+    if args.sequential:
+        for name, stage, stage_args in stages:
+            try:
+                stage(stage_args)
+            except Exception as e:
+                print(f"❌ {name} stage failed: {e}")
+                failed.append(name)
+    else:
+        with ThreadPoolExecutor(max_workers=len(stages)) as pool:
+            futures = [(name, pool.submit(stage, stage_args)) for name, stage, stage_args in stages]
+            for name, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"❌ {name} stage failed: {e}")
+                    failed.append(name)
+    return 1 if failed else 0
+
+
+def add_java_arguments(parser):
+    # Java.build_parser needs the Java module; it is light once openai is deferred
+    import Java
+    Java.build_parser(parser)
+    parser.add_argument("--no-pr", action="store_true",
+                        help="Fix files in place without creating a branch, pushing or opening a pull request")
+
+
+def add_cft_arguments(parser):
+    import aws_cft
+    aws_cft.build_parser(parser)
+
+
+def build_parser(argv):
+    parser = argparse.ArgumentParser(prog="glitchslayers",
+                                     description="Fix Java and CloudFormation vulnerabilities using Azure OpenAI")
+    subparsers = parser.add_subparsers(dest="command", metavar="{java,cft,all,fleet}")
+    subparsers.required = True
+    java = subparsers.add_parser("java", help="Fix Java sources in a local directory")
+    cft = subparsers.add_parser("cft", help="Fix CloudFormation templates in the configured repository")
+    both = subparsers.add_parser("all", conflict_handler="resolve",
+                                 help="Run the Java and CloudFormation stages concurrently")
+    many = subparsers.add_parser("fleet", help="Run both stages over every repository in a manifest")
+    # Only the chosen subcommand's options are built, so only its stage module is imported
+    command = next((arg for arg in argv if not arg.startswith("-")), None)
+    if command == "java":
+        add_java_arguments(java)
+    elif command == "cft":
+        add_cft_arguments(cft)
+    elif command == "all":
+        add_java_arguments(both)
+        add_cft_arguments(both)
+        both.add_argument("--sequential", action="store_true",
+                          help="Run the Java stage to completion before starting the CloudFormation stage")
+    elif command == "fleet":
+        import fleet
+        fleet.build_parser(many)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_parser(argv).parse_args(argv)
+    if args.command == "java":
+        run_java(args)
+    elif args.command == "cft":
+        run_cft(args)
+    elif args.command == "fleet":
+        return run_fleet(args)
+    else:
+        return run_all(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import re
+
+CHARS_PER_TOKEN = 4
+IMPORT_RE = re.compile(r"^\s*import\s+(static\s+)?[\w.]+(\.\*)?\s*;", re.MULTILINE)
+PACKAGE_RE = re.compile(r"^\s*package\s+[\w.]+\s*;", re.MULTILINE)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) used for budgeting"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _next_significant(source, i):
+    while i < len(source) and source[i].isspace():
+        i += 1
+    return source[i] if i < len(source) else ""
+
+
+def scan_structure(source):
+    """Walk Java source once, skipping comments and literals.
+
+    Returns (split_points, brace_spans): offsets where the file can be cut
+    between top-level declarations or class members, and (open, close, depth)
+    for every brace pair.
+    """
+    splits = []
+    spans = []
+    stack = []
+    i = 0
+    n = len(source)
+    while i < n:
+        ch = source[i]
+        if source.startswith("//", i):
+            end = source.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        if source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            continue
+        if source.startswith('"""', i):
+            end = source.find('"""', i + 3)
+            i = n if end == -1 else end + 3
+            continue
+        if ch in "\"'":
+            i += 1
+            while i < n and source[i] != ch and source[i] != "\n":
+                i += 2 if source[i] == "\\" else 1
+            i += 1
+            continue
+        if ch == "{":
+            stack.append(i)
+            if len(stack) == 1:
+                splits.append(i + 1)
+        elif ch == "}" and stack:
+            start = stack.pop()
+            spans.append((start, i, len(stack)))
+            if len(stack) <= 1 and _next_significant(source, i + 1) not in (";", ",", ")", "."):
+                splits.append(i + 1)
+        elif ch == ";" and len(stack) <= 1:
+            splits.append(i + 1)
+        i += 1
+    return splits, spans
+
+
+def split_segments(source):
+    """Cut source into consecutive segments at declaration boundaries"""
+    splits, _ = scan_structure(source)
+    segments = []
+    prev = 0
+    for point in splits:
+        if point > prev:
+            segments.append(source[prev:point])
+            prev = point
+    if prev < len(source):
+        segments.append(source[prev:])
+    return segments
+
+
+def chunk_java(source, max_tokens):
+    """Group declaration segments into chunks of at most max_tokens each.
+
+    Concatenating the returned chunks reproduces source exactly. A single
+    member larger than the budget becomes its own (oversized) chunk.
+    """
+    chunks = []
+    current = ""
+    for segment in split_segments(source):
+        if current and estimate_tokens(current + segment) > max_tokens:
+            chunks.append(current)
+            current = ""
+        current += segment
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def file_context(source, limit=1500):
+    """Package, imports and first type declaration line, as prompt context for a chunk"""
+    splits, _ = scan_structure(source)
+    header_end = next((p for p in splits if source[p - 1] == "{"), min(len(source), limit))
+    return source[:header_end][:limit]
+
+
+def merge_imports(source, imports):
+    """Add any import statements not already present after the existing imports"""
+    existing = {m.group(0).strip() for m in IMPORT_RE.finditer(source)}
+    missing = []
+    for line in imports:
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith("import "):
+            line = f"import {line}"
+        if not line.endswith(";"):
+            line += ";"
+        if line not in existing and line not in missing:
+            missing.append(line)
+    if not missing:
+        return source
+    anchors = list(IMPORT_RE.finditer(source)) or list(PACKAGE_RE.finditer(source))
+    insert_at = anchors[-1].end() if anchors else 0
+    block = "".join(f"\n{line}" for line in missing)
+    if insert_at == 0:
+        return block.lstrip("\n") + "\n" + source
+    return source[:insert_at] + block + source[insert_at:]
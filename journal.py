@@ -0,0 +1,129 @@
+import os
+import json
+import hashlib
+import tempfile
+import weakref
+
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", os.path.join(os.path.expanduser("~"), ".cache", "glitchslayers", "journals"))
+
+
+def journal_path(key, stage):
+    """Default journal for a stage run over key (a directory or repository URL), stable across runs"""
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(JOURNAL_DIR, f"{stage}-{digest}.jsonl")
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _disk_hash(path):
+    return file_hash(path) if os.path.exists(path) else None
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# Append-only JSONL record of finished files. Results are streamed back from disk instead of
+# being kept in memory, and a resumed run skips files whose content still matches their entry.
+class Journal:
+    def __init__(self, path=None, root=None, resume=False, hasher=None):
+        """A journal at path (a temporary file by default); resume keeps the entries already in it.
+
+        hasher(path) returns the content hash of a file, or None when it does
+        not exist; files on disk are hashed by default.
+        """
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="glitchslayers-journal-", suffix=".jsonl")
+            os.close(fd)
+            weakref.finalize(self, _remove, path)
+        self.path = path
+        self.root = root
+        self.hasher = hasher or _disk_hash
+        # key -> (byte offset of the latest entry, content hash when it was recorded)
+        self._index = {}
+        self.resumed = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if resume and os.path.exists(path):
+            self._load()
+            self.resumed = len(self._index)
+        else:
+            open(path, "wb").close()
+        self._file = open(path, "ab")
+
+    def _load(self):
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                self._index[entry["path"]] = (offset, entry.get("hash"))
+                offset += len(line)
+        # Drop a line cut off by a crash so the next append starts on a line of its own
+        if offset < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+
+    def key(self, path):
+        """Journal key for a file: relative to root when there is one, so worktree paths may change"""
+        if self.root:
+            return os.path.relpath(os.path.abspath(path), os.path.abspath(self.root)).replace(os.sep, "/")
+        return os.path.normpath(path)
+
+    def append(self, result):
+        """Record a finished file's result entry, with the hash of the file as it is now"""
+        path = result["file"]
+        entry = dict(result, path=self.key(path), hash=self.hasher(path))
+        offset = self._file.tell()
+        self._file.write(json.dumps(entry).encode("utf-8") + b"\n")
+        self._file.flush()
+        self._index[entry["path"]] = (offset, entry["hash"])
+
+    def extend(self, results):
+        for result in results:
+            self.append(result)
+
+    def finished(self, path):
+        """True when path has an entry and has not changed since it was recorded"""
+        record = self._index.get(self.key(path))
+        return record is not None and record[1] is not None and record[1] == self.hasher(path)
+
+    def get(self, path):
+        """The latest entry recorded for path, or None"""
+        record = self._index.get(self.key(path))
+        if record is None:
+            return None
+        self._file.flush()
+        with open(self.path, "rb") as f:
+            f.seek(record[0])
+            return json.loads(f.readline())
+
+    def __contains__(self, path):
+        return self.key(path) in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        """Stream the latest entry of every recorded file, in the order they were recorded"""
+        self._file.flush()
+        latest = {offset for offset, _ in self._index.values()}
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if offset in latest:
+                    yield json.loads(line)
+                offset += len(line)
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,240 @@
+import asyncio
+import os
+import time
+import logging
+from types import SimpleNamespace
+
+from telemetry import Telemetry
+from rate_limit import RateController, is_rate_limited, is_retryable, retry_after
+
+logger = logging.getLogger(__name__)
+
+
+class TruncatedResponse(Exception):
+    """The model stopped because it ran out of max_tokens"""
+    def __init__(self, content, max_tokens=None):
+        super().__init__(f"response truncated at max_tokens={max_tokens} ({len(content)} chars received)")
+        self.content = content
+        self.max_tokens = max_tokens
+
+
+class MalformedResponse(Exception):
+    """The streamed output cannot be the JSON object that was requested"""
+
+
+class JsonProgress:
+    """Incrementally track whether streamed text is a single, complete JSON object"""
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.started = False
+        self.complete = False
+
+    def feed(self, text):
+        for ch in text:
+            if not self.started:
+                if ch.isspace():
+                    continue
+                if ch != "{":
+                    raise MalformedResponse(f"expected a JSON object, got {ch!r}")
+                self.started = True
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.complete = True
+
+
+# Async execution engine shared by the Java and CloudFormation fixers
+class LLMEngine:
+    def __init__(self, client_factory, concurrency=None, streaming=None, telemetry=None):
+        """client_factory returns a fresh AsyncAzureOpenAI client for each run"""
+        self.client_factory = client_factory
+        self.telemetry = telemetry or Telemetry()
+        self.concurrency = concurrency or int(os.getenv("LLM_CONCURRENCY", "8"))
+        self.streaming = streaming if streaming is not None else os.getenv("LLM_STREAMING", "1") != "0"
+        # Abort a stream that produces nothing for this many seconds
+        self.idle_timeout = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", "30"))
+        self.client = None
+        # Built on the first run so a --concurrency override is honoured
+        self.controller = None
+        # A batch_jobs.BatchSession answers requests from batch results instead of the live API
+        self.batch = None
+
+    async def chat(self, label=None, **kwargs):
+        """Send one chat completion within the concurrency and TPM/RPM limits.
+
+        429s, timeouts and 5xx errors are retried with jittered backoff.
+        Raises TruncatedResponse when the model hit max_tokens, so callers
+        can retry with a bigger budget or a smaller input.
+        """
+        if self.batch is not None:
+            response = self.batch.lookup(kwargs)
+            choice = response.choices[0]
+            if choice.finish_reason == "length":
+                raise TruncatedResponse(choice.message.content or "", kwargs.get("max_tokens"))
+            return response
+        cost = self._estimate_tokens(kwargs)
+        attempt = 0
+        while True:
+            queued = time.monotonic()
+            await self.controller.acquire(cost)
+            started = time.monotonic()
+            response = None
+            status = "error"
+            error = None
+            try:
+                if self.streaming:
+                    response = await self._stream(label, **kwargs)
+                else:
+                    response = await self.client.chat.completions.create(**kwargs)
+                choice = response.choices[0]
+                status = "truncated" if choice.finish_reason == "length" else "ok"
+            except MalformedResponse:
+                status = "malformed"
+                raise
+            except Exception as e:
+                error = e
+                status = "throttled" if is_rate_limited(e) else "error"
+            finally:
+                used = self._record(label, kwargs, response, status, time.monotonic() - started,
+                                    started - queued, attempt)
+                await self.controller.release(cost, used)
+            if error is None:
+                break
+            if not is_retryable(error) or attempt >= self.controller.max_retries:
+                raise error
+            hint = retry_after(error)
+            if is_rate_limited(error):
+                self.controller.on_throttle(hint)
+            delay = self.controller.backoff(attempt, hint)
+            attempt += 1
+            logger.warning(f"{label or 'completion'}: {type(error).__name__}, retry {attempt} in {delay:.1f}s "
+                           f"(in-flight limit {int(self.controller.limit)})")
+            await asyncio.sleep(delay)
+        self.controller.on_success()
+        if status == "truncated":
+            raise TruncatedResponse(choice.message.content or "", kwargs.get("max_tokens"))
+        return response
+
+    @staticmethod
+    def _estimate_tokens(kwargs):
+        """Worst-case tokens a request can consume: the prompt plus the full completion budget"""
+        prompt_chars = sum(len(m.get("content") or "") for m in kwargs.get("messages", []))
+        return prompt_chars // 4 + (kwargs.get("max_tokens") or 0)
+
+    def _record(self, label, kwargs, response, status, latency, queue_wait, attempt=0):
+        """Report one call to telemetry, estimating tokens when the API sent no usage; returns tokens used"""
+        usage = getattr(response, "usage", None) if response is not None else None
+        if usage is not None:
+            prompt_tokens = usage.prompt_tokens or 0
+            completion_tokens = usage.completion_tokens or 0
+        else:
+            # Streamed responses only carry usage when the API version supports stream_options
+            prompt_chars = sum(len(m.get("content") or "") for m in kwargs.get("messages", []))
+            completion_chars = len(response.choices[0].message.content or "") if response is not None else 0
+            prompt_tokens = prompt_chars // 4
+            completion_tokens = completion_chars // 4
+        self.telemetry.record_call(label, kwargs.get("model"), status, latency, queue_wait,
+                                   prompt_tokens, completion_tokens, attempt=attempt, estimated=usage is None)
+        return prompt_tokens + completion_tokens
+
+    async def _stream(self, label, **kwargs):
+        """Stream a completion and rebuild a response object shaped like the non-streamed one"""
+        json_mode = (kwargs.get("response_format") or {}).get("type") == "json_object"
+        progress = JsonProgress() if json_mode else None
+        started = time.monotonic()
+        if os.getenv("LLM_STREAM_USAGE", "") not in ("", "0"):
+            kwargs["stream_options"] = {"include_usage": True}
+        stream = await self.client.chat.completions.create(stream=True, **kwargs)
+        parts = []
+        finish_reason = None
+        usage = None
+        chunks = 0
+        iterator = stream.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), self.idle_timeout)
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"no output for {self.idle_timeout:.0f}s while streaming {label or 'completion'}")
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            text = getattr(choice.delta, "content", None) if choice.delta else None
+            if text:
+                parts.append(text)
+                chunks += 1
+                if progress:
+                    # Fail as soon as the output cannot be the requested JSON object
+                    progress.feed(text)
+            finish_reason = choice.finish_reason or finish_reason
+
+        content = "".join(parts)
+        if progress and finish_reason == "stop" and not progress.complete:
+            raise MalformedResponse(f"stream ended with an incomplete JSON object ({len(content)} chars)")
+        logger.info(f"{label or 'completion'}: streamed {chunks} chunks in {time.monotonic() - started:.1f}s "
+                    f"(finish_reason={finish_reason})")
+        message = SimpleNamespace(content=content, role="assistant")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)], usage=usage)
+
+    async def _run_all(self, jobs, on_done=None):
+        if self.controller is None or self.controller.max_in_flight != self.concurrency:
+            self.controller = RateController(self.concurrency)
+        self.controller.bind()
+        async with self.client_factory() as client:
+            self.client = client
+            total = len(jobs)
+            completed = 0
+
+            async def run_job(index, job):
+                nonlocal completed
+                try:
+                    result = await job()
+                except Exception as e:
+                    result = e
+                completed += 1
+                if on_done:
+                    on_done(index, completed, total, result)
+                return result
+
+            try:
+                results = await asyncio.gather(*(run_job(i, job) for i, job in enumerate(jobs)))
+                # Let sibling tasks orphaned by a failed gather (e.g. other chunks of a file) finish
+                # instead of being cancelled when the loop closes
+                orphans = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+                if orphans:
+                    await asyncio.gather(*orphans, return_exceptions=True)
+                return results
+            finally:
+                self.client = None
+
+    def run(self, jobs, on_done=None):
+        """Run zero-argument coroutine factories concurrently.
+
+        Results come back in the same order as jobs. A job that raised is
+        returned as its exception instead of aborting the whole run.
+        """
+        if not jobs:
+            return []
+        return asyncio.run(self._run_all(list(jobs), on_done))
+
+    def run_one(self, job):
+        """Run a single coroutine factory and re-raise its error, if any"""
+        result = self.run([job])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
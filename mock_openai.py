@@ -0,0 +1,221 @@
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Azure OpenAI chat completions endpoint, used by benchmark.py.
+# It answers with canned fixes for the prompts Java.py and aws_cft.py send, at a
+# configurable latency and token rate, and can inject 429s.
+
+SECRET_RE = re.compile(r'"(changeme|hunter2|P@ssw0rd!)"')
+OPEN_CIDR_RE = re.compile(r"0\.0\.0\.0/0")
+FILE_SECTION_RE = re.compile(r"=== File: (.+?) ===\n")
+
+
+def fix_java(code):
+    return SECRET_RE.sub('System.getenv("APP_SECRET")', code)
+
+
+def fix_template(text):
+    return OPEN_CIDR_RE.sub("10.0.0.0/8", text)
+
+
+def _after(text, marker):
+    """Text following marker in a prompt, without the prompt's own indentation on the first line"""
+    return text.split(marker, 1)[1].lstrip(" ") if marker in text else ""
+
+
+def _line_edits(text, fixer):
+    """One {"original", "replacement"} edit per line the canned fixer changes"""
+    edits = []
+    for line in dict.fromkeys(text.split("\n")):
+        fixed = fixer(line)
+        if fixed != line and text.count(line) == 1:
+            edits.append({"original": line, "replacement": fixed})
+    return edits
+
+
+def canned_response(request):
+    """Answer a chat request the way a well-behaved model would for the known prompt shapes"""
+    messages = request.get("messages") or []
+    system = messages[0]["content"] if messages else ""
+    user = messages[-1]["content"] if messages else ""
+    json_mode = (request.get("response_format") or {}).get("type") == "json_object"
+    vulnerabilities = ["Hardcoded credentials"]
+    explanations = ["Read the secret from the environment instead of the source code"]
+
+    if json_mode and "Java files to triage:" in user:
+        parts = FILE_SECTION_RE.split(_after(user, "Java files to triage:\n"))
+        out = {}
+        for path, code in zip(parts[1::2], parts[2::2]):
+            flagged = fix_java(code) != code
+            out[path] = {"vulnerable": flagged, "issues": vulnerabilities if flagged else []}
+        return json.dumps(out)
+    if json_mode and '"edits"' in system + user:
+        java = "Java code to analyze:" in user
+        body = _after(user, "Java code to analyze:\n") if java else _after(user, "nothing needs fixing.").lstrip("\n")
+        edits = _line_edits(body, fix_java if java else fix_template)
+        return json.dumps({"vulnerabilities_found": vulnerabilities if edits else [],
+                           "edits": edits, "explanations": explanations if edits else []})
+    if json_mode and "=== File:" in user:
+        parts = FILE_SECTION_RE.split(_after(user, "Java files to analyze:\n"))
+        out = {}
+        for path, code in zip(parts[1::2], parts[2::2]):
+            code = code[:-2] if code.endswith("\n\n") else code
+            fixed = fix_java(code)
+            out[path] = {"vulnerabilities_found": vulnerabilities if fixed != code else [],
+                         "fixed_code": fixed if fixed != code else "", "explanations": explanations}
+        return json.dumps(out)
+    if json_mode:
+        marker = "Java fragment to analyze:\n" if "Java fragment to analyze:" in user else "Java code to analyze:\n"
+        code = _after(user, marker)
+        fixed = fix_java(code)
+        return json.dumps({"original_code": code, "vulnerabilities_found": vulnerabilities if fixed != code else [],
+                           "fixed_code": fixed, "explanations": explanations if fixed != code else []})
+    # Full CloudFormation template: the template is the last paragraph of the prompt
+    return fix_template(user.split("just return the corrected template.\n\n", 1)[-1])
+
+
+class MockSettings:
+    def __init__(self, latency=0.5, jitter=0.2, tokens_per_sec=300.0, error_rate=0.0, tpm_limit=0,
+                 retry_after_ms=1000):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.tpm_limit = tpm_limit
+        self.retry_after_ms = retry_after_ms
+        self.window = deque()
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0}
+
+    def admit(self, tokens):
+        """False when this request should get a 429 (random injection or simulated TPM quota)"""
+        with self.lock:
+            self.stats["requests"] += 1
+            if random.random() < self.error_rate:
+                self.stats["throttled"] += 1
+                return False
+            if self.tpm_limit:
+                now = time.monotonic()
+                while self.window and now - self.window[0][0] > 60:
+                    self.window.popleft()
+                if sum(t for _, t in self.window) + tokens > self.tpm_limit:
+                    self.stats["throttled"] += 1
+                    return False
+                self.window.append((now, tokens))
+            return True
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    settings = MockSettings()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if not self.path.split("?")[0].endswith("/chat/completions"):
+            self._send_json(404, {"error": {"code": "404", "message": "Resource not found"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        settings = self.settings
+        prompt_tokens = sum(len(m.get("content") or "") for m in request.get("messages", [])) // 4
+        content = canned_response(request)
+        completion_tokens = len(content) // 4
+        if not settings.admit(prompt_tokens + (request.get("max_tokens") or completion_tokens)):
+            self._send_json(429, {"error": {"code": "429", "message": "Requests to the ChatCompletions_Create "
+                                            "Operation have exceeded the token rate limit. (mock)"}},
+                            {"retry-after-ms": str(settings.retry_after_ms),
+                             "retry-after": str(max(1, settings.retry_after_ms // 1000))})
+            return
+
+        finish_reason = "stop"
+        max_tokens = request.get("max_tokens")
+        if max_tokens and completion_tokens > max_tokens:
+            content = content[:max_tokens * 4]
+            completion_tokens = max_tokens
+            finish_reason = "length"
+        time.sleep(max(0.0, settings.latency + random.uniform(-settings.jitter, settings.jitter)))
+
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()),
+                "model": request.get("model", "gpt-35-turbo")}
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        if not request.get("stream"):
+            time.sleep(completion_tokens / settings.tokens_per_sec)
+            self._send_json(200, dict(base, object="chat.completion", usage=usage, choices=[{
+                "index": 0, "finish_reason": finish_reason,
+                "message": {"role": "assistant", "content": content}}]))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def event(choices, **extra):
+            chunk = dict(base, object="chat.completion.chunk", choices=choices, **extra)
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        piece = 64  # characters per chunk, about 16 tokens
+        for i in range(0, len(content), piece):
+            time.sleep(piece / 4 / settings.tokens_per_sec)
+            event([{"index": 0, "delta": {"content": content[i:i + piece]}, "finish_reason": None}])
+        event([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+        if (request.get("stream_options") or {}).get("include_usage"):
+            event([], usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_server(port=0, settings=None):
+    """Serve in a background thread; returns (server, endpoint URL)"""
+    handler = type("Handler", (MockOpenAIHandler,), {"settings": settings or MockSettings()})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the Azure OpenAI chat completions endpoint")
+    parser.add_argument("--port", type=int, default=8089, help="Port to listen on (0 picks a free one)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Random +/- seconds added to the latency")
+    parser.add_argument("--tokens-per-sec", type=float, default=300.0, help="Completion token generation rate")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 429")
+    parser.add_argument("--tpm-limit", type=int, default=0, help="Simulated tokens-per-minute quota (0 = none)")
+    parser.add_argument("--retry-after-ms", type=int, default=1000, help="retry-after-ms sent with each 429")
+    args = parser.parse_args()
+    settings = MockSettings(args.latency, args.jitter, args.tokens_per_sec, args.error_rate, args.tpm_limit,
+                            args.retry_after_ms)
+    server, url = start_server(args.port, settings)
+    # benchmark.py reads this line to find the port
+    print(f"Mock Azure OpenAI listening on {url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(f"Served {settings.stats['requests']} requests ({settings.stats['throttled']} throttled)")
+        server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
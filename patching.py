@@ -0,0 +1,96 @@
+import re
+
+HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+# Appended to a system prompt to ask for edits instead of a regenerated file
+PATCH_INSTRUCTIONS = """
+        Do not return the whole file. Return only the changes as a list of edits:
+        "edits": [{"original": "exact lines copied from the input, including indentation",
+                   "replacement": "the fixed lines"}]
+        Each "original" must appear exactly once in the input; include enough surrounding
+        lines to make it unique. Return an empty "edits" list when nothing needs fixing."""
+
+
+class PatchError(Exception):
+    """An edit or hunk does not match the text it is applied to"""
+
+
+def _find_block(lines, block, hint):
+    """Index where block occurs in lines, searching outward from hint; ignores trailing whitespace"""
+    target = [line.rstrip() for line in block]
+    stripped = [line.rstrip() for line in lines]
+    size = len(target)
+    for distance in range(len(lines) + 1):
+        for start in (hint - distance, hint + distance):
+            if 0 <= start <= len(lines) - size and stripped[start:start + size] == target:
+                return start
+    return None
+
+
+def parse_unified_diff(diff_text):
+    """Parse hunks from a unified diff into [(old_start, old_lines, new_lines)]"""
+    hunks = []
+    current = None
+    for line in diff_text.splitlines():
+        match = HUNK_RE.match(line)
+        if match:
+            current = (int(match.group(1)), [], [])
+            hunks.append(current)
+            continue
+        if current is None or line.startswith(("---", "+++")):
+            continue
+        if line.startswith("\\"):
+            continue
+        tag, body = (line[0], line[1:]) if line else (" ", "")
+        if tag in " -":
+            current[1].append(body)
+        if tag in " +":
+            current[2].append(body)
+    if not hunks:
+        raise PatchError("no hunks found in diff")
+    return hunks
+
+
+def apply_unified_diff(text, diff_text):
+    """Apply a unified diff, validating each hunk's context against text"""
+    lines = text.split("\n")
+    offset = 0
+    for old_start, old_lines, new_lines in parse_unified_diff(diff_text):
+        hint = max(old_start - 1 + offset, 0)
+        start = _find_block(lines, old_lines, hint)
+        if start is None:
+            raise PatchError(f"hunk at line {old_start} does not match the file")
+        lines[start:start + len(old_lines)] = new_lines
+        offset += len(new_lines) - len(old_lines)
+    return "\n".join(lines)
+
+
+def apply_edits(text, edits):
+    """Apply [{"original", "replacement"}] edits; each original must match exactly once"""
+    for i, edit in enumerate(edits, 1):
+        original = edit.get("original", "")
+        replacement = edit.get("replacement", "")
+        if not original.strip():
+            raise PatchError(f"edit {i} has no original text")
+        count = text.count(original)
+        if count == 1:
+            text = text.replace(original, replacement, 1)
+            continue
+        if count > 1:
+            raise PatchError(f"edit {i} matches {count} places")
+        # Fall back to line matching that tolerates trailing whitespace differences
+        lines = text.split("\n")
+        block = original.strip("\n").split("\n")
+        start = _find_block(lines, block, 0)
+        if start is None:
+            raise PatchError(f"edit {i} does not match the file")
+        lines[start:start + len(block)] = replacement.strip("\n").split("\n")
+        text = "\n".join(lines)
+    return text
+
+
+def apply_patch_response(text, response):
+    """Apply whichever patch form the model returned ("edits" or "diff")"""
+    if response.get("diff"):
+        return apply_unified_diff(text, response["diff"])
+    return apply_edits(text, response.get("edits") or [])
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+# Exception class names (from the openai SDK) worth retrying; matched by name so openai stays optional here
+RETRYABLE_ERRORS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError", "TimeoutError"}
+
+
+def is_rate_limited(error):
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable(error):
+    status = getattr(error, "status_code", None)
+    return is_rate_limited(error) or (status is not None and status >= 500) or type(error).__name__ in RETRYABLE_ERRORS
+
+
+def retry_after(error):
+    """Seconds the service asked us to wait (retry-after-ms / retry-after headers), or None"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class TokenBucket:
+    """Continuously refilled budget of per_minute units (tokens or requests)"""
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until amount can be taken; 0 means it can be taken now"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def refund(self, amount):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def drain(self):
+        """Empty the bucket after the service throttled us despite our estimate"""
+        self._refill()
+        self.level = min(self.level, 0.0)
+
+
+class LockedTokenBucket(TokenBucket):
+    """TokenBucket that can be shared between threads, e.g. served to worker processes by a manager"""
+    def __init__(self, per_minute):
+        super().__init__(per_minute)
+        self._lock = threading.Lock()
+
+    def wait_time(self, amount):
+        with self._lock:
+            return super().wait_time(amount)
+
+    def take(self, amount):
+        with self._lock:
+            super().take(amount)
+
+    def refund(self, amount):
+        with self._lock:
+            super().refund(amount)
+
+    def drain(self):
+        with self._lock:
+            super().drain()
+
+
+# Keeps requests within the deployment's TPM/RPM quota and adapts in-flight requests to 429s
+class RateController:
+    def __init__(self, max_in_flight, tpm=None, rpm=None, max_retries=None, base_delay=None, max_delay=None):
+        self.max_in_flight = max_in_flight
+        # AIMD: start at the ceiling, halve on throttling, creep back up by one per window of successes
+        self.limit = float(max_in_flight)
+        tpm = tpm if tpm is not None else int(os.getenv("LLM_TPM_LIMIT", "0"))
+        rpm = rpm if rpm is not None else int(os.getenv("LLM_RPM_LIMIT", "0"))
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", "6"))
+        self.base_delay = base_delay if base_delay is not None else float(os.getenv("LLM_BACKOFF_BASE", "1"))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv("LLM_BACKOFF_MAX", "60"))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.throttled = 0
+        self._cond = None
+
+    def bind(self):
+        """Create the asyncio primitives for a new event loop; limits and buckets carry over"""
+        self._cond = asyncio.Condition()
+        self.in_flight = 0
+
+    def _wait_time(self, cost):
+        waits = [self.paused_until - time.monotonic()]
+        if self.tokens:
+            waits.append(self.tokens.wait_time(cost))
+        if self.requests:
+            waits.append(self.requests.wait_time(1))
+        return max(waits)
+
+    async def acquire(self, cost):
+        """Wait for an in-flight slot and enough quota for a request estimated at cost tokens"""
+        async with self._cond:
+            while True:
+                if self.in_flight < max(1, int(self.limit)):
+                    delay = self._wait_time(cost)
+                    if delay <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await self._cond.wait()
+            self.in_flight += 1
+            if self.tokens:
+                self.tokens.take(cost)
+            if self.requests:
+                self.requests.take(1)
+
+    async def release(self, cost=0, used=None):
+        """Free the slot; used is the real token count, so the estimate can be settled"""
+        async with self._cond:
+            self.in_flight -= 1
+            if self.tokens and used is not None and used < cost:
+                self.tokens.refund(cost - used)
+            self._cond.notify_all()
+
+    def on_success(self):
+        if self.limit < self.max_in_flight:
+            self.limit = min(self.max_in_flight, self.limit + 1.0 / self.limit)
+
+    def on_throttle(self, wait=None):
+        """Halve the in-flight limit (at most once per second of 429s) and pause everyone"""
+        now = time.monotonic()
+        self.throttled += 1
+        if now - self.last_decrease > 1.0:
+            self.limit = max(1.0, self.limit / 2)
+            self.last_decrease = now
+        if self.tokens:
+            self.tokens.drain()
+        if wait:
+            self.paused_until = max(self.paused_until, now + wait)
+
+    def backoff(self, attempt, hint=None):
+        """Full-jitter exponential backoff, never shorter than the service's retry-after"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, hint or 0.0)
@@ -0,0 +1,104 @@
+import os
+import json
+
+import java_chunker
+
+# Issue statuses that still need a fix
+OPEN_STATUSES = ("OPEN", "REOPENED", "CONFIRMED")
+
+
+def load_issues(report_path):
+    """Read a SonarQube issues report and return the open issues"""
+    with open(report_path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    return [issue for issue in report.get("issues", []) if issue.get("status", "OPEN") in OPEN_STATUSES]
+
+
+def resolve_component(component, root_dir, java_files=None):
+    """Map a Sonar component key (project:relative\\path) to a local file path"""
+    relative = component.split(":", 1)[-1].replace("\\", "/")
+    candidate = os.path.join(root_dir, *relative.split("/"))
+    if os.path.isfile(candidate):
+        return candidate
+    # The report may come from a checkout rooted elsewhere; match on the path suffix
+    suffix = "/" + relative.lstrip("/")
+    for path in java_files or []:
+        if path.replace("\\", "/").endswith(suffix):
+            return path
+    return None
+
+
+def group_by_file(issues, root_dir, java_files=None):
+    """Return {local_path: [issues]}, reporting components that could not be mapped"""
+    grouped = {}
+    for issue in issues:
+        path = resolve_component(issue.get("component", ""), root_dir, java_files)
+        if path is None:
+            print(f"Skipping Sonar issue {issue.get('key')}: {issue.get('component')} not found under {root_dir}")
+            continue
+        grouped.setdefault(path, []).append(issue)
+    return grouped
+
+
+def _line_offsets(source):
+    offsets = [0]
+    for i, ch in enumerate(source):
+        if ch == "\n":
+            offsets.append(i + 1)
+    return offsets
+
+
+def issue_region(source, issue, window=8, max_tokens=None):
+    """Character range of the member enclosing an issue, or a line window around it"""
+    offsets = _line_offsets(source)
+    start_line = issue.get("startLine") or issue.get("line") or 1
+    end_line = issue.get("endLine") or start_line
+    start = offsets[min(start_line, len(offsets)) - 1]
+    end = offsets[end_line] if end_line < len(offsets) else len(source)
+
+    splits, spans = java_chunker.scan_structure(source)
+    members = [(o, c) for o, c, depth in spans if depth == 1 and o <= end and c >= start]
+    if members:
+        open_brace, close_brace = min(members, key=lambda span: span[1] - span[0])
+        member_start = max((p for p in splits if p <= open_brace), default=0)
+        region = (member_start, close_brace + 1)
+        if max_tokens is None or java_chunker.estimate_tokens(source[region[0]:region[1]]) <= max_tokens:
+            return region
+
+    first = max(start_line - window, 1)
+    last = min(end_line + window, len(offsets))
+    return offsets[first - 1], offsets[last] if last < len(offsets) else len(source)
+
+
+def issue_regions(source, issues, max_tokens=None):
+    """Merge the regions of all issues in a file; returns [(start, end, issues)] sorted by start"""
+    regions = sorted(
+        (issue_region(source, issue, max_tokens=max_tokens) + (issue,) for issue in issues),
+        key=lambda r: r[0]
+    )
+    merged = []
+    for start, end, issue in regions:
+        if merged and start < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+            merged[-1][2].append(issue)
+        else:
+            merged.append([start, end, [issue]])
+    return [tuple(r) for r in merged]
+
+
+def issue_prompt(issues, first_line):
+    """Describe the Sonar findings for a region, with line numbers relative to the file"""
+    lines = [f"Fix only these SonarQube issues (the fragment starts at line {first_line} of the file):"]
+    for issue in issues:
+        lines.append(
+            f"- {issue.get('rule')} [{issue.get('severity', '')}] lines {issue.get('startLine')}-{issue.get('endLine')}: "
+            f"{issue.get('message')}"
+        )
+    return "\n".join(lines)
+
+
+def splice(source, replacements):
+    """Apply (start, end, text) replacements, which must not overlap"""
+    for start, end, text in sorted(replacements, key=lambda r: r[0], reverse=True):
+        source = source[:start] + text + source[end:]
+    return source
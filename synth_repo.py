@@ -0,0 +1,145 @@
+import os
+import random
+import argparse
+
+# Generates synthetic Java and CloudFormation repositories of a chosen size for benchmark.py.
+# A share of the files contain the patterns mock_openai.py knows how to "fix".
+
+JAVA_PACKAGES = ("controller", "service", "repository", "model", "util")
+
+
+def _java_method(rng, index, vulnerable):
+    body = [f"    public String handle{index}(String input) {{"]
+    if vulnerable:
+        body.append('        String password = "hunter2";')
+        body.append(f'        String query = "SELECT * FROM t{index} WHERE id = " + input;')
+    for line in range(rng.randint(3, 12)):
+        body.append(f"        int v{line} = input.length() * {rng.randint(1, 99)};")
+    body.append("        return input.trim();")
+    body.append("    }")
+    return body
+
+
+def java_source(rng, package, name, methods, vulnerable):
+    lines = [
+        f"package com.example.{package};",
+        "",
+        "import java.util.List;",
+        "import java.util.ArrayList;",
+        "",
+        f"public class {name} {{",
+        "    private final List<String> items = new ArrayList<>();",
+        "",
+    ]
+    for index in range(methods):
+        # Only the first method carries the vulnerable pattern so each edit stays unique
+        lines.extend(_java_method(rng, index, vulnerable and index == 0))
+        lines.append("")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_java_repo(root, files=100, vulnerable_ratio=0.5, large_ratio=0.05, seed=1):
+    """Write files Java classes under root/src/main/java; a few are large enough to be chunked"""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(files):
+        package = JAVA_PACKAGES[i % len(JAVA_PACKAGES)]
+        directory = os.path.join(root, "src", "main", "java", "com", "example", package)
+        os.makedirs(directory, exist_ok=True)
+        methods = rng.randint(40, 80) if rng.random() < large_ratio else rng.randint(1, 6)
+        name = f"{package.capitalize()}{i}"
+        path = os.path.join(directory, f"{name}.java")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(java_source(rng, package, name, methods, rng.random() < vulnerable_ratio))
+        paths.append(path)
+    return paths
+
+
+def _cft_resources(rng, count, start=0):
+    lines = []
+    for i in range(start, start + count):
+        kind = rng.choice(("sg", "bucket", "queue"))
+        if kind == "sg":
+            lines += [
+                f"  SecurityGroup{i}:",
+                "    Type: AWS::EC2::SecurityGroup",
+                "    Properties:",
+                f"      GroupDescription: group {i}",
+                "      VpcId: !Ref VpcId",
+                "      SecurityGroupIngress:",
+                "        - IpProtocol: tcp",
+                "          FromPort: 443",
+                "          ToPort: 443",
+                f"          CidrIp: 10.{i % 250}.0.0/16",
+            ]
+        elif kind == "bucket":
+            lines += [
+                f"  Bucket{i}:",
+                "    Type: AWS::S3::Bucket",
+                "    Properties:",
+                f"      BucketName: !Sub '${{AWS::StackName}}-bucket-{i}'",
+            ]
+        else:
+            lines += [
+                f"  Queue{i}:",
+                "    Type: AWS::SQS::Queue",
+                "    Properties:",
+                f"      QueueName: queue-{i}",
+            ]
+    return lines
+
+
+def generate_cft_repo(root, templates=20, resources=6, vulnerable_ratio=0.5, seed=1):
+    """Write YAML CloudFormation templates under root/templates"""
+    rng = random.Random(seed)
+    directory = os.path.join(root, "templates")
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(templates):
+        vulnerable = rng.random() < vulnerable_ratio
+        lines = [
+            "AWSTemplateFormatVersion: '2010-09-09'",
+            f"Description: synthetic stack {i}",
+            "Parameters:",
+            "  VpcId:",
+            "    Type: AWS::EC2::VPC::Id",
+            "Resources:",
+        ]
+        # Vulnerable templates open SSH to the world, which the open-ingress rule flags
+        lines += [
+            "  WebSecurityGroup:",
+            "    Type: AWS::EC2::SecurityGroup",
+            "    Properties:",
+            "      GroupDescription: web",
+            "      VpcId: !Ref VpcId",
+            "      SecurityGroupIngress:",
+            "        - IpProtocol: tcp",
+            "          FromPort: 22",
+            "          ToPort: 22",
+            f"          CidrIp: {'0.0.0.0/0' if vulnerable else '10.0.0.0/8'}",
+        ]
+        lines += _cft_resources(rng, max(0, rng.randint(resources // 2, resources) - 1), start=1)
+        path = os.path.join(directory, f"stack{i}.yaml")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Java/CloudFormation repository")
+    parser.add_argument("root", help="Directory to create the repository in")
+    parser.add_argument("--java-files", type=int, default=100)
+    parser.add_argument("--templates", type=int, default=20)
+    parser.add_argument("--resources", type=int, default=6, help="Maximum resources per template")
+    parser.add_argument("--vulnerable-ratio", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    java = generate_java_repo(args.root, args.java_files, args.vulnerable_ratio, seed=args.seed)
+    cft = generate_cft_repo(args.root, args.templates, args.resources, args.vulnerable_ratio, seed=args.seed)
+    print(f"Wrote {len(java)} Java files and {len(cft)} templates to {args.root}")
+
+
+if __name__ == "__main__":
+    main()
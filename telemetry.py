@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import threading
+
+# Azure OpenAI list prices in USD per 1K tokens; override for other deployments
+PROMPT_PRICE_PER_1K = float(os.getenv("LLM_PRICE_PROMPT_PER_1K", "0.0005"))
+COMPLETION_PRICE_PER_1K = float(os.getenv("LLM_PRICE_COMPLETION_PER_1K", "0.0015"))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+# Per-call metrics for chat completions, with a JSON-lines trace and a Prometheus textfile
+class Telemetry:
+    def __init__(self, metrics_dir=None):
+        self.metrics_dir = metrics_dir or os.getenv("LLM_METRICS_DIR") or None
+        self.events = []
+        self.cache_hits = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._trace = None
+
+    @property
+    def trace_path(self):
+        return os.path.join(self.metrics_dir, "llm_trace.jsonl") if self.metrics_dir else None
+
+    @property
+    def prom_path(self):
+        return os.path.join(self.metrics_dir, "llm_metrics.prom") if self.metrics_dir else None
+
+    def _write_trace(self, event):
+        if not self.metrics_dir:
+            return
+        if self._trace is None:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            self._trace = open(self.trace_path, "a", encoding="utf-8")
+        self._trace.write(json.dumps(event) + "\n")
+        self._trace.flush()
+
+    def record_call(self, label, model, status, latency, queue_wait, prompt_tokens, completion_tokens,
+                    attempt=0, estimated=False):
+        """Record one chat completion attempt (including failed and throttled ones)"""
+        event = {
+            "ts": time.time(), "type": "chat", "label": label, "model": model, "status": status,
+            "latency_s": round(latency, 4), "queue_wait_s": round(queue_wait, 4),
+            "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "attempt": attempt, "usage_estimated": estimated,
+            "cost_usd": round(self.cost(prompt_tokens, completion_tokens), 6),
+        }
+        with self._lock:
+            self.events.append(event)
+            self._write_trace(event)
+
+    def record_cache_hit(self, label=None):
+        with self._lock:
+            self.cache_hits += 1
+            self._write_trace({"ts": time.time(), "type": "cache_hit", "label": label})
+
+    @staticmethod
+    def cost(prompt_tokens, completion_tokens):
+        return prompt_tokens / 1000 * PROMPT_PRICE_PER_1K + completion_tokens / 1000 * COMPLETION_PRICE_PER_1K
+
+    def totals(self):
+        calls = [e for e in self.events if e["type"] == "chat"]
+        latencies = [e["latency_s"] for e in calls if e["status"] == "ok"]
+        prompt_tokens = sum(e["prompt_tokens"] for e in calls)
+        completion_tokens = sum(e["completion_tokens"] for e in calls)
+        busy = (max(e["ts"] for e in calls) - min(e["ts"] - e["latency_s"] for e in calls)) if calls else 0.0
+        return {
+            "requests": len(calls),
+            "failures": sum(1 for e in calls if e["status"] not in ("ok", "throttled")),
+            "retries": sum(1 for e in calls if e["attempt"] > 0),
+            "throttled": sum(1 for e in calls if e["status"] == "throttled"),
+            "cache_hits": self.cache_hits,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_sum": sum(latencies),
+            "queue_wait_sum": sum(e["queue_wait_s"] for e in calls),
+            "tokens_per_sec": completion_tokens / busy if busy > 0 else 0.0,
+            "cost_usd": self.cost(prompt_tokens, completion_tokens),
+        }
+
+    def summary_lines(self, slowest=5):
+        """Human-readable end-of-run summary"""
+        t = self.totals()
+        lines = [
+            f"LLM requests: {t['requests']} ({t['failures']} failed, {t['throttled']} throttled, {t['retries']} retries), "
+            f"cache hits: {t['cache_hits']}",
+            f"Tokens: {t['prompt_tokens']} prompt + {t['completion_tokens']} completion, "
+            f"{t['tokens_per_sec']:.1f} completion tokens/sec",
+            f"Latency: p50 {t['latency_p50']:.2f}s, p95 {t['latency_p95']:.2f}s, "
+            f"queue wait {t['queue_wait_sum']:.1f}s total",
+            f"Estimated cost: ${t['cost_usd']:.4f}",
+        ]
+        calls = sorted((e for e in self.events if e["type"] == "chat"), key=lambda e: e["latency_s"], reverse=True)
+        for e in calls[:slowest]:
+            lines.append(f"  slow: {e['latency_s']:.2f}s {e['label']}")
+        return lines
+
+    def write_prometheus(self):
+        """Write counters and latency quantiles in the node_exporter textfile format"""
+        if not self.metrics_dir:
+            return None
+        t = self.totals()
+        by_status = {}
+        for e in self.events:
+            if e["type"] == "chat":
+                key = (e["model"], e["status"])
+                by_status[key] = by_status.get(key, 0) + 1
+        lines = [
+            "# HELP glitchslayers_llm_requests_total Chat completion requests by model and status.",
+            "# TYPE glitchslayers_llm_requests_total counter",
+        ]
+        for (model, status), count in sorted(by_status.items()):
+            lines.append(f'glitchslayers_llm_requests_total{{model="{_escape(model)}",status="{_escape(status)}"}} {count}')
+        lines += [
+            "# TYPE glitchslayers_llm_prompt_tokens_total counter",
+            f"glitchslayers_llm_prompt_tokens_total {t['prompt_tokens']}",
+            "# TYPE glitchslayers_llm_completion_tokens_total counter",
+            f"glitchslayers_llm_completion_tokens_total {t['completion_tokens']}",
+            "# TYPE glitchslayers_llm_retries_total counter",
+            f"glitchslayers_llm_retries_total {t['retries']}",
+            "# TYPE glitchslayers_cache_hits_total counter",
+            f"glitchslayers_cache_hits_total {t['cache_hits']}",
+            "# TYPE glitchslayers_llm_cost_usd_total counter",
+            f"glitchslayers_llm_cost_usd_total {t['cost_usd']:.6f}",
+            "# TYPE glitchslayers_llm_queue_wait_seconds_total counter",
+            f"glitchslayers_llm_queue_wait_seconds_total {t['queue_wait_sum']:.4f}",
+            "# TYPE glitchslayers_llm_latency_seconds summary",
+            f'glitchslayers_llm_latency_seconds{{quantile="0.5"}} {t["latency_p50"]:.4f}',
+            f'glitchslayers_llm_latency_seconds{{quantile="0.95"}} {t["latency_p95"]:.4f}',
+            f"glitchslayers_llm_latency_seconds_sum {t['latency_sum']:.4f}",
+            f"glitchslayers_llm_latency_seconds_count {len([e for e in self.events if e.get('status') == 'ok'])}",
+        ]
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        # Write-then-rename so the collector never reads a half-written file
+        tmp_path = self.prom_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prom_path)
+        return self.prom_path
+
+    def close(self):
+        self.write_prometheus()
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
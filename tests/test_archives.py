@@ -0,0 +1,69 @@
+import zipfile
+
+import pytest
+
+import archives
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "app.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("src/", b"")
+        zf.writestr("src/A.java", b"class A {\r\n}\r\n")
+        zf.writestr("src/B.java", b"class B {}\n")
+        zf.writestr("target/C.java", b"class C {}\n")
+        zf.writestr("cfn/stack.yaml", b"Resources:\n  Q:\n    Type: AWS::SQS::Queue\n")
+        zf.writestr("cfn/config.yaml", b"name: app\n")
+    source = archives.ZipSource(str(path))
+    yield source
+    source.close()
+
+
+def test_is_archive(tmp_path, archive):
+    assert archives.is_archive(archive.path)
+    (tmp_path / "fake.zip").write_text("not a zip")
+    assert not archives.is_archive(str(tmp_path / "fake.zip"))
+    assert not archives.is_archive(str(tmp_path))
+
+
+def test_members_are_found_like_files_on_disk(archive):
+    assert [archive.member(p) for p in archive.find_java_files()] == ["src/A.java", "src/B.java"]
+    assert [archive.member(p) for p in archive.find_cft_files()] == ["cfn/stack.yaml"]
+    assert archive.owns(archive.path_for("src/A.java"))
+
+
+def test_reads_use_universal_newlines_and_see_fixes(archive):
+    path = archive.path_for("src/A.java")
+    assert archive.read(path) == "class A {\n}\n"
+    before = archive.hash(path)
+    archive.write(path, "class A { int x; }\n")
+    assert archive.read(path) == "class A { int x; }\n"
+    assert archive.hash(path) != before
+    assert archive.hash(archive.path_for("src/Missing.java")) is None
+
+
+def test_saved_archive_keeps_other_members_and_line_endings(tmp_path, archive):
+    archive.write(archive.path_for("src/A.java"), "class A {\n  int x;\n}\n")
+    output = tmp_path / "fixed.zip"
+    assert archive.save(str(output)) == 1
+    with zipfile.ZipFile(output) as zf:
+        assert zf.read("src/A.java") == b"class A {\r\n  int x;\r\n}\r\n"
+        assert zf.read("src/B.java") == b"class B {}\n"
+        assert "src/" in zf.namelist()
+    assert not (tmp_path / "fixed.zip.partial").exists()
+
+
+def test_overlay_holds_only_fixed_members(tmp_path, archive):
+    archive.write(archive.path_for("src/B.java"), "class B { }\n")
+    archive.save(str(tmp_path / "overlay"))
+    assert (tmp_path / "overlay" / "src" / "B.java").read_text() == "class B { }\n"
+    assert not (tmp_path / "overlay" / "src" / "A.java").exists()
+
+
+def test_save_refuses_the_input_and_escaping_members(tmp_path, archive):
+    with pytest.raises(ValueError):
+        archive.save(archive.path)
+    archive.fixed["../evil.java"] = "x"
+    with pytest.raises(ValueError):
+        archive.save(str(tmp_path / "overlay"))
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+import batch_jobs
+from batch_jobs import BatchPending, BatchSession
+from llm_engine import LLMEngine
+
+
+class NoClient:
+    """Batch mode answers from the session; the live client is never used"""
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def request(code):
+    return {"model": "m", "response_format": {"type": "json_object"},
+            "messages": [{"role": "user", "content": f"Java code to analyze:\n{code}"}]}
+
+
+def fixer(engine, answers):
+    """process() for run_batched: ask for each code, record the answers, return the codes that finished"""
+    def process(codes):
+        async def ask(code):
+            response = await engine.chat(label=code, **request(code))
+            answers[code] = json.loads(response.choices[0].message.content)
+            return code
+        results = engine.run([(lambda code=code: ask(code)) for code in codes])
+        return [result for result in results if isinstance(result, str)]
+    return process
+
+
+def test_requests_round_trip_through_a_local_batch(tmp_path):
+    engine = LLMEngine(NoClient)
+    session = BatchSession(str(tmp_path), NoClient, local=True)
+    answers = {}
+    codes = ['String pw = "hunter2";', "int x = 1;"]
+    assert batch_jobs.run_batched(engine, session, fixer(engine, answers), codes) == []
+    assert session.submitted == 2 and session.pending == {}
+    # Results are matched back to their own request by custom_id
+    assert {code: answer["original_code"] for code, answer in answers.items()} == {code: code for code in codes}
+    with open(tmp_path / "batch_input_1.jsonl") as f:
+        lines = [json.loads(line) for line in f]
+    assert sorted(line["custom_id"] for line in lines) == sorted(batch_jobs.request_id(request(c)) for c in codes)
+    assert engine.batch is None
+
+
+def test_a_failed_line_fails_only_its_request(tmp_path, monkeypatch):
+    failing = batch_jobs.request_id(request("bad"))
+
+    def run_local(input_path, output_path):
+        with open(input_path) as src, open(output_path, "w") as out:
+            for line in src:
+                custom_id = json.loads(line)["custom_id"]
+                if custom_id == failing:
+                    out.write(json.dumps({"custom_id": custom_id, "error": None, "response": {
+                        "status_code": 400, "body": {"error": {"message": "content filtered"}}}}) + "\n")
+                else:
+                    body = {"choices": [{"finish_reason": "stop", "message": {"content": '{"ok": true}'}}]}
+                    out.write(json.dumps({"custom_id": custom_id, "error": None,
+                                          "response": {"status_code": 200, "body": body}}) + "\n")
+    monkeypatch.setattr(batch_jobs, "run_local", run_local)
+
+    engine = LLMEngine(NoClient)
+    session = BatchSession(str(tmp_path), NoClient, local=True)
+    answers = {}
+    assert batch_jobs.run_batched(engine, session, fixer(engine, answers), ["good", "bad"]) == ["bad"]
+    assert answers == {"good": {"ok": True}}
+    assert "content filtered" in str(session.errors[failing])
+
+
+def test_lookup_queues_unknown_requests_once(tmp_path):
+    session = BatchSession(str(tmp_path), NoClient)
+    for _ in range(2):
+        with pytest.raises(BatchPending):
+            session.lookup(request("x"))
+    assert list(session.pending) == [batch_jobs.request_id(request("x"))]
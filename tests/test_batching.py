@@ -0,0 +1,35 @@
+import batching
+
+SIZES = {"big": 4000, "a": 40, "b": 40, "c": 40, "d": 400, "e": 40}
+
+
+def pack(tmp_path, names, **kwargs):
+    paths = []
+    for name in names:
+        (tmp_path / name).write_text("x" * SIZES[name])
+        paths.append(str(tmp_path / name))
+    singles, batches = batching.pack_small_files(paths, kwargs.pop("small", 50), kwargs.pop("budget", 35), **kwargs)
+    name_of = lambda path: path[len(str(tmp_path)) + 1:]
+    return [name_of(p) for p in singles], [[name_of(p) for p in batch] for batch in batches]
+
+
+def test_small_files_are_packed_in_order_within_the_budget(tmp_path):
+    # 10 tokens each, so three fit in a 35-token batch; the fourth would be a batch of one
+    singles, batches = pack(tmp_path, ["big", "a", "b", "c", "e"])
+    assert batches == [["a", "b", "c"]]
+    assert singles == ["big", "e"]
+
+
+def test_max_files_caps_a_batch(tmp_path):
+    singles, batches = pack(tmp_path, ["a", "b", "c", "e"], max_files=2)
+    assert batches == [["a", "b"], ["c", "e"]]
+    assert singles == []
+
+
+def test_packing_is_disabled_with_a_zero_threshold(tmp_path):
+    singles, batches = pack(tmp_path, ["a", "b"], small=0)
+    assert (singles, batches) == (["a", "b"], [])
+
+
+def test_unreadable_files_count_as_empty(tmp_path):
+    assert batching.estimate_file_tokens(str(tmp_path / "missing.java")) == 0
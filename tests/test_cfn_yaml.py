@@ -0,0 +1,61 @@
+import cfn_yaml
+
+TEMPLATE = """\
+# Buckets for the app
+Resources:
+  Logs:
+    Type: AWS::S3::Bucket
+    Properties:
+      Tags:
+      - Key: env
+        Value: prod
+      - Key: env # second tag
+        Value: prod
+  Data:
+    # the data bucket
+    Type: AWS::S3::Bucket # keep
+    Properties:
+      BucketName: !Sub ${AWS::StackName}-data
+Outputs:
+  DataArn:
+    Value: !GetAtt Data.Arn
+"""
+
+
+def test_round_trip_keeps_short_form_tags():
+    data = cfn_yaml.load(TEMPLATE)
+    assert data["Resources"]["Data"]["Properties"]["BucketName"] == {"Fn::Sub": "${AWS::StackName}-data"}
+    assert cfn_yaml.load(cfn_yaml.dump(data)) == data
+    assert "!GetAtt Data.Arn" in cfn_yaml.dump(data)
+
+
+def test_unchanged_template_keeps_comments_in_place():
+    assert cfn_yaml.dump_like(cfn_yaml.load(TEMPLATE), TEMPLATE) == TEMPLATE
+
+
+def test_comments_stay_on_their_repeated_line():
+    data = cfn_yaml.load(TEMPLATE)
+    data["Resources"]["Logs"]["Properties"]["VersioningConfiguration"] = {"Status": "Enabled"}
+    lines = cfn_yaml.dump_like(data, TEMPLATE).splitlines()
+    types = [i for i, line in enumerate(lines) if line.strip().startswith("Type: AWS::S3::Bucket")]
+    assert lines[types[0]] == "    Type: AWS::S3::Bucket"
+    assert lines[types[1]] == "    Type: AWS::S3::Bucket # keep"
+    assert lines[types[1] - 1] == "    # the data bucket"
+    tags = [line for line in lines if line.strip().startswith("- Key: env")]
+    assert tags == ["      - Key: env", "      - Key: env # second tag"]
+
+
+def test_comment_follows_its_resource_when_an_earlier_one_is_removed():
+    data = cfn_yaml.load(TEMPLATE)
+    del data["Resources"]["Logs"]
+    text = cfn_yaml.dump_like(data, TEMPLATE)
+    assert "    # the data bucket\n    Type: AWS::S3::Bucket # keep\n" in text
+    assert "second tag" not in text
+
+
+def test_unique_line_keeps_its_comment_when_its_path_shifts():
+    original = "Resources:\n  A:\n    Type: AWS::SNS::Topic\n    Properties:\n      Subscription:\n" \
+               "      - Endpoint: a@example.com # owner\n        Protocol: email\n"
+    data = cfn_yaml.load(original)
+    data["Resources"]["A"]["Properties"]["Subscription"].insert(0, {"Endpoint": "b@example.com", "Protocol": "email"})
+    assert "- Endpoint: a@example.com # owner" in cfn_yaml.dump_like(data, original)
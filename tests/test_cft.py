@@ -0,0 +1,77 @@
+import json
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+import cft
+from llm_engine import LLMEngine
+
+ORIGINAL = 'class A {\n    void f(String id) { query("SELECT " + id); }\n}\n'
+FIXED = 'class A {\n    void f(String id) { query("SELECT ?", id); }\n}\n'
+
+
+def response(content):
+    message = SimpleNamespace(content=content, role="assistant")
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=None)
+
+
+class FakeClient:
+    def __init__(self, fixed_code):
+        async def create(**kwargs):
+            return response(json.dumps({"vulnerabilities_found": ["SQL injection"], "fixed_code": fixed_code,
+                                        "explanations": ["bind the id"]}))
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def git(cwd, *args):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def fixer(tmp_path, monkeypatch):
+    """A cft.JavaCodeFixer over a fresh git repository with A.java and B.java committed"""
+    monkeypatch.setattr(cft.cache, "enabled", False)
+    git(tmp_path, "init", "-q")
+    git(tmp_path, "config", "user.email", "dev@example.com")
+    git(tmp_path, "config", "user.name", "dev")
+    (tmp_path / "A.java").write_text(ORIGINAL)
+    (tmp_path / "B.java").write_text(FIXED)
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "initial")
+    fixer = cft.JavaCodeFixer()
+    fixer.repo_path = str(tmp_path)
+    fixer.pushed = []
+    monkeypatch.setattr(fixer, "run_git_command", lambda command, cwd=None: fixer.pushed.append(command))
+    return fixer
+
+
+def test_only_files_the_fix_changes_are_rewritten(tmp_path, fixer):
+    fixer.engine = LLMEngine(lambda: FakeClient(FIXED.replace("\n", "\r\n")), streaming=False)
+    fixer.process_directory(str(tmp_path), "SQL injection")
+    # B.java already is the fixed code, up to line endings
+    assert [r["file"] for r in fixer.results] == [str(tmp_path / "A.java")]
+    assert (tmp_path / "A.java").read_text() == FIXED
+    assert (tmp_path / "B.java").read_text() == FIXED
+
+
+def test_commit_stages_only_the_rewritten_files(tmp_path, fixer):
+    (tmp_path / "A.java").write_text(FIXED)
+    (tmp_path / "untracked.txt").write_text("scratch")
+    fixer.results = [{"file": str(tmp_path / "A.java"), "modified": True}]
+    assert fixer.git_commit_and_push()
+    assert git(tmp_path, "log", "-1", "--format=%s") == "Java Security Fixes via Azure OpenAI"
+    assert git(tmp_path, "diff-tree", "--no-commit-id", "--name-only", "-r", "HEAD") == "A.java"
+    assert git(tmp_path, "status", "--porcelain") == "?? untracked.txt"
+    assert fixer.pushed == [f"git push origin {fixer.branch_name}"]
+
+
+def test_nothing_to_commit(fixer):
+    assert fixer.git_commit_and_push() is False
+    assert fixer.pushed == []
@@ -0,0 +1,75 @@
+import copy
+
+import cft_fanout
+
+TEMPLATE = {
+    "Parameters": {"Env": {"Type": "String"}, "Unused": {"Type": "String"}, "Prefix": {"Type": "String"}},
+    "Mappings": {"Sizes": {"prod": {"Size": 100}}, "Other": {}},
+    "Conditions": {
+        "IsProd": {"Fn::Equals": [{"Ref": "Env"}, "prod"]},
+        "Big": {"Fn::And": [{"Condition": "IsProd"}, {"Fn::Equals": [{"Fn::FindInMap": ["Sizes", "prod", "Size"]}, 100]}]},
+        "Unrelated": {"Fn::Equals": ["a", "b"]},
+    },
+    "Resources": {
+        "Bucket": {"Type": "AWS::S3::Bucket", "Condition": "Big",
+                   "Properties": {"BucketName": {"Fn::Sub": "${Prefix}-${AWS::Region}-data"}}},
+        "Topic": {"Type": "AWS::SNS::Topic", "DependsOn": "Bucket",
+                  "Properties": {"TopicName": {"Fn::GetAtt": ["Bucket", "Arn"]}}},
+    },
+}
+
+
+def test_collect_refs_finds_every_kind():
+    refs = cft_fanout.collect_refs(TEMPLATE["Resources"]["Bucket"])
+    assert refs["refs"] == {"Prefix", "AWS::Region"}
+    assert refs["conditions"] == {"Big"}
+    assert cft_fanout.collect_refs(TEMPLATE["Resources"]["Topic"])["getatts"] == {"Bucket"}
+
+
+def test_sub_with_local_variables_does_not_ref_them():
+    refs = cft_fanout.collect_refs({"Fn::Sub": ["${Name}-${Local}", {"Local": "x"}]})
+    assert refs["refs"] == {"Name"}
+
+
+def test_resource_context_pulls_in_what_the_resource_needs():
+    sub = cft_fanout.resource_context(TEMPLATE, "Bucket")
+    assert list(sub["Resources"]) == ["Bucket"]
+    assert set(sub["Conditions"]) == {"Big", "IsProd"}
+    assert set(sub["Parameters"]) == {"Env", "Prefix"}
+    assert set(sub["Mappings"]) == {"Sizes"}
+
+
+def test_merge_replaces_the_resource_and_adds_new_ones_without_clobbering():
+    template = copy.deepcopy(TEMPLATE)
+    fixed = {
+        "Resources": {
+            "Bucket": {"Type": "AWS::S3::Bucket", "Properties": {"BucketEncryption": {}}},
+            "LogBucket": {"Type": "AWS::S3::Bucket"},
+            "Topic": {"Type": "AWS::SNS::Topic", "Properties": {"TopicName": "clobbered"}},
+        },
+        "Parameters": {"Retention": {"Type": "Number"}},
+    }
+    touched = cft_fanout.merge_fixed(template, "Bucket", fixed)
+    assert touched == ["Bucket", "LogBucket"]
+    assert template["Resources"]["Bucket"] == fixed["Resources"]["Bucket"]
+    assert template["Resources"]["Topic"] == TEMPLATE["Resources"]["Topic"]
+    assert "Retention" in template["Parameters"] and "Env" in template["Parameters"]
+
+
+def test_integrity_of_a_sound_template():
+    assert cft_fanout.check_integrity(TEMPLATE) == []
+
+
+def test_integrity_reports_dangling_references():
+    template = copy.deepcopy(TEMPLATE)
+    del template["Resources"]["Bucket"]
+    template["Resources"]["Topic"]["Properties"]["DisplayName"] = {"Fn::FindInMap": ["Missing", "a", "b"]}
+    template["Resources"]["Topic"]["Condition"] = "Nope"
+    template["Resources"]["Topic"]["Properties"]["KmsMasterKeyId"] = {"Ref": "Key"}
+    assert sorted(cft_fanout.check_integrity(template)) == [
+        ("Topic", "DependsOn undefined resource 'Bucket'"),
+        ("Topic", "Fn::GetAtt on undefined resource 'Bucket'"),
+        ("Topic", "Ref to undefined 'Key'"),
+        ("Topic", "undefined condition 'Nope'"),
+        ("Topic", "undefined mapping 'Missing'"),
+    ]
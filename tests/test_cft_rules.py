@@ -0,0 +1,93 @@
+import cfn_yaml
+import cft_rules
+
+
+def rules(template):
+    return sorted((f["rule"], f["resource"]) for f in cft_rules.evaluate(template))
+
+
+def test_compliant_template_has_no_findings():
+    template = {"Resources": {
+        "Bucket": {"Type": "AWS::S3::Bucket", "Properties": {
+            "BucketEncryption": {"ServerSideEncryptionConfiguration": []},
+            "LoggingConfiguration": {"DestinationBucketName": {"Ref": "Logs"}},
+        }},
+        "Group": {"Type": "AWS::EC2::SecurityGroup", "Properties": {
+            "SecurityGroupIngress": [{"IpProtocol": "tcp", "FromPort": 443, "ToPort": 443, "CidrIp": "10.0.0.0/8"}],
+        }},
+    }}
+    assert cft_rules.evaluate(template) == []
+
+
+def test_iam_wildcards_outside_trust_policies():
+    statement = {"Effect": "Allow", "Action": "s3:*", "Resource": "*"}
+    template = {"Resources": {"Role": {"Type": "AWS::IAM::Role", "Properties": {
+        "AssumeRolePolicyDocument": {"Statement": [dict(statement, Action="sts:*")]},
+        "Policies": [{"PolicyDocument": {"Statement": [statement, {"Effect": "Deny", "Action": "*"}]}}],
+    }}}}
+    findings = cft_rules.evaluate(template)
+    assert sorted(f["rule"] for f in findings) == ["iam-wildcard-action", "iam-wildcard-resource"]
+    assert all("AssumeRolePolicyDocument" not in f["path"] for f in findings)
+
+
+def test_open_ingress_and_public_ips():
+    template = {"Resources": {
+        "Group": {"Type": "AWS::EC2::SecurityGroup", "Properties": {
+            "SecurityGroupIngress": [{"FromPort": 22, "ToPort": 22, "CidrIp": "0.0.0.0/0"}]}},
+        "Rule": {"Type": "AWS::EC2::SecurityGroupIngress", "Properties": {"CidrIpv6": "::/0"}},
+        "Subnet": {"Type": "AWS::EC2::Subnet", "Properties": {"MapPublicIpOnLaunch": True}},
+    }}
+    assert rules(template) == [("assign-public-ip", "Subnet"), ("open-ingress", "Group"), ("open-ingress", "Rule")]
+
+
+def test_hardcoded_secrets_but_not_references():
+    template = {
+        "Parameters": {
+            "DbPassword": {"Type": "String", "Default": "hunter2"},
+            "ApiToken": {"Type": "String", "NoEcho": True},
+        },
+        "Resources": {"Db": {"Type": "AWS::RDS::DBInstance", "Properties": {
+            "StorageEncrypted": True,
+            "MasterUserPassword": "hunter2",
+            "MasterUserSecretArn": "arn:aws:secretsmanager:::secret:x",
+            "MasterUsername": {"Ref": "User"},
+            "TdePassword": "{{resolve:secretsmanager:db}}",
+        }}},
+    }
+    findings = cft_rules.evaluate(template)
+    assert sorted(f["path"] for f in findings) == [
+        "Parameters.DbPassword.Default", "Parameters.DbPassword.NoEcho", "Properties.MasterUserPassword",
+    ]
+
+
+def test_encryption_and_logging():
+    template = {"Resources": {
+        "Volume": {"Type": "AWS::EC2::Volume", "Properties": {"Encrypted": "false"}},
+        "Bucket": {"Type": "AWS::S3::Bucket", "Properties": {}},
+        "Task": {"Type": "AWS::ECS::TaskDefinition", "Properties": {
+            "ContainerDefinitions": [{"Name": "app"}, {"Name": "sidecar", "LogConfiguration": {}}]}},
+    }}
+    assert rules(template) == [("missing-logging", "Bucket"), ("missing-logging", "Task"),
+                               ("unencrypted-volume", "Bucket"), ("unencrypted-volume", "Volume")]
+
+
+def test_empty_properties_and_odd_resources():
+    template = cfn_yaml.load(
+        "Resources:\n"
+        "  Group:\n    Type: AWS::EC2::SecurityGroup\n    Properties:\n"
+        "  Instance:\n    Type: AWS::EC2::LaunchTemplate\n    Properties:\n      LaunchTemplateData:\n"
+        "  Bucket:\n    Type: AWS::S3::Bucket\n    Properties:\n"
+        "  Broken: just a string\n"
+    )
+    assert template["Resources"]["Group"]["Properties"] is None
+    assert rules(template) == [("missing-logging", "Bucket"), ("unencrypted-volume", "Bucket")]
+
+
+def test_non_templates_are_ignored():
+    assert cft_rules.evaluate({"foo": "bar"}) == []
+    assert cft_rules.evaluate(["Resources"]) == []
+
+
+def test_format_findings():
+    finding = {"rule": "open-ingress", "resource": "Group", "path": "Properties", "message": "open"}
+    assert cft_rules.format_findings([finding]) == "- [open-ingress] Group at Properties: open\n"
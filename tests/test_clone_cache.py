@@ -0,0 +1,62 @@
+import os
+import subprocess
+
+import pytest
+
+import clone_cache
+
+
+def git(cwd, *args):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def origin(tmp_path, monkeypatch):
+    monkeypatch.setattr(clone_cache, "MIRROR_ROOT", str(tmp_path / "cache" / "mirrors"))
+    monkeypatch.setattr(clone_cache, "WORKTREE_ROOT", str(tmp_path / "cache" / "worktrees"))
+    path = tmp_path / "origin"
+    path.mkdir()
+    git(path, "init", "-q", "-b", "main")
+    git(path, "config", "user.email", "dev@example.com")
+    git(path, "config", "user.name", "dev")
+    (path / "App.java").write_text("class App {}\n")
+    git(path, "add", ".")
+    git(path, "commit", "-q", "-m", "initial")
+    return path
+
+
+def test_worktrees_are_added_on_the_mirror_and_removed(origin):
+    repo, path = clone_cache.checkout_worktree(str(origin), "main", "security-fixes-1")
+    assert os.path.dirname(path) == clone_cache.WORKTREE_ROOT
+    assert repo.active_branch.name == "security-fixes-1"
+    assert repo.head.commit.hexsha == git(origin, "rev-parse", "main")
+    assert os.path.isfile(os.path.join(path, "App.java"))
+    mirror = os.path.join(clone_cache.MIRROR_ROOT, os.listdir(clone_cache.MIRROR_ROOT)[0])
+    assert path in git(mirror, "worktree", "list")
+
+    clone_cache.remove_worktree(path)
+    assert not os.path.exists(path)
+    assert path not in git(mirror, "worktree", "list")
+    assert git(mirror, "branch", "--list", "security-fixes-1") == ""
+
+
+def test_the_mirror_is_reused_and_refreshed(origin):
+    _, first = clone_cache.checkout_worktree(str(origin), "main", "fixes-a")
+    clone_cache.remove_worktree(first)
+    (origin / "App.java").write_text("class App { int updated; }\n")
+    git(origin, "commit", "-q", "-am", "update")
+    repo, second = clone_cache.checkout_worktree(str(origin), "main", "fixes-b")
+    assert len(os.listdir(clone_cache.MIRROR_ROOT)) == 1
+    assert repo.head.commit.hexsha == git(origin, "rev-parse", "main")
+    clone_cache.remove_worktree(second)
+
+
+def test_stale_worktrees_are_cleaned_up(origin):
+    _, path = clone_cache.checkout_worktree(str(origin), "main", "abandoned")
+    mirror = clone_cache.update_mirror(str(origin))
+    clone_cache.cleanup_worktrees(mirror, max_age_hours=1)
+    assert os.path.isdir(path)
+    os.utime(path, (0, 0))
+    clone_cache.cleanup_worktrees(mirror, max_age_hours=1)
+    assert not os.path.exists(path)
+    assert git(mirror.git_dir, "branch", "--list", "abandoned") == ""
@@ -0,0 +1,90 @@
+import pytest
+
+import dedup
+import patching
+
+LEADER = """\
+public class UserDao {
+    // look up a user
+    public User find(String id) {
+        return query("SELECT * FROM users WHERE id = " + id);
+    }
+}
+"""
+# Same code with other declared names, comments and spacing
+RENAMED = """\
+public class OrderDao {
+    public User  find(String orderId) {
+        // orders by id
+        return query("SELECT * FROM users WHERE id = " + orderId);
+    }
+}
+"""
+FIXED_LEADER = LEADER.replace('query("SELECT * FROM users WHERE id = " + id)',
+                              'query("SELECT * FROM users WHERE id = ?", id)')
+
+
+def near(n):
+    methods = "".join(f"    public int m{i}(int v) {{ return v * {i} + offset; }}\n" for i in range(n))
+    return f"public class Calc {{\n    private int offset = 1;\n{methods}}}\n"
+
+
+def test_exact_duplicates_differ_only_in_names_comments_and_spacing():
+    groups = dedup.group_duplicates({"a/UserDao.java": LEADER, "b/OrderDao.java": RENAMED})
+    assert groups == {"a/UserDao.java": [("b/OrderDao.java", True)]}
+
+
+def test_member_and_type_references_stay_significant():
+    logged = LEADER.replace('return query("SELECT * FROM users WHERE id = " + id);',
+                            'Logger.getLogger("users").info(id); return null;')
+    executed = logged.replace('Logger.getLogger("users").info(id)', 'Runtime.getRuntime().exec(id)')
+    assert dedup.normalize(logged, "java")[0] != dedup.normalize(executed, "java")[0]
+    groups = dedup.group_duplicates({"A.java": logged, "B.java": executed})
+    assert ("B.java", True) not in groups.get("A.java", [])
+    returns_order = RENAMED.replace("public User", "public Order")
+    assert dedup.group_duplicates({"A.java": LEADER, "B.java": returns_order}, threshold=1) == {}
+
+
+def test_different_files_are_not_grouped():
+    groups = dedup.group_duplicates({"A.java": LEADER, "B.java": near(3)})
+    assert groups == {}
+
+
+def test_near_duplicates_are_grouped_but_not_exact():
+    changed = near(30).replace("v * 7 + offset", "v * 7 - offset")
+    groups = dedup.group_duplicates({"A.java": near(30), "B.java": changed}, threshold=0.7)
+    assert groups == {"A.java": [("B.java", False)]}
+    assert dedup.group_duplicates({"A.java": near(30), "B.java": changed}, threshold=1) == {}
+
+
+def test_templates_group_across_logical_ids():
+    first = "Resources:\n  LogsBucket:\n    Type: AWS::S3::Bucket\n    Properties:\n      BucketName: logs\n"
+    second = first.replace("LogsBucket", "DataBucket")
+    assert dedup.group_duplicates({"dev.yaml": first, "prod.yaml": second}) == {"dev.yaml": [("prod.yaml", True)]}
+    # Property names belong to the resource type and are not renamed
+    other = first.replace("BucketName", "AccessControl")
+    assert dedup.group_duplicates({"dev.yaml": first, "prod.yaml": other}, threshold=1) == {}
+
+
+def test_transfer_fix_renames_into_the_duplicate():
+    fixed = dedup.transfer_fix(LEADER, FIXED_LEADER, RENAMED, "java", exact=True)
+    assert 'query("SELECT * FROM users WHERE id = ?", orderId);' in fixed
+    assert "// orders by id" in fixed
+    assert "public User  find(String orderId) {" in fixed
+
+
+def test_transfer_fix_keeps_crlf_line_endings():
+    member = RENAMED.replace("\n", "\r\n")
+    fixed = dedup.transfer_fix(LEADER, FIXED_LEADER, member, "java", exact=True)
+    assert fixed.count("\r\n") == member.count("\r\n")
+
+
+def test_transfer_fix_rejects_lines_missing_from_the_duplicate():
+    member = RENAMED.replace('return query("SELECT * FROM users WHERE id = " + orderId);', "return null;")
+    with pytest.raises(patching.PatchError):
+        dedup.transfer_fix(LEADER, FIXED_LEADER, member, "java", exact=False)
+
+
+def test_transfer_fix_rejects_a_no_op():
+    with pytest.raises(patching.PatchError):
+        dedup.transfer_fix(LEADER, LEADER, RENAMED, "java", exact=True)
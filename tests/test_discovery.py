@@ -0,0 +1,66 @@
+import os
+
+import discovery
+
+
+def make_tree(root, files):
+    for name, text in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+
+
+def relative(paths, root):
+    return sorted(os.path.relpath(path, root).replace(os.sep, "/") for path in paths)
+
+
+def test_java_files_skip_excluded_and_gitignored_paths(tmp_path, monkeypatch):
+    monkeypatch.delenv("SCAN_EXCLUDES", raising=False)
+    make_tree(tmp_path, {
+        "src/A.java": "", "src/gen/B.java": "", "src/gen/Keep.java": "", "target/C.java": "",
+        "lib/D.java": "", "notes.txt": "",
+        ".gitignore": "lib/\n", "src/.gitignore": "gen/*\n!gen/Keep.java\n",
+    })
+    assert relative(discovery.find_java_files(str(tmp_path)), tmp_path) == ["src/A.java", "src/gen/Keep.java"]
+
+
+def test_anchored_directory_patterns_match_only_at_their_root(tmp_path, monkeypatch):
+    monkeypatch.delenv("SCAN_EXCLUDES", raising=False)
+    make_tree(tmp_path, {
+        "gen/A.java": "", "src/gen/B.java": "", "logs/C.java": "", "src/logs/D.java": "", "src/E.java": "",
+        ".gitignore": "/gen/\nlogs/\n",
+    })
+    assert relative(discovery.find_java_files(str(tmp_path)), tmp_path) == ["src/E.java", "src/gen/B.java"]
+    members = discovery.walk_members(["gen/A.java", "src/gen/B.java", ".gitignore"], discovery.JAVA_EXTENSIONS,
+                                     read=lambda name: "/gen/\n")
+    assert list(members) == ["src/gen/B.java"]
+
+
+def test_scan_excludes_from_the_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("SCAN_EXCLUDES", "legacy, vendor")
+    make_tree(tmp_path, {"src/A.java": "", "legacy/B.java": "", "vendor/C.java": ""})
+    assert relative(discovery.find_java_files(str(tmp_path)), tmp_path) == ["src/A.java"]
+
+
+def test_templates_are_sniffed_from_their_header(tmp_path):
+    make_tree(tmp_path, {
+        "stack.yaml": "AWSTemplateFormatVersion: '2010-09-09'\nResources: {}\n",
+        "sam.yml": "Transform: AWS::Serverless-2016-10-31\n",
+        "plain.json": '{"Resources": {}}',
+        "config.yaml": "name: app\nreplicas: 2\n",
+        "package.json": '{"name": "app"}',
+    })
+    assert relative(discovery.find_cft_files(str(tmp_path)), tmp_path) == ["plain.json", "sam.yml", "stack.yaml"]
+
+
+def test_archive_members_follow_the_same_rules():
+    names = ["src/A.java", "src/gen/B.java", "target/C.java", "src/.gitignore", "docs/", "src/D.txt"]
+    members = discovery.walk_members(names, discovery.JAVA_EXTENSIONS, read=lambda name: "gen/\n")
+    assert list(members) == ["src/A.java"]
+
+
+def test_filter_changed_applies_excludes_and_sniffing(tmp_path):
+    make_tree(tmp_path, {"a.yaml": "Resources:\n  X: {}\n", "b.yaml": "x: 1\n", "build/c.yaml": "Resources: {}\n"})
+    paths = [str(tmp_path / name) for name in ("a.yaml", "b.yaml", "build/c.yaml")]
+    assert relative(discovery.filter_changed(paths, str(tmp_path), cft=True), tmp_path) == ["a.yaml"]
+    assert relative(discovery.filter_changed(paths, str(tmp_path)), tmp_path) == ["a.yaml", "b.yaml"]
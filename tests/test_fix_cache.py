@@ -0,0 +1,64 @@
+import time
+
+from fix_cache import FixCache
+
+
+def make_cache(tmp_path, **kwargs):
+    kwargs.setdefault("enabled", True)
+    return FixCache(str(tmp_path / "fixes.sqlite3"), **kwargs)
+
+
+def test_key_covers_every_part():
+    key = FixCache.make_key("java", "code", "prompt", "gpt", 0.2, 4000)
+    assert key == FixCache.make_key("java", "code", "prompt", "gpt", 0.2, 4000)
+    assert key != FixCache.make_key("java", "code!", "prompt", "gpt", 0.2, 4000)
+    assert key != FixCache.make_key("java", "code", "prompt", "gpt", 0.3, 4000)
+    assert key != FixCache.make_key("cft", "code", "prompt", "gpt", 0.2, 4000)
+    # Parts are positional
+    assert FixCache.make_key("a", "b") != FixCache.make_key("b", "a")
+
+
+def test_round_trip_and_counters(tmp_path):
+    cache = make_cache(tmp_path)
+    key = FixCache.make_key("java", "code")
+    assert cache.get(key) is None
+    cache.put(key, {"fixed_code": "class A {}", "vulnerabilities_found": ["x"]})
+    assert cache.get(key) == {"fixed_code": "class A {}", "vulnerabilities_found": ["x"]}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_survive_a_new_instance(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("k", [1, 2])
+    cache.close()
+    assert make_cache(tmp_path).get("k") == [1, 2]
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = make_cache(tmp_path, enabled=False)
+    cache.put("k", "v")
+    assert cache.get("k") is None
+    assert not (tmp_path / "fixes.sqlite3").exists()
+
+
+def test_evicts_least_recently_used_above_the_size_limit(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=0)
+    for key in ("a", "b", "c"):
+        cache.put(key, "x" * 100)
+        time.sleep(0.01)
+    cache.get("a")
+    cache.max_bytes = 250
+    cache.evict()
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 100
+    assert cache.get("c") == "x" * 100
+
+
+def test_evicts_entries_older_than_max_age(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("old", 1)
+    cache.put("new", 2)
+    cache._connect().execute("UPDATE fixes SET created = ? WHERE key = 'old'", (time.time() - 40 * 86400,))
+    cache.evict()
+    assert cache.get("old") is None
+    assert cache.get("new") == 2
@@ -0,0 +1,110 @@
+import json
+import os
+import subprocess
+
+import pytest
+
+import clone_cache
+import fleet
+import mock_openai
+import rate_limit
+from llm_engine import LLMEngine
+from telemetry import Telemetry
+
+CONFIG = 'public class Config {\n    String password = "hunter2";\n}\n'
+
+
+def manifest(tmp_path, content):
+    path = tmp_path / "fleet.json"
+    path.write_text(json.dumps(content))
+    return str(path)
+
+
+def test_manifest_entries_get_defaults_names_and_branches(tmp_path):
+    entries = fleet.load_manifest(manifest(tmp_path, {
+        "defaults": {"base": "develop"},
+        "repos": [{"url": "https://github.com/org/payroll.git"},
+                  {"path": "/srv/git/infra/", "name": "infra", "stages": ["cft"], "target": "release", "pr": False}],
+    }))
+    payroll, infra = entries
+    assert (payroll["name"], payroll["source"], payroll["base"], payroll["target"]) == \
+        ("payroll", "https://github.com/org/payroll.git", "develop", "develop")
+    assert payroll["stages"] == ["java", "cft"] and payroll["pr"] is True
+    assert (infra["stages"], infra["target"], infra["pr"]) == (["cft"], "release", False)
+    assert payroll["branch"] == infra["branch"] and payroll["branch"].startswith("security-fixes-")
+    # A bare list is a manifest without defaults
+    assert [e["name"] for e in fleet.load_manifest(manifest(tmp_path, [{"path": "/srv/a.git"}]))] == ["a"]
+
+
+@pytest.mark.parametrize("content, message", [
+    ({"repos": [{"name": "x"}]}, "without url or path"),
+    ({"repos": [{"url": ""}]}, "without url or path"),
+    ({"repos": ["https://github.com/org/a.git"]}, "not an object"),
+    ({"repos": {"url": "a"}}, "manifest must be"),
+    ({"repos": [{"url": "a", "stages": ["java", "python"]}]}, "unknown stages ['python']"),
+    ({"repos": [{"url": "a", "stages": "java"}]}, "'stages' must be a list"),
+    ({"repos": [{"url": "a", "base": None}]}, "'base' must be a non-empty string"),
+    ({"repos": [{"url": "x/a.git"}, {"url": "y/a.git"}]}, "names must be unique: a"),
+])
+def test_bad_manifests_are_rejected(tmp_path, content, message):
+    with pytest.raises(ValueError, match=f".*{message.replace('[', '.').replace(']', '.')}"):
+        fleet.load_manifest(manifest(tmp_path, content))
+
+
+def test_workers_draw_from_one_budget():
+    authkey = os.urandom(32)
+    manager = fleet.BudgetManager(authkey=authkey)
+    manager.start()
+    try:
+        fleet._init_worker(manager.address, authkey, 600, 0, 3)
+        engine = LLMEngine(lambda: None)
+        fleet._share_budget(engine, Telemetry())
+        assert engine.concurrency == 3 and engine.controller.requests is None
+        # Another worker's connection sees what this one took
+        other = fleet.BudgetManager(address=manager.address, authkey=authkey)
+        other.connect()
+        engine.controller.tokens.take(600)
+        assert other.bucket("tokens", 600).wait_time(300) > 0
+    finally:
+        fleet._worker.clear()
+        manager.shutdown()
+
+
+def git(cwd, *args):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def make_repo(path):
+    path.mkdir()
+    git(path, "init", "-q", "-b", "main")
+    git(path, "config", "user.email", "dev@example.com")
+    git(path, "config", "user.name", "dev")
+    (path / "Config.java").write_text(CONFIG)
+    git(path, "add", ".")
+    git(path, "commit", "-q", "-m", "initial")
+    return str(path)
+
+
+def test_dry_run_over_two_local_repositories(tmp_path, monkeypatch):
+    server, url = mock_openai.start_server(settings=mock_openai.MockSettings(latency=0, jitter=0, tokens_per_sec=1e6))
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", url)
+    monkeypatch.setenv("AZURE_OPENAI_KEY", "mock")
+    monkeypatch.setenv("FIX_CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(clone_cache, "MIRROR_ROOT", str(tmp_path / "cache" / "mirrors"))
+    monkeypatch.setattr(clone_cache, "WORKTREE_ROOT", str(tmp_path / "cache" / "worktrees"))
+    sources = [make_repo(tmp_path / name) for name in ("payroll", "billing")]
+    entries = fleet.load_manifest(manifest(tmp_path, {"defaults": {"stages": ["java"]},
+                                                      "repos": [{"path": source} for source in sources]}))
+    options = {"workers": 2, "concurrency": 4, "tpm": 1_000_000, "rpm": 0, "log_dir": str(tmp_path / "logs"),
+               "metrics_dir": None, "dry_run": True, "no_pr": False, "keep_worktrees": False}
+    try:
+        reports = fleet.run_fleet(entries, options)
+    finally:
+        server.shutdown()
+    assert [(r["name"], r["status"], r["changed"]) for r in reports] == [("payroll", "dry run", 1),
+                                                                         ("billing", "dry run", 1)]
+    assert all(r["requests"] >= 1 for r in reports)
+    # Nothing was committed to the sources and the worktrees are gone
+    for source in sources:
+        assert open(os.path.join(source, "Config.java")).read() == CONFIG
+    assert os.listdir(tmp_path / "cache" / "worktrees") == []
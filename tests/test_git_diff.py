@@ -0,0 +1,66 @@
+import os
+import subprocess
+
+import pytest
+
+import git_diff
+
+
+def git(cwd, *args):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setenv("LAST_SCAN_STATE", str(tmp_path / "last_scan.json"))
+    path = tmp_path / "repo"
+    (path / "src").mkdir(parents=True)
+    (path / "other").mkdir()
+    git(path, "init", "-q", "-b", "main")
+    git(path, "config", "user.email", "dev@example.com")
+    git(path, "config", "user.name", "dev")
+    for name in ("src/Keep.java", "src/Gone.java", "src/Old.java", "other/Outside.java"):
+        (path / name).write_text(f"class {os.path.basename(name)[:-5]} {{ int unique{len(name)}; }}\n")
+    git(path, "add", ".")
+    git(path, "commit", "-q", "-m", "initial")
+    return path
+
+
+def commit_changes(path):
+    (path / "src" / "Keep.java").write_text("class Keep { int changed; }\n")
+    (path / "src" / "New.java").write_text("class New {}\n")
+    (path / "src" / "notes.txt").write_text("not java\n")
+    (path / "other" / "Outside.java").write_text("class Outside { int changed; }\n")
+    git(path, "rm", "-q", "src/Gone.java")
+    git(path, "mv", "src/Old.java", "src/Renamed.java")
+    git(path, "add", ".")
+    git(path, "commit", "-q", "-m", "changes")
+
+
+def test_changed_files_keeps_added_modified_and_renamed_files_under_the_root(repo):
+    base = git(repo, "rev-parse", "HEAD")
+    commit_changes(repo)
+    changed = git_diff.changed_files(str(repo / "src"), base, git_diff.JAVA_EXTENSIONS, "java")
+    assert changed == sorted(str(repo / "src" / name) for name in ("Keep.java", "New.java", "Renamed.java"))
+    everything = git_diff.changed_files(str(repo), base, git_diff.JAVA_EXTENSIONS, "java")
+    assert str(repo / "other" / "Outside.java") in everything
+
+
+def test_auto_uses_the_last_scanned_commit(repo, tmp_path):
+    root = str(repo / "src")
+    # Nothing recorded yet, so the caller does a full scan
+    assert git_diff.changed_files(root, "auto", git_diff.JAVA_EXTENSIONS, "java") is None
+    git_diff.record_scanned_commit(root, "java")
+    assert git_diff.last_scanned_commit(root, "java") == git(repo, "rev-parse", "HEAD")
+    assert git_diff.last_scanned_commit(root, "cft") is None
+    assert git_diff.changed_files(root, "auto", git_diff.JAVA_EXTENSIONS, "java") == []
+    commit_changes(repo)
+    assert len(git_diff.changed_files(root, "auto", git_diff.JAVA_EXTENSIONS, "java")) == 3
+
+
+def test_an_unknown_recorded_commit_falls_back_to_a_full_scan(repo, tmp_path):
+    (tmp_path / "last_scan.json").write_text(f'{{"{os.path.abspath(repo)}#java": "{"0" * 40}"}}')
+    assert git_diff.changed_files(str(repo), "auto", git_diff.JAVA_EXTENSIONS, "java") is None
+    # An explicit ref that does not exist is an error, not a silent full scan
+    with pytest.raises(Exception):
+        git_diff.changed_files(str(repo), "no-such-ref", git_diff.JAVA_EXTENSIONS, "java")
@@ -0,0 +1,137 @@
+import json
+import sys
+import zipfile
+from types import SimpleNamespace
+
+import pytest
+
+import Java
+
+ORIGINAL = 'class A {\n    void f(String id) { query("SELECT " + id); }\n}\n'
+FIXED = 'class A {\n    void f(String id) { query("SELECT ?", id); }\n}\n'
+
+
+def response(content):
+    message = SimpleNamespace(content=content, role="assistant")
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=None)
+
+
+class FakeClient:
+    """Stands in for AsyncAzureOpenAI; create() is answered by handler(**kwargs)"""
+    def __init__(self, handler):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=handler))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+async def fix_everything(**kwargs):
+    return response(json.dumps({"vulnerabilities_found": ["SQL injection"], "fixed_code": FIXED,
+                                "explanations": ["bind the id"]}))
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    """Run the Java stage against handler instead of Azure OpenAI, with its state under tmp_path"""
+    monkeypatch.setenv("FIX_CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setenv("LLM_STREAMING", "0")
+
+    def use(handler):
+        monkeypatch.setattr(Java.JavaCodeFixer, "create_async_client", lambda self, *args: FakeClient(handler))
+    use(fix_everything)
+    return use
+
+
+def requests_for(prompts, answer):
+    """Handler that records each user prompt and answers it with answer(prompt)"""
+    async def handler(**kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        prompts.append(prompt)
+        content = answer(prompt)
+        return response(content if isinstance(content, str) else json.dumps(content))
+    return handler
+
+
+def triage_then_fix(verdict):
+    """Answer triage requests with verdict (or raw text) and fix requests with FIXED"""
+    def answer(prompt):
+        if "Java files to triage:" in prompt:
+            return verdict
+        return {"vulnerabilities_found": ["SQL injection"], "fixed_code": FIXED, "explanations": ["bind the id"]}
+    return answer
+
+
+def main(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["Java.py", *argv])
+    return Java.main()
+
+
+def test_main_fixes_a_directory_and_returns_the_results(tmp_path, monkeypatch, offline):
+    source = tmp_path / "src" / "A.java"
+    source.parent.mkdir()
+    source.write_text(ORIGINAL)
+    results = main(monkeypatch, str(source.parent), "--no-triage", "--journal", str(tmp_path / "j.jsonl"))
+    assert [(r["file"], r["modified"]) for r in results] == [(str(source), True)]
+    assert source.read_text() == FIXED
+
+
+def test_main_writes_fixed_archives_and_returns_nothing_to_publish(tmp_path, monkeypatch, offline):
+    archive = tmp_path / "app.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("src/A.java", ORIGINAL)
+    output = tmp_path / "out.zip"
+    assert main(monkeypatch, str(archive), "--no-triage", "--journal", str(tmp_path / "j.jsonl"),
+                "--archive-out", str(output)) is None
+    with zipfile.ZipFile(output) as zf:
+        assert zf.read("src/A.java").decode() == FIXED
+
+
+def test_a_clean_leader_does_not_make_its_duplicates_clean(tmp_path, monkeypatch, offline):
+    (tmp_path / "A.java").write_text(ORIGINAL)
+    (tmp_path / "B.java").write_text(ORIGINAL.replace("String id", "String key").replace("+ id", "+ key"))
+    prompts = []
+    offline(requests_for(prompts, lambda prompt: {"vulnerabilities_found": [], "fixed_code": "", "explanations": []}))
+    results = main(monkeypatch, str(tmp_path), "--no-triage", "--no-batching", "--journal", str(tmp_path / "j.jsonl"))
+    # Both files reach the model even though B is an exact duplicate of A
+    assert len(prompts) == 2
+    assert sorted(r["file"] for r in results) == [str(tmp_path / "A.java"), str(tmp_path / "B.java")]
+    assert not any("duplicate_of" in r for r in results)
+
+
+def fix_one_file(tmp_path, monkeypatch, offline, verdict):
+    source = tmp_path / "A.java"
+    source.write_text(ORIGINAL)
+    prompts = []
+    offline(requests_for(prompts, triage_then_fix(verdict(str(source)) if callable(verdict) else verdict)))
+    results = main(monkeypatch, str(tmp_path), "--no-batching", "--journal", str(tmp_path / "j.jsonl"))
+    return source, prompts, results
+
+
+def test_a_clean_triage_verdict_skips_the_fix_request(tmp_path, monkeypatch, offline):
+    source, prompts, results = fix_one_file(tmp_path, monkeypatch, offline,
+                                            lambda path: {path: {"vulnerable": False, "issues": []}})
+    assert len(prompts) == 1 and "Java files to triage:" in prompts[0]
+    assert [r["modified"] for r in results] == [False]
+    assert source.read_text() == ORIGINAL
+
+
+def test_flagged_findings_go_into_the_fix_prompt(tmp_path, monkeypatch, offline):
+    issue = "line 2: SQL built by string concatenation"
+    source, prompts, results = fix_one_file(tmp_path, monkeypatch, offline,
+                                            lambda path: {path: {"vulnerable": True, "issues": [issue]}})
+    assert len(prompts) == 2
+    assert f"A first review pass flagged:\n- {issue}" in prompts[1]
+    assert source.read_text() == FIXED
+
+
+@pytest.mark.parametrize("verdict", ["not json", {}, {"Other.java": {"vulnerable": False}}],
+                         ids=["malformed", "empty", "wrong-path"])
+def test_an_unusable_triage_response_falls_back_to_a_full_fix(tmp_path, monkeypatch, offline, verdict):
+    source, prompts, results = fix_one_file(tmp_path, monkeypatch, offline, verdict)
+    assert len(prompts) == 2
+    assert "A first review pass flagged" not in prompts[1]
+    assert [r["modified"] for r in results] == [True]
+    assert source.read_text() == FIXED
@@ -0,0 +1,63 @@
+import java_chunker
+
+SOURCE = """\
+package com.example;
+
+import java.util.List;
+
+public class Service {
+    private static final String SQL = "SELECT * FROM t WHERE a = '{' ";
+
+    // a brace in a comment: {
+    public void one() {
+        if (true) { run(); }
+    }
+
+    public void two() {
+        String s = "}";
+    }
+
+    public int three() {
+        return new int[] {1, 2}.length;
+    }
+}
+"""
+
+
+def test_chunks_reassemble_to_the_source():
+    for budget in (10, 40, 100, 10000):
+        assert "".join(java_chunker.chunk_java(SOURCE, budget)) == SOURCE
+
+
+def test_chunks_are_cut_between_members():
+    chunks = java_chunker.chunk_java(SOURCE, 40)
+    assert len(chunks) > 1
+    for chunk in chunks[1:]:
+        # Every later chunk starts at a member boundary, not inside a method body
+        assert chunk.lstrip().startswith(("//", "public", "}"))
+
+
+def test_small_file_is_a_single_chunk():
+    assert java_chunker.chunk_java(SOURCE, 10000) == [SOURCE]
+
+
+def test_braces_in_literals_and_comments_are_ignored():
+    _, spans = java_chunker.scan_structure(SOURCE)
+    depths = [depth for _, _, depth in spans]
+    # Class body, three method bodies, the if block and the array initialiser
+    assert len(spans) == 6
+    assert depths.count(0) == 1
+
+
+def test_file_context_is_the_header_up_to_the_class():
+    context = java_chunker.file_context(SOURCE)
+    assert context.startswith("package com.example;")
+    assert context.rstrip().endswith("public class Service {")
+
+
+def test_merge_imports_adds_only_missing_ones():
+    merged = java_chunker.merge_imports(SOURCE, ["java.util.List", "import java.util.Map;", "java.util.Map"])
+    assert merged.count("import java.util.List;") == 1
+    assert merged.count("import java.util.Map;") == 1
+    assert merged.index("import java.util.Map;") > merged.index("import java.util.List;")
+    assert java_chunker.merge_imports(SOURCE, ["java.util.List"]) == SOURCE
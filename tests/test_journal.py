@@ -0,0 +1,86 @@
+from journal import Journal
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_finished_until_the_file_changes(tmp_path):
+    source = write(tmp_path / "A.java", "class A {}")
+    journal = Journal(str(tmp_path / "j.jsonl"))
+    assert not journal.finished(source)
+    journal.append({"file": source, "modified": True})
+    assert journal.finished(source)
+    write(tmp_path / "A.java", "class A { int x; }")
+    assert not journal.finished(source)
+
+
+def test_missing_files_never_count_as_finished(tmp_path):
+    journal = Journal(str(tmp_path / "j.jsonl"))
+    journal.append({"file": str(tmp_path / "gone.java"), "modified": False})
+    assert not journal.finished(str(tmp_path / "gone.java"))
+
+
+def test_iteration_and_get_return_the_latest_entries(tmp_path):
+    a = write(tmp_path / "A.java", "a")
+    b = write(tmp_path / "B.java", "b")
+    journal = Journal(str(tmp_path / "j.jsonl"))
+    journal.append({"file": a, "modified": False})
+    journal.append({"file": b, "modified": True})
+    journal.append({"file": a, "modified": True})
+    assert [(entry["file"], entry["modified"]) for entry in journal] == [(b, True), (a, True)]
+    assert journal.get(a)["modified"] is True
+    assert journal.get(str(tmp_path / "C.java")) is None
+    assert len(journal) == 2
+
+
+def test_resume_keeps_entries_and_a_fresh_run_drops_them(tmp_path):
+    a = write(tmp_path / "A.java", "a")
+    path = str(tmp_path / "j.jsonl")
+    journal = Journal(path)
+    journal.append({"file": a, "modified": True})
+    journal.close()
+    resumed = Journal(path, resume=True)
+    assert resumed.resumed == 1 and resumed.finished(a)
+    resumed.close()
+    assert Journal(path).resumed == 0
+    assert not Journal(path).finished(a)
+
+
+def test_resume_drops_a_line_cut_off_by_a_crash(tmp_path):
+    a = write(tmp_path / "A.java", "a")
+    b = write(tmp_path / "B.java", "b")
+    path = tmp_path / "j.jsonl"
+    journal = Journal(str(path))
+    journal.append({"file": a, "modified": True})
+    journal.close()
+    with open(path, "ab") as f:
+        f.write(b'{"file": "B.ja')
+    resumed = Journal(str(path), resume=True)
+    assert resumed.resumed == 1
+    resumed.append({"file": b, "modified": False})
+    assert [entry["file"] for entry in resumed] == [a, b]
+
+
+def test_keys_are_relative_to_the_root(tmp_path):
+    first = tmp_path / "run1"
+    second = tmp_path / "run2"
+    for root in (first, second):
+        (root / "src").mkdir(parents=True)
+        write(root / "src" / "A.java", "a")
+    path = str(tmp_path / "j.jsonl")
+    journal = Journal(path, root=str(first))
+    journal.append({"file": str(first / "src" / "A.java"), "modified": True})
+    journal.close()
+    # A resumed run in another worktree still finds the entry
+    assert Journal(path, root=str(second), resume=True).finished(str(second / "src" / "A.java"))
+
+
+def test_custom_hasher(tmp_path):
+    hashes = {"x!/A.java": "1"}
+    journal = Journal(str(tmp_path / "j.jsonl"), hasher=hashes.get)
+    journal.append({"file": "x!/A.java", "modified": True})
+    assert journal.finished("x!/A.java")
+    hashes["x!/A.java"] = "2"
+    assert not journal.finished("x!/A.java")
@@ -0,0 +1,182 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from llm_engine import LLMEngine, JsonProgress, MalformedResponse, TruncatedResponse
+
+
+def response(content, finish_reason="stop"):
+    message = SimpleNamespace(content=content, role="assistant")
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)], usage=None)
+
+
+class FakeClient:
+    """Stands in for AsyncAzureOpenAI; create() is answered by handler(**kwargs)"""
+    def __init__(self, handler):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=handler))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def engine_for(handler, **kwargs):
+    return LLMEngine(lambda: FakeClient(handler), streaming=False, **kwargs)
+
+
+def ask(engine, content, label=None):
+    return lambda: engine.chat(label=label, model="m", messages=[{"role": "user", "content": content}])
+
+
+def test_results_come_back_in_job_order():
+    async def handler(**kwargs):
+        content = kwargs["messages"][0]["content"]
+        # Later jobs finish first
+        await asyncio.sleep(0.01 * (5 - int(content)))
+        return response(content)
+
+    engine = engine_for(handler)
+    results = engine.run([ask(engine, str(i)) for i in range(5)])
+    assert [r.choices[0].message.content for r in results] == ["0", "1", "2", "3", "4"]
+
+
+def test_failed_job_is_returned_and_reported():
+    async def handler(**kwargs):
+        if kwargs["messages"][0]["content"] == "bad":
+            raise ValueError("boom")
+        return response("ok")
+
+    engine = engine_for(handler)
+    done = []
+    results = engine.run([ask(engine, "good"), ask(engine, "bad"), ask(engine, "good")],
+                         on_done=lambda index, completed, total, result: done.append((index, completed, total)))
+    assert isinstance(results[1], ValueError)
+    assert results[0].choices[0].message.content == "ok"
+    assert sorted(index for index, _, _ in done) == [0, 1, 2]
+    assert [completed for _, completed, _ in done] == [1, 2, 3]
+    assert {total for _, _, total in done} == {3}
+
+
+def test_run_one_reraises():
+    async def handler(**kwargs):
+        raise ValueError("boom")
+
+    engine = engine_for(handler)
+    with pytest.raises(ValueError):
+        engine.run_one(ask(engine, "x"))
+
+
+def test_in_flight_requests_stay_within_concurrency():
+    in_flight = 0
+    peak = 0
+
+    async def handler(**kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return response("ok")
+
+    engine = engine_for(handler, concurrency=3)
+    engine.run([ask(engine, str(i)) for i in range(12)])
+    assert peak == 3
+
+
+def test_empty_run_does_not_open_a_client():
+    engine = LLMEngine(lambda: pytest.fail("client created"))
+    assert engine.run([]) == []
+
+
+class ApiError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def test_throttled_requests_are_retried(monkeypatch):
+    monkeypatch.setenv("LLM_BACKOFF_BASE", "0")
+    calls = 0
+
+    async def handler(**kwargs):
+        nonlocal calls
+        calls += 1
+        if calls < 3:
+            raise ApiError(429)
+        return response("ok")
+
+    engine = engine_for(handler)
+    assert engine.run_one(ask(engine, "x")).choices[0].message.content == "ok"
+    assert calls == 3
+    assert engine.controller.throttled == 2
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    monkeypatch.setenv("LLM_BACKOFF_BASE", "0")
+    calls = 0
+
+    async def handler(**kwargs):
+        nonlocal calls
+        calls += 1
+        raise ApiError(400)
+
+    engine = engine_for(handler)
+    with pytest.raises(ApiError):
+        engine.run_one(ask(engine, "x"))
+    assert calls == 1
+
+
+async def stream_of(*parts, finish_reason="stop"):
+    for i, part in enumerate(parts):
+        last = i == len(parts) - 1
+        choice = SimpleNamespace(delta=SimpleNamespace(content=part), finish_reason=finish_reason if last else None)
+        yield SimpleNamespace(choices=[choice], usage=None)
+
+
+def streaming_engine(*parts, finish_reason="stop"):
+    async def handler(stream=False, **kwargs):
+        assert stream
+        return stream_of(*parts, finish_reason=finish_reason)
+
+    return LLMEngine(lambda: FakeClient(handler), streaming=True)
+
+
+def ask_json(engine):
+    return lambda: engine.chat(model="m", messages=[{"role": "user", "content": "x"}], max_tokens=10,
+                               response_format={"type": "json_object"})
+
+
+def test_streamed_parts_are_joined():
+    engine = streaming_engine('{"a": ', '"b"}')
+    assert engine.run_one(ask_json(engine)).choices[0].message.content == '{"a": "b"}'
+
+
+def test_stream_cut_at_max_tokens_raises_truncated():
+    engine = streaming_engine('{"a": ', '"b', finish_reason="length")
+    with pytest.raises(TruncatedResponse) as info:
+        engine.run_one(ask_json(engine))
+    assert info.value.content == '{"a": "b'
+    assert info.value.max_tokens == 10
+
+
+def test_stream_that_is_not_json_fails_early():
+    engine = streaming_engine("Sure! Here is", " the fix")
+    with pytest.raises(MalformedResponse):
+        engine.run_one(ask_json(engine))
+
+
+def test_stream_ending_inside_the_object_is_malformed():
+    engine = streaming_engine('{"a": [1, 2')
+    with pytest.raises(MalformedResponse):
+        engine.run_one(ask_json(engine))
+
+
+def test_json_progress_ignores_braces_in_strings():
+    progress = JsonProgress()
+    progress.feed(r'  {"code": "if (x) { \"}\" }", ')
+    assert not progress.complete
+    progress.feed('"n": [1]}')
+    assert progress.complete
@@ -0,0 +1,71 @@
+import pytest
+
+import patching
+
+SOURCE = """\
+public class A {
+    void a() {
+        query("SELECT " + x);
+    }
+
+    void b() {
+        query("SELECT " + x);
+    }
+}"""
+
+
+def test_edits_replace_their_unique_original():
+    fixed = patching.apply_edits(SOURCE, [{
+        "original": "    void b() {\n        query(\"SELECT \" + x);",
+        "replacement": "    void b() {\n        query(\"SELECT ?\", x);",
+    }])
+    assert fixed.count('query("SELECT ?", x);') == 1
+    assert fixed.index('query("SELECT " + x);') < fixed.index('query("SELECT ?", x);')
+
+
+def test_ambiguous_or_missing_edits_raise():
+    with pytest.raises(patching.PatchError, match="matches 2 places"):
+        patching.apply_edits(SOURCE, [{"original": 'query("SELECT " + x);', "replacement": "q();"}])
+    with pytest.raises(patching.PatchError, match="does not match"):
+        patching.apply_edits(SOURCE, [{"original": "void c() {", "replacement": "void d() {"}])
+    with pytest.raises(patching.PatchError, match="no original"):
+        patching.apply_edits(SOURCE, [{"original": "  ", "replacement": "x"}])
+
+
+def test_edits_tolerate_trailing_whitespace():
+    fixed = patching.apply_edits(SOURCE, [{"original": "    void a() {   \n", "replacement": "    void a2() {\n"}])
+    assert "void a2() {" in fixed and "void a() {" not in fixed
+
+
+def test_unified_diff_applies_hunks_with_drifted_line_numbers():
+    diff = """\
+--- a/A.java
++++ b/A.java
+@@ -1,3 +1,4 @@
++// checked
+ public class A {
+     void a() {
+         query("SELECT " + x);
+@@ -5,3 +6,3 @@
+ 
+     void b() {
+-        query("SELECT " + x);
++        query("SELECT ?", x);
+"""
+    fixed = patching.apply_unified_diff(SOURCE, diff)
+    assert fixed.startswith("// checked\npublic class A {")
+    assert fixed.count('query("SELECT ?", x);') == 1
+    assert fixed.endswith("}")
+
+
+def test_unified_diff_with_stale_context_raises():
+    with pytest.raises(patching.PatchError):
+        patching.apply_unified_diff(SOURCE, "@@ -1,1 +1,1 @@\n-class B {\n+class C {\n")
+    with pytest.raises(patching.PatchError, match="no hunks"):
+        patching.apply_unified_diff(SOURCE, "just some text")
+
+
+def test_patch_response_picks_its_form():
+    assert patching.apply_patch_response(SOURCE, {"edits": []}) == SOURCE
+    fixed = patching.apply_patch_response(SOURCE, {"diff": "@@ -9,1 +9,1 @@\n-}\n+} // end\n"})
+    assert fixed.endswith("} // end")
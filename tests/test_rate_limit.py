@@ -0,0 +1,97 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limit
+from rate_limit import RateController, TokenBucket
+
+
+class ApiError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+class RateLimitError(Exception):
+    """Named like the openai SDK's exception"""
+
+
+def test_retryable_errors():
+    assert rate_limit.is_rate_limited(ApiError(429))
+    assert rate_limit.is_rate_limited(RateLimitError())
+    assert rate_limit.is_retryable(ApiError(503))
+    assert rate_limit.is_retryable(TimeoutError())
+    assert not rate_limit.is_retryable(ApiError(400))
+    assert not rate_limit.is_retryable(ValueError())
+
+
+def test_retry_after_headers():
+    assert rate_limit.retry_after(ApiError(429, {"retry-after-ms": "1500"})) == 1.5
+    assert rate_limit.retry_after(ApiError(429, {"retry-after": "2"})) == 2.0
+    assert rate_limit.retry_after(ApiError(429, {"retry-after": "soon"})) is None
+    assert rate_limit.retry_after(ValueError()) is None
+
+
+def test_token_bucket_take_and_refund():
+    bucket = TokenBucket(600)
+    assert bucket.wait_time(600) == 0
+    bucket.take(600)
+    # 10 units a second come back
+    assert bucket.wait_time(100) == pytest.approx(10, rel=0.01)
+    bucket.refund(100)
+    assert bucket.wait_time(100) == 0
+    # More than the capacity is capped instead of waiting forever
+    bucket.drain()
+    assert bucket.wait_time(10 ** 6) == pytest.approx(60, rel=0.01)
+
+
+def test_throttling_halves_the_limit_and_successes_restore_it():
+    controller = RateController(8, tpm=0, rpm=0)
+    controller.on_throttle()
+    assert controller.limit == 4
+    # A burst of 429s within a second only halves once
+    controller.on_throttle()
+    assert controller.limit == 4
+    for _ in range(100):
+        controller.on_success()
+    assert controller.limit == 8
+
+
+def test_throttle_hint_pauses_new_requests():
+    controller = RateController(4, tpm=0, rpm=0)
+    controller.on_throttle(wait=30)
+    assert controller._wait_time(0) > 29
+
+
+def test_backoff_respects_the_cap_and_the_hint():
+    controller = RateController(4, tpm=0, rpm=0, base_delay=1, max_delay=5)
+    assert all(0 <= controller.backoff(attempt) <= 5 for attempt in range(10))
+    assert controller.backoff(0, hint=7) == 7
+
+
+def test_acquire_waits_for_a_free_slot():
+    async def scenario():
+        controller = RateController(1, tpm=0, rpm=0)
+        controller.bind()
+        await controller.acquire(0)
+        waiter = asyncio.ensure_future(controller.acquire(0))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        await controller.release()
+        await asyncio.wait_for(waiter, 1)
+        assert controller.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_tpm_quota_is_settled_with_the_real_usage():
+    async def scenario():
+        controller = RateController(4, tpm=1000, rpm=0)
+        controller.bind()
+        await controller.acquire(800)
+        await controller.release(800, used=100)
+        return controller.tokens.wait_time(900)
+
+    assert asyncio.run(scenario()) == 0
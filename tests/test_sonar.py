@@ -0,0 +1,76 @@
+import json
+
+import sonar
+
+SOURCE = """\
+package com.example;
+
+public class Dao {
+    private String table = "users";
+
+    public String find(String id) {
+        return "SELECT * FROM " + table + " WHERE id = " + id;
+    }
+
+    public void log(String msg) {
+        System.out.println(msg);
+    }
+}
+"""
+
+
+def issue(line, end_line=None, rule="java:S2077", key="k"):
+    return {"key": key, "rule": rule, "component": "proj:src/Dao.java", "startLine": line,
+            "endLine": end_line or line, "message": "fix it", "severity": "MAJOR"}
+
+
+def test_load_issues_keeps_open_ones(tmp_path):
+    report = tmp_path / "report.json"
+    report.write_text(json.dumps({"issues": [
+        dict(issue(7), status="OPEN"), dict(issue(11), status="CLOSED"), dict(issue(4), status="REOPENED"), issue(5),
+    ]}))
+    assert [i["startLine"] for i in sonar.load_issues(str(report))] == [7, 4, 5]
+
+
+def test_components_resolve_under_root_or_by_suffix(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "Dao.java").write_text(SOURCE)
+    assert sonar.resolve_component("proj:src/Dao.java", str(tmp_path)) == str(tmp_path / "src" / "Dao.java")
+    assert sonar.resolve_component("proj:other\\src\\Dao.java", "/nowhere", ["/x/other/src/Dao.java"]) \
+        == "/x/other/src/Dao.java"
+    assert sonar.resolve_component("proj:src/Missing.java", str(tmp_path)) is None
+
+
+def test_issue_region_is_the_enclosing_method():
+    start, end = sonar.issue_region(SOURCE, issue(7))
+    region = SOURCE[start:end]
+    assert region.strip().startswith("public String find")
+    assert region.rstrip().endswith("}")
+    assert "log(" not in region
+
+
+def test_issue_region_falls_back_to_a_line_window_when_too_large():
+    start, end = sonar.issue_region(SOURCE, issue(7), window=1, max_tokens=5)
+    assert SOURCE[start:end].splitlines() == SOURCE.splitlines()[5:8]
+
+
+def test_overlapping_regions_are_merged():
+    regions = sonar.issue_regions(SOURCE, [issue(11, key="b"), issue(7, key="a"), issue(6, 7, key="c")])
+    assert len(regions) == 2
+    assert [i["key"] for i in regions[0][2]] == ["a", "c"]
+    assert regions[0][1] <= regions[1][0]
+
+
+def test_splice_replaces_regions_from_the_end():
+    regions = sonar.issue_regions(SOURCE, [issue(7), issue(11)])
+    fixed = sonar.splice(SOURCE, [(start, end, f"/* fixed {n} */") for n, (start, end, _) in enumerate(regions)])
+    assert "/* fixed 0 */" in fixed and "/* fixed 1 */" in fixed
+    assert fixed.startswith("package com.example;")
+    assert "private String table" in fixed
+    assert "System.out" not in fixed
+
+
+def test_issue_prompt_names_the_first_line():
+    prompt = sonar.issue_prompt([issue(7)], 6)
+    assert "starts at line 6" in prompt
+    assert "java:S2077 [MAJOR] lines 7-7: fix it" in prompt
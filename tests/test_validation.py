@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+import pytest
+
+import validation
+
+JAVA = """\
+public class A {
+    void run(String id) {
+        query("SELECT * FROM t WHERE id = " + id);
+    }
+}
+"""
+TEMPLATE = """\
+Parameters:
+  Env:
+    Type: String
+Resources:
+  Bucket:
+    Type: AWS::S3::Bucket
+    Properties:
+      BucketName: !Sub ${Env}-data
+Outputs:
+  Arn:
+    Value: !GetAtt Bucket.Arn
+"""
+
+
+def test_valid_java_passes():
+    assert validation.check_java(JAVA, JAVA) == []
+
+
+def test_placeholder_comments_are_reported():
+    fixed = JAVA.replace('        query("SELECT * FROM t WHERE id = " + id);\n',
+                         "        // ... rest of the method unchanged\n")
+    problems = validation.check_java(fixed, JAVA)
+    assert len(problems) == 1 and problems[0].startswith("line 3: placeholder comment")
+    # A placeholder the original already had is not the fix's fault
+    assert validation.check_java(fixed, fixed) == []
+
+
+def test_broken_java_is_reported():
+    assert validation.check_java(JAVA.rstrip().rstrip("}"), JAVA)
+    assert validation.check_java('class A { String s = "open; }', None)
+    assert "no class" in validation.check_java("void run() {}", JAVA)[-1]
+
+
+def test_javalang_reports_malformed_statements():
+    pytest.importorskip("javalang")
+    broken = JAVA.replace('query("SELECT * FROM t WHERE id = " + id);', "String q = ;")
+    problems = validation.check_java(broken, JAVA)
+    assert len(problems) == 1 and problems[0].startswith("line 3: syntax error")
+    # Brackets still balance, so the fallback alone would let it through
+    assert validation._java_structure(broken) == []
+    # Held only to what the original passes
+    assert validation.check_java(broken, broken) == []
+
+
+def test_structure_check_without_javalang(monkeypatch):
+    monkeypatch.setattr(validation, "javalang", None)
+    assert validation.check_java(JAVA, JAVA) == []
+    assert validation.check_java("class A { void f() { }", None) == ["line 1: '{' is never closed"]
+    assert validation.check_java("class A { /* } */ String s = \"}\"; }", None) == []
+
+
+def test_valid_template_passes():
+    assert validation.check_template(TEMPLATE, "yaml") == []
+    as_json = json.dumps({"Resources": {"Q": {"Type": "AWS::SQS::Queue"}}})
+    assert validation.check_template(as_json, "json") == []
+
+
+def test_template_problems_are_prefixed_with_their_resource():
+    fixed = TEMPLATE.replace("Type: AWS::S3::Bucket", "Type: S3Bucket\n    Encrypt: true") \
+                    .replace("!Sub ${Env}-data", "!Ref Missing")
+    problems = validation.check_template(fixed, "yaml", TEMPLATE)
+    assert sorted(problems) == [
+        "Resources.Bucket: Ref to undefined 'Missing'",
+        "Resources.Bucket: invalid resource Type 'S3Bucket'",
+        "Resources.Bucket: unknown resource attribute 'Encrypt'",
+    ]
+    assert validation.failed_resources(problems) == {"Bucket"}
+    assert validation.resource_problems(problems + ["Resources.Other: x"], "Bucket") == problems
+
+
+def test_template_level_problems():
+    assert validation.check_template("Resources: [", "yaml")[0].startswith("invalid YAML")
+    fixed = TEMPLATE.replace("!GetAtt Bucket.Arn", "!GetAtt Gone.Arn").replace("Outputs:", "Output:")
+    problems = validation.check_template(fixed, "yaml", TEMPLATE)
+    assert "unknown top-level section 'Output'" in problems
+    assert validation.failed_resources(problems) is None
+
+
+def test_problems_the_original_has_are_not_reported():
+    original = TEMPLATE + "  Dangling:\n    Value: !Ref Nowhere\n"
+    assert validation.check_template(original, "yaml", original) == []
+    assert validation.check_template(original, "yaml") == ["Outputs.Dangling: Ref to undefined 'Nowhere'"]
+
+
+def test_intrinsics_and_non_string_keys():
+    template = {"Mappings": {"Sizes": {2024: {"Size": 1}}}, "Resources": {"Q": {
+        "Type": "AWS::SQS::Queue", "Properties": {"QueueName": {"Fn::Concat": ["a", "b"]}, "Delay": {"Ref": ["x"]}}}}}
+    problems = validation.check_template(json.dumps(template), "json")
+    assert problems == ["Resources.Q.Properties.QueueName: unknown intrinsic function 'Fn::Concat'",
+                        "Resources.Q.Properties.Delay: Ref needs the name of a parameter or resource"]
+    assert validation._intrinsic_problems({2024: {True: {"Ref": "x"}}}, "Mappings") == []
+
+
+def test_retry_prompt_names_what_to_return():
+    prompt = validation.retry_prompt("Fix it.", ["line 3: boom"], "only the edits")
+    assert prompt.startswith("Fix it.\n\n")
+    assert "- line 3: boom" in prompt
+    assert prompt.endswith("Return only the edits without these problems.")
+
+
+def test_sessions_share_the_pool_until_the_last_one_ends(monkeypatch):
+    monkeypatch.setattr(validation, "WORKERS", 1)
+    with validation.session():
+        with validation.session():
+            assert asyncio.run(validation.arun(validation.check_java, JAVA)) == []
+            pool = validation._pool
+        # The outer run still has it
+        assert validation._pool is pool
+        assert asyncio.run(validation.arun(validation.check_java, JAVA)) == []
+    assert validation._pool is None
+
+
+def test_arun_runs_inline_without_workers(monkeypatch):
+    monkeypatch.setattr(validation, "WORKERS", 0)
+    assert asyncio.run(validation.arun(len, "abc")) == 3
+    assert validation._pool is None
+
+
+def test_validation_error_keeps_the_problems():
+    error = validation.ValidationError(["a", "b"])
+    assert error.problems == ["a", "b"]
+    with pytest.raises(validation.ValidationError, match="a; b"):
+        raise error
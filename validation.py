@@ -0,0 +1,290 @@
+import os
+import re
+import json
+import threading
+import contextlib
+
+# Checks on the fixed code the model returns, run in a process pool so parsing large
+# files does not stall the event loop that keeps the requests in flight. PyYAML, the
+# template helpers, asyncio and multiprocessing are imported on first use, so the Java stage
+# (and --help) does not load them.
+
+try:
+    import javalang
+except ImportError:
+    javalang = None
+
+WORKERS = int(os.getenv("VALIDATION_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Placeholders the model writes instead of code it left out ("// ... rest of the class unchanged")
+PLACEHOLDER_RE = re.compile(
+    r"(?://|/\*|#)[^\n]*?(?:\.\.\.|…)[^\n]*?\b(?:rest|remaining|remainder|existing|same as|unchanged)\b[^\n]*"
+    r"|(?://|/\*|#)[^\n]*?\b(?:rest|remainder) of (?:the )?(?:code|file|class|method|template|resources)\b[^\n]*",
+    re.IGNORECASE)
+TYPE_DECLARATION_RE = re.compile(r"\b(?:class|interface|enum|record)\s+[A-Za-z_$][\w$]*")
+BRACKETS = {")": "(", "]": "[", "}": "{"}
+
+TOP_LEVEL_KEYS = {
+    "AWSTemplateFormatVersion", "Description", "Metadata", "Parameters", "Rules", "Mappings",
+    "Conditions", "Transform", "Resources", "Outputs", "Hooks",
+}
+RESOURCE_KEYS = {
+    "Type", "Properties", "DependsOn", "Condition", "Metadata", "DeletionPolicy",
+    "UpdatePolicy", "UpdateReplacePolicy", "CreationPolicy", "Version",
+}
+RESOURCE_TYPE_RE = re.compile(r"^(?:(?:AWS|Alexa)::\w+::\w+(?:::\w+)?|Custom::[\w@.-]+|\w+::\w+::\w+::MODULE)$")
+INTRINSIC_FUNCTIONS = {
+    "Fn::Base64", "Fn::Cidr", "Fn::FindInMap", "Fn::GetAtt", "Fn::GetAZs", "Fn::ImportValue", "Fn::Join",
+    "Fn::Select", "Fn::Split", "Fn::Sub", "Fn::Transform", "Fn::Length", "Fn::ToJsonString",
+    "Fn::And", "Fn::Equals", "Fn::If", "Fn::Not", "Fn::Or",
+}
+
+
+class ValidationError(Exception):
+    """A generated fix that still failed validation after a retry with the diagnostics"""
+    def __init__(self, problems):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+def _placeholders(text, original):
+    """Placeholder comments in text that the original does not have"""
+    known = {match.group() for match in PLACEHOLDER_RE.finditer(original or "")}
+    return [f"line {text.count(chr(10), 0, match.start()) + 1}: placeholder comment instead of code "
+            f"({match.group().strip()[:80]})"
+            for match in PLACEHOLDER_RE.finditer(text) if match.group() not in known]
+
+
+def _java_structure(code):
+    """Structural check used when javalang is not installed: balanced brackets, closed literals"""
+    problems = []
+    stack = []
+    i = 0
+    n = len(code)
+    while i < n:
+        ch = code[i]
+        if code.startswith("//", i):
+            end = code.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        if code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            if end == -1:
+                problems.append(f"line {code.count(chr(10), 0, i) + 1}: unterminated comment")
+                break
+            i = end + 2
+            continue
+        if code.startswith('"""', i):
+            end = code.find('"""', i + 3)
+            if end == -1:
+                problems.append(f"line {code.count(chr(10), 0, i) + 1}: unterminated text block")
+                break
+            i = end + 3
+            continue
+        if ch in "\"'":
+            j = i + 1
+            while j < n and code[j] != ch and code[j] != "\n":
+                j += 2 if code[j] == "\\" else 1
+            if j >= n or code[j] != ch:
+                kind = "string" if ch == '"' else "character"
+                problems.append(f"line {code.count(chr(10), 0, i) + 1}: unterminated {kind} literal")
+            i = j + 1
+            continue
+        if ch in "([{":
+            stack.append(i)
+        elif ch in BRACKETS:
+            if not stack or code[stack[-1]] != BRACKETS[ch]:
+                problems.append(f"line {code.count(chr(10), 0, i) + 1}: unbalanced '{ch}'")
+                return problems
+            stack.pop()
+        i += 1
+    for start in stack[-3:]:
+        problems.append(f"line {code.count(chr(10), 0, start) + 1}: '{code[start]}' is never closed")
+    return problems
+
+
+def _java_syntax(code):
+    if javalang is None:
+        return _java_structure(code)
+    try:
+        javalang.parse.parse(code)
+    except javalang.parser.JavaSyntaxError as e:
+        position = getattr(e.at, "position", None)
+        where = f"line {position[0]}: " if position else ""
+        return [f"{where}syntax error: {e.description}"]
+    except (javalang.tokenizer.LexerError, IndexError, TypeError) as e:
+        return [f"syntax error: {e}"]
+    return []
+
+
+def check_java(code, original=None):
+    """Problems with a fixed Java file, as a list of messages (empty when it looks valid).
+
+    A fixed file is only held to what its original passes: syntax errors are
+    not reported when the original does not parse either, and placeholder
+    comments or missing type declarations only when they are new.
+    """
+    problems = []
+    if original is None or not _java_syntax(original):
+        problems.extend(_java_syntax(code))
+    if original is not None and TYPE_DECLARATION_RE.search(original) and not TYPE_DECLARATION_RE.search(code):
+        problems.append("the fixed file has no class, interface, enum or record declaration")
+    problems.extend(_placeholders(code, original))
+    return problems
+
+
+def _intrinsic_problems(node, path):
+    problems = []
+    if isinstance(node, dict):
+        for key, child in node.items():
+            # YAML mapping keys can be ints, booleans or dates (Mappings: {2024: ...})
+            if not isinstance(key, str):
+                problems.extend(_intrinsic_problems(child, f"{path}.{key}"))
+                continue
+            # Fn::ForEach keys carry the loop name (Fn::ForEach::Buckets)
+            if key.startswith("Fn::") and key not in INTRINSIC_FUNCTIONS and not key.startswith("Fn::ForEach::"):
+                problems.append(f"{path}: unknown intrinsic function '{key}'")
+            elif key == "Fn::GetAtt" and not (
+                    isinstance(child, str) and "." in child
+                    or isinstance(child, list) and len(child) == 2):
+                problems.append(f"{path}: Fn::GetAtt needs [LogicalId, Attribute] or 'LogicalId.Attribute'")
+            elif key == "Ref" and len(node) == 1 and not isinstance(child, str):
+                problems.append(f"{path}: Ref needs the name of a parameter or resource")
+            problems.extend(_intrinsic_problems(child, f"{path}.{key}"))
+    elif isinstance(node, list):
+        for index, child in enumerate(node):
+            problems.extend(_intrinsic_problems(child, f"{path}[{index}]"))
+    return problems
+
+
+def _template_problems(template):
+    import cft_fanout
+    if not isinstance(template, dict):
+        return ["the template is not a mapping"]
+    problems = [f"unknown top-level section '{key}'" for key in template if key not in TOP_LEVEL_KEYS]
+    resources = template.get("Resources")
+    if not isinstance(resources, dict) or not resources:
+        return problems + ["Resources must be a non-empty mapping"]
+    for logical_id, resource in resources.items():
+        if not isinstance(resource, dict):
+            problems.append(f"Resources.{logical_id}: resource is not a mapping")
+            continue
+        resource_type = resource.get("Type")
+        if not isinstance(resource_type, str) or not RESOURCE_TYPE_RE.match(resource_type):
+            problems.append(f"Resources.{logical_id}: invalid resource Type {resource_type!r}")
+        problems.extend(f"Resources.{logical_id}: unknown resource attribute '{key}'"
+                        for key in resource if key not in RESOURCE_KEYS)
+        if "Properties" in resource and not isinstance(resource["Properties"], dict):
+            problems.append(f"Resources.{logical_id}: Properties must be a mapping")
+    for section, required in (("Parameters", "Type"), ("Outputs", "Value")):
+        for name, entry in (template.get(section) or {}).items():
+            if not isinstance(entry, dict) or required not in entry:
+                problems.append(f"{section}.{name}: missing {required}")
+    for section in ("Resources", "Conditions", "Outputs"):
+        problems.extend(_intrinsic_problems(template.get(section) or {}, section))
+    problems.extend(f"Resources.{logical_id}: {message}" for logical_id, message in cft_fanout.check_integrity(template))
+    # check_integrity covers Resources; Outputs can dangle just the same
+    defined = set(resources) | set(template.get("Parameters") or {}) | cft_fanout.PSEUDO_PARAMETERS
+    for name, output in (template.get("Outputs") or {}).items():
+        refs = cft_fanout.collect_refs(output)
+        problems.extend(f"Outputs.{name}: Ref to undefined '{ref}'" for ref in sorted(refs["refs"] - defined))
+        problems.extend(f"Outputs.{name}: Fn::GetAtt on undefined resource '{ref}'"
+                        for ref in sorted(refs["getatts"] - set(resources)))
+    return problems
+
+
+def _parse_template(text, file_format):
+    if file_format == "json":
+        return json.loads(text)
+    import cfn_yaml
+    return cfn_yaml.load(text)
+
+
+def check_template(text, file_format, original=None):
+    """Problems with a fixed CloudFormation template (JSON or YAML text); empty when it looks valid.
+
+    Problems the original template already has are not reported.
+    """
+    try:
+        template = _parse_template(text, file_format)
+    except Exception as e:
+        return [f"invalid {file_format.upper()}: {e}"]
+    known = set()
+    if original is not None:
+        try:
+            known = set(_template_problems(_parse_template(original, file_format)))
+        except Exception:
+            pass
+    problems = [problem for problem in _template_problems(template) if problem not in known]
+    return problems + _placeholders(text, original)
+
+
+def failed_resources(problems):
+    """Logical ids of the resources template problems are about; None if any problem is not about a resource"""
+    ids = set()
+    for problem in problems:
+        where = problem.split(":", 1)[0]
+        if not where.startswith("Resources."):
+            return None
+        ids.add(where.split(".")[1])
+    return ids
+
+
+def resource_problems(problems, logical_id):
+    """The problems about one resource"""
+    return [problem for problem in problems
+            if problem.startswith((f"Resources.{logical_id}:", f"Resources.{logical_id}."))]
+
+
+def retry_prompt(prompt, problems, expected="the complete fixed file"):
+    """prompt with the diagnostics of a rejected fix appended, for the targeted retry.
+
+    expected names what the request returns ("only the fixed fragment", "only the edits"),
+    so the retry does not contradict the prompt it is added to.
+    """
+    diagnostics = "\n".join(f"- {problem}" for problem in problems)
+    return (f"{prompt}\n\nA previous fix was rejected by validation:\n{diagnostics}\n"
+            f"Return {expected} without these problems.")
+
+
+# The pool is shared by every run in the process (glitchslayers all runs both stages, fleet
+# workers fix one repository after another) and only shut down when the last run leaves it.
+_pool = None
+_sessions = 0
+_lock = threading.Lock()
+
+
+def pool():
+    """The shared validation process pool, started on first use"""
+    global _pool
+    from concurrent.futures import ProcessPoolExecutor
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS)
+        return _pool
+
+
+@contextlib.contextmanager
+def session():
+    """Hold the validation pool for a run; the last run to leave shuts it down"""
+    global _pool, _sessions
+    with _lock:
+        _sessions += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _sessions -= 1
+            finished = _pool if _sessions == 0 else None
+            if finished is not None:
+                _pool = None
+        if finished is not None:
+            finished.shutdown()
+
+
+async def arun(check, *args):
+    """Run a check in the validation pool without blocking the event loop; inline when VALIDATION_WORKERS=0"""
+    import asyncio
+    if WORKERS <= 0:
+        return check(*args)
+    return await asyncio.get_running_loop().run_in_executor(pool(), check, *args)